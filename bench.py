@@ -0,0 +1,826 @@
+#!/usr/bin/env python3
+
+"""
+bench.py: Time the exercise loader on synthetic exercise files.
+The suite command writes its results as JSON, and compare shows
+how one run differs from another.
+
+Usage:
+    bench.py suite [-s <sizes>] [-d <dir>] [-o <json>]
+    bench.py compare <old> <new> [-t <pct>]
+    bench.py cache [-n <count>] [-d <dir>]
+    bench.py parse [-n <count>] [-d <dir>]
+    bench.py memory [-n <count>] [-d <dir>]
+    bench.py parallel [-n <count>] [-f <files>] [-d <dir>]
+    bench.py screen [-n <count>] [-d <dir>]
+    bench.py server [-n <count>] [-c <clients>] [-a <answers>] [-d <dir>]
+    bench.py stream [-n <count>] [-d <dir>]
+    bench.py mkexercises [-n <count>] [-d <dir>]
+    bench.py pbn [-n <count>] [-d <dir>]
+    bench.py system [-n <count>] [-d <dir>]
+    bench.py weighted [-n <count>] [-d <dir>]
+    bench.py ddsolve [-n <count>] [-k <cards>]
+    bench.py   --version
+    bench.py   --help
+
+Options and commands:
+    --version          Show version and exit.
+    -h --help          Show this message and exit.
+    -n <count>         Number of exercises to generate [default: 10000].
+    -d <dir>           Directory for generated files [default: bench_data].
+    -f <files>         Number of files to spread the exercises over
+                       [default: 400].
+    -s <sizes>         Corpus sizes for the suite, separated by commas
+                       [default: 100,1000,10000,100000].
+    -o <json>          Write suite results here [default: bench.json].
+    -t <pct>           Report a timing as a regression if it is this
+                       many percent slower [default: 10].
+    -c <clients>       Number of students at once [default: 1000].
+    -a <answers>       Calls each student makes [default: 20].
+    -k <cards>         Cards in each hand of a ddsolve ending [default: 3].
+    suite              Time each stage on corpora of each size.
+    compare            Compare two suite results.
+    cache              Compare parsing with loading from the cache.
+    parse              Compare the line-at-a-time parser with the one-pass parser.
+    memory             Show the memory used per parsed exercise.
+    parallel           Time parsing with 1, 2, 4... processes, up to the
+                       number of cores.
+    screen             Count the bytes quiz.py sends to the terminal per
+                       exercise, drawing the way it used to and the way it does now.
+    server             Start server.py on a Unix socket, with many students
+                       answering at once, and show the time each answer takes.
+    stream             Time to the first exercise, loading everything first
+                       and with quiz.py --stream.
+    mkexercises        Time merging a file of hands into the template, into
+                       1, 2, 4... files up to the number of cores.
+    pbn                Time importing deals from PBN, gzipped PBN and LIN,
+                       against just reading the file, and exporting them.
+    system             Time checking the answers against system.txt, one step
+                       at a time and all at once, on exercises and on a corpus.
+    weighted           Time quiz.py -w choosing and reviewing exercises, against
+                       shuffling them all again after each answer.
+    ddsolve            Solve count random endings with ddsolve.py, and again
+                       by trying every card, and show any that differ.
+"""
+
+
+import asyncio
+import contextlib
+import curses
+import fcntl
+import gc
+import gzip
+import json
+import os
+import platform
+import pty
+import random
+import struct
+import subprocess
+import sys
+import termios
+import time
+import tracemalloc
+from typing import Any, Callable, Optional, TextIO
+import docopt  # type: ignore
+import numpy as np
+import bids
+import cache
+import corpus
+import ddsolve
+import exercise
+import history
+import keyindex
+import loader
+import mkexercises
+import pbn
+import question
+import quiz
+import sampler
+import spotfill
+import system
+import validate
+
+
+VERSION = '0.01'
+
+SEATS = 'NESW'
+STRAINS = ('C', 'D', 'H', 'S', 'NT')
+RANKS = 'AKQJT98765432'
+VULNS = ('none', 'n-s', 'e-w', 'both')
+KEYS = ('stayman', 'transfer', 'notrump', 'major', 'minor', 'overcall',
+        'double', 'slam', 'preempt', 'opening')
+
+
+def main() -> None:
+    args = docopt.docopt(__doc__, version=VERSION)
+    if args['compare']:
+        compare(args['<old>'], args['<new>'], float(args['-t']))
+        return
+    count = int(args['-n'])
+    os.makedirs(args['-d'], exist_ok=True)
+    if args['suite']:
+        sizes = [int(n) for n in args['-s'].split(',')]
+        results = run_suite(args['-d'], sizes)
+        with open(args['-o'], 'wt') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results written to {args["-o"]}')
+    elif args['cache']:
+        bench_cache(args['-d'], count)
+    elif args['parse']:
+        bench_parse(args['-d'], count)
+    elif args['memory']:
+        bench_memory(args['-d'], count)
+    elif args['parallel']:
+        bench_parallel(args['-d'], count, int(args['-f']))
+    elif args['screen']:
+        bench_screen(args['-d'], min(count, 1000))
+    elif args['server']:
+        bench_server(args['-d'], count, int(args['-c']), int(args['-a']))
+    elif args['stream']:
+        bench_stream(args['-d'], count)
+    elif args['mkexercises']:
+        bench_mkexercises(args['-d'], count)
+    elif args['pbn']:
+        bench_pbn(args['-d'], count)
+    elif args['system']:
+        bench_system(args['-d'], count)
+    elif args['weighted']:
+        bench_weighted(args['-d'], count)
+    elif args['ddsolve']:
+        bench_ddsolve(count, int(args['-k']))
+
+
+def run_suite(dirname: str, sizes: list[int]) -> dict[str, Any]:
+    results: dict[str, Any] = {
+        'version': VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'when': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'sizes': {},
+    }
+    for count in sizes:
+        print(f'--- {count} exercises')
+        timings = bench_sizes(dirname, count)
+        for name, secs in timings.items():
+            print(f'{name:20} {secs:8.3f} s  {count / max(secs, 1e-9):10.0f} /s')
+        results['sizes'][str(count)] = timings
+    return results
+
+
+def bench_sizes(dirname: str, count: int) -> dict[str, float]:
+    "Return the seconds each stage takes on count exercises."
+    rng = random.Random(count)
+    exr = os.path.join(dirname, f'synth{count}.exr')
+    qst = os.path.join(dirname, f'synth{count}.qst')
+    write_exr_file(exr, count, rng)
+    write_question_file(qst, count, rng)
+    check_valid(exr)
+    check_valid(qst)
+    t: dict[str, float] = {}
+    t['parse_exr'] = timeit(lambda: exercise.read_file(exr))
+    cache.load_exercises(exr, rebuild=True)
+    t['read_exercises'] = timeit(lambda: loader.read_exercises([exr]))
+    t['parse_questions'] = timeit(lambda: read_question_file(qst))
+
+    auctions = [''.join(compact(c) for c in random_auction(rng.randrange(4), rng))
+                for _ in range(count)]
+    t['decode_auction'] = timeit(lambda: bids.parse_compact_many(auctions))
+    ex_list = exercise.read_file(exr)
+    cards, spots = spotfill.hand_arrays(ex_list)
+    t['fill_spots'] = timeit(lambda: spotfill.fill(cards, spots, np.random.default_rng(count)))
+    t['key_index'] = timeit(lambda: keyindex.build_index(ex_list).select(['stayman', '!transfer']))
+    t['key_scan'] = timeit(lambda: [ex for ex in ex_list
+                                    if 'stayman' in ex.keys and 'transfer' not in ex.keys])
+    t['render'] = timeit(lambda: render_all(ex_list))
+    return t
+
+
+def read_question_file(fname: str) -> list[question.Question]:
+    with open(fname) as f:
+        return question.read_questions(f)
+
+
+class NullScreen:
+    "Enough of a curses window to render into without a terminal."
+    written: int
+
+    def __init__(self):
+        self.written = 0
+
+    def addstr(self, row: int, col: int, s: str) -> None:
+        self.written += len(s)
+
+    def move(self, row: int, col: int) -> None:
+        pass
+
+    def clrtoeol(self) -> None:
+        pass
+
+
+def render_all(ex_list: list[exercise.Exercise]) -> int:
+    "Draw every exercise and every step of its auction, as show_exercise would."
+    scr = NullScreen()
+    for ex in ex_list:
+        quiz.show_screen_top(ex, scr, quiz.ROW_TOP)  # type: ignore
+        quiz.show_hand(ex.hand, scr, quiz.ROW_HAND)  # type: ignore
+        quiz.show_bid_box(scr, quiz.ROW_BID_BOX, quiz.COL_BID_BOX)  # type: ignore
+        for step in ex.steps:
+            quiz.show_auction(scr, quiz.ROW_AUCTION, step.lines)  # type: ignore
+            scr.addstr(quiz.ROW_RESULT, 0, step.answer.bid)
+            quiz.show_explanation(scr, quiz.ROW_EXPL, step.answer.expl)  # type: ignore
+    return scr.written
+
+
+def compare(old_name: str, new_name: str, threshold: float) -> None:
+    "Print the change in each timing. Slower by more than threshold % is a regression."
+    with open(old_name) as f:
+        old = json.load(f)
+    with open(new_name) as f:
+        new = json.load(f)
+    regressions = 0
+    for size, timings in new['sizes'].items():
+        if size not in old['sizes']:
+            continue
+        print(f'--- {size} exercises')
+        for name, secs in timings.items():
+            before = old['sizes'][size].get(name)
+            if not before:
+                continue
+            change = 100 * (secs - before) / before
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f'{name:20} {before:8.3f} -> {secs:8.3f} s  {change:+6.1f}%{flag}')
+    print(f'{regressions} regressions')
+
+
+def bench_cache(dirname: str, count: int) -> None:
+    fname = os.path.join(dirname, f'synth{count}.exr')
+    write_exr_file(fname, count, random.Random(count))
+    parse = timeit(lambda: exercise.read_file(fname))
+    cold = timeit(lambda: cache.load_exercises(fname, rebuild=True))
+    warm = timeit(lambda: cache.load_exercises(fname))
+    print(f'{count} exercises')
+    print(f'parse:             {parse:8.3f} s')
+    print(f'parse + write:     {cold:8.3f} s')
+    print(f'load from cache:   {warm:8.3f} s  ({parse / warm:.1f}x)')
+
+
+def bench_parse(dirname: str, count: int) -> None:
+    fname = os.path.join(dirname, f'synth{count}.exr')
+    write_exr_file(fname, count, random.Random(count))
+    old = timeit(lambda: read_file_by_line(fname))
+    new = timeit(lambda: exercise.read_file(fname))
+    print(f'{count} exercises')
+    print(f'Exercise(f):       {old:8.3f} s  {count / old:10.0f} exercises/s')
+    print(f'parse_exercises:   {new:8.3f} s  {count / new:10.0f} exercises/s'
+          f'  ({old / new:.1f}x)')
+
+
+def read_file_by_line(fname: str) -> list[exercise.Exercise]:
+    ex_list: list[exercise.Exercise] = []
+    with open(fname) as f:
+        while True:
+            ex = exercise.Exercise(f)
+            if not ex.valid:
+                break
+            ex_list.append(ex)
+    return ex_list
+
+
+def bench_memory(dirname: str, count: int) -> None:
+    fname = os.path.join(dirname, f'synth{count}.exr')
+    write_exr_file(fname, count, random.Random(count))
+    with open(fname) as f:
+        text = f.read()
+    gc.collect()
+    tracemalloc.start()
+    ex_list = list(exercise.parse_exercises(text))
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{len(ex_list)} exercises: {used / len(ex_list):.0f} bytes each')
+
+
+def bench_parallel(dirname: str, count: int, nfiles: int) -> None:
+    rng = random.Random(nfiles)
+    files: list[str] = []
+    for i in range(nfiles):
+        fname = os.path.join(dirname, f'part{i:04}.exr')
+        write_exr_file(fname, count // nfiles, rng)
+        files.append(fname)
+    cores = os.cpu_count() or 1
+    jobs = 1
+    base = 0.0
+    print(f'{count} exercises in {nfiles} files, {cores} cores')
+    while True:
+        secs = timeit(lambda: loader.read_exercises(files, rebuild=True, jobs=jobs))
+        if jobs == 1:
+            base = secs
+        print(f'-j {jobs:3}: {secs:8.3f} s  {count / secs:10.0f} exercises/s'
+              f'  ({base / secs:.1f}x)')
+        if jobs >= cores:
+            break
+        jobs = min(2 * jobs, cores)
+
+
+def bench_screen(dirname: str, count: int) -> None:
+    fname = os.path.join(dirname, f'screen{count}.exr')
+    write_exr_file(fname, count, random.Random(count))
+    ex_list = exercise.read_file(fname)
+    steps = sum(len(ex.answers) for ex in ex_list)
+    print(f'{count} exercises, {steps} answers, 80x40 xterm')
+    for name, draw in (('before', draw_before), ('after', draw_after)):
+        # Leave out what curses sends to start and stop.
+        n = terminal_bytes(draw, ex_list) - terminal_bytes(draw, [])
+        print(f'{name:8} {n:10} bytes  {n / count:8.0f} per exercise  {n / steps:8.0f} per answer')
+
+
+def terminal_bytes(draw: Callable[[Any, list[exercise.Exercise]], None],
+                   ex_list: list[exercise.Exercise]) -> int:
+    "Run draw in curses on a pseudo-terminal. Return the bytes it writes."
+    pid, fd = pty.fork()
+    if pid == 0:
+        try:
+            fcntl.ioctl(0, termios.TIOCSWINSZ, struct.pack('HHHH', 40, 80, 0, 0))
+            os.environ['TERM'] = 'xterm'
+            curses.wrapper(draw, ex_list)
+        finally:
+            os._exit(0)
+    n = 0
+    while True:
+        try:
+            data = os.read(fd, 1 << 16)
+        except OSError:  # EIO when the child is gone
+            break
+        if not data:
+            break
+        n += len(data)
+    os.waitpid(pid, 0)
+    os.close(fd)
+    return n
+
+
+def answer_for(step: int, answer: exercise.Answer) -> int:
+    "Answer every other step wrongly, so explanations get drawn too."
+    return answer.code if step % 2 == 0 else bids.PASS if answer.code != bids.PASS else bids.DBL
+
+
+def draw_before(scr: Any, ex_list: list[exercise.Exercise]) -> None:
+    "What show_exercise used to send: everything, for every exercise."
+    curses.mousemask(1)
+    for n, ex in enumerate(ex_list):
+        curses.init_pair(1, quiz.FG_COLOR, quiz.BG_COLOR1 if n % 2 == 0 else quiz.BG_COLOR2)
+        scr.bkgd(' ', curses.color_pair(1) | curses.A_BOLD)
+        scr.clear()
+        quiz.show_screen_top(ex, scr, quiz.ROW_TOP)
+        quiz.show_hand(ex.hand, scr, quiz.ROW_HAND)
+        quiz.show_bid_box(scr, quiz.ROW_BID_BOX, quiz.COL_BID_BOX)
+        scr.addstr(quiz.ROW_DIVIDER, 0, '------------------------------')
+        scr.addstr(29, 0, "Click to bid, ' ' to continue, 'q' to quit")
+        scr.refresh()
+        for i, (_, lines, answer) in enumerate(ex.steps):
+            quiz.show_auction(scr, quiz.ROW_AUCTION, lines)
+            scr.refresh()  # getch() did this, waiting for the bid
+            bid = answer_for(i, answer)
+            scr.addstr(quiz.ROW_RESULT, 0, f'{bids.NAMES[bid]:5}')
+            if bid == answer.code:
+                scr.addstr(quiz.ROW_RESULT, 6, 'Yes  ')
+            else:
+                scr.addstr(quiz.ROW_RESULT, 6, 'WRONG')
+                for j in range(4):
+                    scr.addstr(quiz.ROW_EXPL + j, 0, 80 * ' ')
+                for j, line in enumerate(answer.expl):
+                    scr.addstr(quiz.ROW_EXPL + j, 0, line)
+            scr.addstr(quiz.ROW_RESULT, 15, 'Total: 1  Correct: 1  Score: 100 ')
+            scr.refresh()  # and again, waiting to go on
+
+
+def draw_after(scr: Any, ex_list: list[exercise.Exercise]) -> None:
+    "What show_exercise sends now."
+    win = quiz.Window(scr)
+    win.make_windows()
+    for ex in ex_list:
+        quiz.draw_exercise(ex, win, ex.hand)
+        for i, (_, lines, answer) in enumerate(ex.steps):
+            quiz.show_auction(win.auction, 0, lines)
+            win.update()
+            quiz.g.score.check(answer_for(i, answer), answer.code)
+            quiz.draw_result(win, answer_for(i, answer), answer)
+            win.update()
+
+
+def bench_mkexercises(dirname: str, count: int) -> None:
+    fname = os.path.join(dirname, f'hands{count}.txt')
+    rng = random.Random(count)
+    with open(fname, 'w') as f:
+        for _ in range(count):
+            suits = '\n'.join(random_hand(rng))
+            f.write(f'\nHand: # {rng.choice(KEYS)}\n\n{suits}\n\n\n')
+    template = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'template.txt')
+    parts = mkexercises.compile_template(mkexercises.read_template(template), {})
+    base, _ = os.path.splitext(fname)
+    cores = os.cpu_count() or 1
+    print(f'{count} hands, {os.path.getsize(fname) >> 20} MB, {cores} cores')
+    files = 1
+    while True:
+        if files == 1:
+            secs = timeit(lambda: mkexercises.write_exercises(
+                fname, 0, os.path.getsize(fname), base + '.exr', parts))
+        else:
+            secs = timeit(lambda: mkexercises.write_shards(fname, base, files, parts))
+        print(f'-n {files:3}: {secs:8.3f} s  {count / secs:10.0f} hands/s')
+        if files >= cores:
+            break
+        files = min(2 * files, cores)
+
+
+def bench_pbn(dirname: str, count: int) -> None:
+    base = os.path.join(dirname, f'deals{count}')
+    rng = random.Random(count)
+    deals = [random_deal(rng) for _ in range(count)]
+    with open(base + '.pbn', 'wt') as f:
+        f.writelines(write_pbn(n, deal) for n, deal in enumerate(deals, 1))
+    with open(base + '.lin', 'wt') as f:
+        f.writelines(write_lin(n, deal) for n, deal in enumerate(deals, 1))
+    with open(base + '.pbn', 'rb') as f, gzip.open(base + '.pbn.gz', 'wb') as z:
+        z.write(f.read())
+    for fname in (base + '.pbn', base + '.pbn.gz', base + '.lin'):
+        def read() -> None:
+            with pbn.open_deals(fname) as f:
+                for _ in f:
+                    pass
+        size = os.path.getsize(fname) / (1 << 20)
+        secs = timeit(read)
+        print(f'{os.path.basename(fname):18} {"read":6} {secs:7.3f} s  {size / secs:7.1f} MB/s')
+        with open(os.devnull, 'w') as null:
+            secs = timeit(lambda: pbn.import_files([fname], null, pbn.SOUTH, (), False))
+        print(f'{os.path.basename(fname):18} {"import":6} {secs:7.3f} s  {size / secs:7.1f} MB/s'
+              f'  {count / secs:8.0f} deals/s')
+    with open(base + '.exr', 'w') as f:
+        pbn.import_files([base + '.pbn'], f, pbn.SOUTH, (), False)
+    with open(base + '.qst', 'w') as f:
+        pbn.import_files([base + '.pbn'], f, pbn.SOUTH, (), True)
+    check_valid(base + '.exr')
+    check_valid(base + '.qst')
+    with open(os.devnull, 'w') as null:
+        secs = timeit(lambda: pbn.export_files([base + '.exr'], null))
+    print(f'{os.path.basename(base) + ".exr":18} {"export":6} {secs:7.3f} s'
+          f'  {count / secs:8.0f} exercises/s')
+
+
+def bench_system(dirname: str, count: int) -> None:
+    base = os.path.join(dirname, f'synth{count}')
+    write_exr_file(base + '.exr', count, random.Random(count))
+    ex_list = exercise.read_file(base + '.exr')
+    corpus.write_corpus(base + '.exb', ex_list)
+    rules = system.read_system('system.txt')
+    steps = sum(len(ex.answers) for ex in ex_list)
+    print(f'{count} exercises, {steps} answers')
+
+    def each_step() -> None:
+        for ex in ex_list:
+            for step in ex.steps:
+                rules.allowed(step.before, ex.hand)
+    exb = corpus.Corpus([base + '.exb'])
+    for name, run in (('each step', each_step),
+                      ('check', lambda: list(system.check(rules, ex_list))),
+                      ('check corpus', lambda: list(system.check(rules, exb)))):
+        secs = timeit(run)
+        print(f'{name:14} {secs:8.3f} s  {steps / secs:10.0f} answers/s')
+
+
+def bench_weighted(dirname: str, count: int) -> None:
+    "Exercises are only ids here, with a log of answers to a tenth of them."
+    rng = random.Random(count)
+    ids = [rng.getrandbits(64).to_bytes(8, 'little') for _ in range(count)]
+    log = history.AnswerLog(os.path.join(dirname, f'answers{count}.log'))
+    with open(log.fname, 'wb') as f:
+        for ex_id in rng.sample(ids, count // 10):
+            f.write(history.LOG_RECORD.pack(ex_id, 0, 2, rng.randrange(4)))
+    keys = {key: np.array(sorted(rng.sample(range(count), count // 10)), np.intp)
+            for key in KEYS}
+    chooser = sampler.WeightedScheduler(ids, keys, lambda n: KEYS[:2], log, rng)
+    secs = timeit(lambda: sampler.WeightedScheduler(ids, keys, lambda n: KEYS[:2], log, rng))
+    print(f'{count} exercises')
+    print(f'start:             {secs:8.3f} s')
+    draws = 100000
+    secs = timeit(lambda: [next(chooser) for _ in range(draws)])
+    print(f'choose:            {1e6 * secs / draws:8.2f} us')
+    answers = 1000
+    secs = timeit(lambda: [chooser.review(next(chooser), 2, rng.randrange(4))
+                           for _ in range(answers)])
+    print(f'choose and review: {1e6 * secs / answers:8.2f} us')
+    secs = timeit(lambda: list(corpus.lazy_shuffle(count, rng)))
+    print(f'shuffle all:       {1e6 * secs:8.0f} us')
+
+
+def bench_ddsolve(count: int, size: int) -> None:
+    """Each deal of size cards a hand is solved for every strain and
+    leader as solve() does it, with one Solver per strain, so the table
+    carries over between leaders."""
+    rng = random.Random(count)
+    deals = []
+    for _ in range(count):
+        cards = rng.sample(range(52), 4 * size)
+        deals.append(tuple(sum(1 << c for c in cards[seat::4]) for seat in range(4)))
+    solved = []
+    start = time.perf_counter()
+    for hands in deals:
+        for trump in ddsolve.STRAIN_SUITS:
+            solver = ddsolve.Solver(trump)
+            guess = None
+            for leader in (1, 3, 0, 2):
+                tricks = solver.tricks(hands, leader, guess)  # type: ignore
+                solved.append(tricks)
+                guess = tricks if leader != 3 else size - tricks
+    solver_secs = time.perf_counter() - start
+    start = time.perf_counter()
+    wrong = 0
+    results = iter(solved)
+    for hands in deals:
+        for trump in ddsolve.STRAIN_SUITS:
+            memo: dict[tuple[tuple[int, int, int, int], int], int] = {}
+            for leader in (1, 3, 0, 2):
+                tricks = next(results)
+                right = minimax(hands, leader, trump, memo)  # type: ignore
+                if tricks != right:
+                    wrong += 1
+                    print(f'{hands} trump {trump} leader {SEATS[leader]}: '
+                          f'{tricks} tricks, should be {right}')
+    minimax_secs = time.perf_counter() - start
+    print(f'{len(solved)} positions, {wrong} wrong')
+    print(f'solver:  {solver_secs:8.3f} s')
+    print(f'minimax: {minimax_secs:8.3f} s')
+
+
+def minimax(hands: tuple[int, int, int, int], leader: int, trump: Optional[int],
+            memo: dict[tuple[tuple[int, int, int, int], int], int]) -> int:
+    """The tricks leader's side takes with best play, found by trying
+    every card: no move ordering, cutoffs or sequences, as ddsolve has.
+    memo holds the positions already solved at the start of a trick."""
+    if hands[leader] == 0:
+        return 0
+    key = (hands, leader)
+    if key not in memo:
+        memo[key] = minimax_play(hands, leader, trump, memo, leader, -1, -1, -1)
+    return memo[key]
+
+
+def minimax_play(hands: tuple[int, int, int, int], leader: int, trump: Optional[int],
+                 memo: dict[tuple[tuple[int, int, int, int], int], int],
+                 seat: int, led: int, best: int, winner: int) -> int:
+    "Try every card seat may play, with the trick so far as in ddsolve.Solver.play."
+    hand = hands[seat]
+    cards = [c for c in range(52) if hand >> c & 1]
+    cards = [c for c in cards if c // 13 == led] or cards
+    results = []
+    for card in cards:
+        new_hands = hands[:seat] + (hand & ~(1 << card),) + hands[seat + 1:]
+        if led < 0 or (card // 13 == best // 13 and card > best) or \
+                (card // 13 == trump and best // 13 != trump):
+            new_best, new_winner = card, seat
+        else:
+            new_best, new_winner = best, winner
+        nxt = (seat + 1) % 4
+        if nxt == leader:
+            later = minimax(new_hands, new_winner, trump, memo)
+            if (new_winner - leader) % 2 == 0:
+                results.append(1 + later)
+            else:
+                results.append(bin(new_hands[0]).count('1') - later)
+        else:
+            results.append(minimax_play(new_hands, leader, trump, memo, nxt,
+                                        card // 13 if led < 0 else led, new_best, new_winner))
+    return max(results) if (seat - leader) % 2 == 0 else min(results)
+
+
+def random_deal(rng: random.Random) -> tuple[int, str, list[list[str]], list[str]]:
+    "A dealer, vulnerability, four hands' suits from North, and a finished auction."
+    dealer = rng.randrange(4)
+    cards = list(range(52))
+    rng.shuffle(cards)
+    hands = [[''.join(RANKS[r] for r in sorted(c % 13 for c in cards[13 * h:13 * h + 13]
+                                               if c // 13 == s))
+              for s in range(4)] for h in range(4)]
+    calls = random_auction(dealer, rng) + ['p', 'p', 'p']
+    return dealer, rng.choice(VULNS), hands, calls
+
+
+def write_pbn(n: int, deal: tuple[int, str, list[list[str]], list[str]]) -> str:
+    dealer, vul, hands, calls = deal
+    names = [pbn.PBN_CALLS[bids.CODES[c.upper()]] for c in calls]
+    names[0] += ' =1='
+    auction = '\n'.join(' '.join(names[i:i + 4]) for i in range(0, len(names), 4))
+    return (f'[Event "Bench"]\n[Board "{n}"]\n[Dealer "{SEATS[dealer]}"]\n'
+            f'[Vulnerable "{pbn.PBN_VULNERABLE_NAMES[vul.upper()]}"]\n'
+            f'[Deal "N:{" ".join(".".join(h) for h in hands)}"]\n'
+            f'[Auction "{SEATS[dealer]}"]\n{auction}\n[Note "1:The first call."]\n\n')
+
+
+def write_lin(n: int, deal: tuple[int, str, list[list[str]], list[str]]) -> str:
+    dealer, vul, hands, calls = deal
+    md = ','.join('S{}H{}D{}C{}'.format(*hands[seat]) for seat in (2, 3, 0, 1))
+    mb = f'mb|{calls[0]}|an|The first call.|' + ''.join(f'mb|{c}|' for c in calls[1:])
+    return (f'pn|S,W,N,E|st||md|{pbn.LIN_SEATS.index(dealer) + 1}{md}|rh||ah|Board {n}|'
+            f'sv|{"oneb"[VULNS.index(vul)]}|{mb}pg||\n')
+
+
+def bench_stream(dirname: str, count: int) -> None:
+    exr = os.path.join(dirname, f'stream{count}.exr')
+    exb = os.path.join(dirname, f'stream{count}.exb')
+    write_exr_file(exr, count, random.Random(count))
+    corpus.write_corpus(exb, exercise.read_file(exr))
+    for fname in (exr, exb):
+        start = time.perf_counter()
+        exercises = loader.read_exercises([fname], rebuild=True)
+        next(corpus.lazy_shuffle(len(exercises)))
+        first = time.perf_counter() - start
+        print(f'{os.path.basename(fname):16} {"load all":8} first {1000 * first:8.1f} ms')
+        start = time.perf_counter()
+        stream = loader.Prefetcher([fname], []).shuffled()
+        next(stream)
+        first = time.perf_counter() - start
+        n = sum(1 for _ in stream) + 1
+        print(f'{os.path.basename(fname):16} {"stream":8} first {1000 * first:8.1f} ms'
+              f'  all {n} in {time.perf_counter() - start:6.2f} s')
+
+
+def bench_server(dirname: str, count: int, clients: int, answers: int) -> None:
+    fname = os.path.join(dirname, f'server{count}.exb')
+    if not os.path.exists(fname):
+        exr = os.path.join(dirname, f'server{count}.exr')
+        write_exr_file(exr, count, random.Random(count))
+        corpus.write_corpus(fname, exercise.read_file(exr))
+    path = os.path.join(dirname, 'server.sock')
+    if os.path.exists(path):
+        os.remove(path)
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+    proc = subprocess.Popen([sys.executable, server, '-u', path, fname],
+                            stderr=subprocess.DEVNULL)
+    try:
+        while not os.path.exists(path):
+            assert proc.poll() is None, 'server.py failed to start'
+            time.sleep(0.05)
+        start = time.perf_counter()
+        times = asyncio.run(load_server(path, clients, answers))
+        secs = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+    times.sort()
+    print(f'{count} exercises, {clients} students, {len(times)} answers in {secs:.2f} s, '
+          f'{len(times) / secs:.0f} answers/s')
+    for pct in (50, 90, 99, 99.9, 100):
+        ms = 1000 * times[min(len(times) - 1, int(pct / 100 * len(times)))]
+        print(f'p{pct:<5} {ms:8.1f} ms')
+
+
+async def load_server(path: str, clients: int, answers: int) -> list[float]:
+    "Connect the students at once. Return the seconds each answer took."
+    times: list[float] = []
+    await asyncio.gather(*[student(path, answers, times) for _ in range(clients)])
+    return times
+
+
+async def student(path: str, answers: int, times: list[float]) -> None:
+    "Pass at every prompt, timing how long the next prompt takes."
+    reader, writer = await asyncio.open_unix_connection(path)
+    await reader.readuntil(b'> ')
+    for _ in range(answers):
+        start = time.perf_counter()
+        writer.write(b'p\r\n')
+        await reader.readuntil(b'> ')
+        times.append(time.perf_counter() - start)
+    writer.write(b'quit\r\n')
+    writer.close()
+
+
+def check_valid(fname: str) -> None:
+    "Stop if validate.py finds errors in fname, so only good input is timed."
+    count, messages = validate.check_file(fname)
+    if messages:
+        print('\n'.join(messages[:10]), file=sys.stderr)
+        sys.exit(f'{fname}: {len(messages)} errors in {count} exercises')
+
+
+def timeit(fn: Callable[[], object]) -> float:
+    "Return the seconds fn takes. The parsers' chatter is discarded."
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+
+# ----- synthetic exercises -----
+
+def write_exr_file(fname: str, count: int, rng: random.Random) -> None:
+    with open(fname, 'wt') as f:
+        for _ in range(count):
+            write_exr(f, rng)
+
+
+def write_exr(f: TextIO, rng: random.Random) -> None:
+    "Write one random, legal exercise. South is the student."
+    dealer = rng.randrange(4)
+    calls = random_auction(dealer, rng)
+    # Mark up to two of South's calls as questions.
+    south = [i for i in range(len(calls)) if (dealer + i) % 4 == 2]
+    marked = sorted(rng.sample(south, min(len(south), rng.randint(1, 2))))
+    f.write('-----\n')
+    f.write('Keys: ' + ' '.join(rng.sample(KEYS, rng.randint(1, 3))) + '\n')
+    f.write(f'Dealer: {SEATS[dealer]}\n')
+    f.write(f'Vulnerable: {rng.choice(VULNS)}\n')
+    f.write('Info:\n Synthetic exercise.\n\n')
+    f.write('Hand:  # synthetic\n')
+    for suit in random_hand(rng):
+        f.write(suit + '\n')
+    f.write('\nAuction:\n N    E    S    W\n---- ---- ---- ----\n')
+    cells = ['-'] * dealer
+    for i, call in enumerate(calls):
+        cells.append('*' + call if i in marked else call)
+    for i in range(0, len(cells), 4):
+        f.write(' '.join(f'{c:4}' for c in cells[i:i + 4]).rstrip() + '\n')
+    f.write('\nAnswers:\n')
+    for n, i in enumerate(marked):
+        f.write(f'{n + 1} {calls[i]}\n Because.\n\n')
+    f.write('=====\n\n')
+
+
+def write_question_file(fname: str, count: int, rng: random.Random) -> None:
+    with open(fname, 'wt') as f:
+        for _ in range(count):
+            write_question(f, rng)
+        f.write('End\n')
+
+
+def write_question(f: TextIO, rng: random.Random) -> None:
+    "Write one random question in the Question/Step format of question.py."
+    dealer = rng.randrange(4)
+    calls = random_auction(dealer, rng)
+    f.write('Question\n')
+    f.write(f'Keywords {rng.choice(KEYS)}\n')
+    f.write(f'Vulnerable {rng.choice(VULNS)}\n')
+    f.write(f'Dealer {SEATS[dealer].lower()}\n')
+    f.write('Hand\n')
+    for suit in random_hand(rng):
+        f.write(f' {suit}\n')
+    f.write('Endh\n\n')
+    # A step's auction runs from the answer to the step before.
+    start = 0
+    for i, call in enumerate(calls):
+        if (dealer + i) % 4 != 2:
+            continue
+        before = ''.join(compact(c) for c in calls[start:i])
+        start = i
+        f.write(f'Step\nAuction {before}\nAnswer {call}\n')
+        f.write('Explanation\n Because.\nEnds\n\n')
+    f.write('Endq\n\n')
+
+
+def compact(call: str) -> str:
+    "Return a call as it is written in a question.py auction: p, x, r, 1n, 2s..."
+    if call.endswith('nt'):
+        return call[0] + 'n'
+    return call
+
+
+def random_hand(rng: random.Random) -> list[str]:
+    "Return four suit strings, with some low cards written as 'x'."
+    cards = rng.sample(range(52), 13)
+    suits: list[str] = []
+    for s in range(4):
+        ranks = sorted(c % 13 for c in cards if c // 13 == s)
+        if not ranks:
+            suits.append('-')
+            continue
+        names = [RANKS[r] for r in ranks]
+        names = ['10' if r == 'T' else r for r in names]
+        low = rng.randint(0, sum(1 for n in names if n in '2345'))
+        names[len(names) - low:] = ['x'] * low
+        suits.append(' '.join(names))
+    return suits
+
+
+def random_auction(dealer: int, rng: random.Random) -> list[str]:
+    "Return a legal, unfinished auction in which South makes a call."
+    calls: list[str] = []
+    last = -1  # highest bid so far, as level * 5 + strain
+    while True:
+        seat = (dealer + len(calls)) % 4
+        passes = 2 if last >= 0 else 3
+        must_bid = calls[-passes:] == ['p'] * passes
+        # At most 16 calls, rising two steps at a time, stay below 7NT.
+        if must_bid or rng.random() < 0.5:
+            last = rng.randint(last + 1, last + 2)
+            calls.append(f'{last // 5 + 1}{STRAINS[last % 5].lower()}')
+        else:
+            calls.append('p')
+        if seat == 2 and (rng.random() < 0.3 or len(calls) > 12):
+            break
+    return calls
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+
+import re
+
+
+# Calls are coded as small integers so they fit in a byte:
+#   0-34   contract bids, (level - 1) * 5 + strain, strain in C D H S NT
+#   35-37  PASS, DBL, RDBL
+#   38     '-', an empty seat before the dealer
+# MARK is or'ed into a code for a call the student has to find.
+
+STRAINS = ('C', 'D', 'H', 'S', 'NT')
+PASS = 35
+DBL = 36
+RDBL = 37
+PAD = 38
+MARK = 0x80
+
+NAMES: tuple[str, ...] = tuple(
+    [f'{level}{strain}' for level in range(1, 8) for strain in STRAINS]
+    + ['PASS', 'DBL', 'RDBL', '-'])
+
+# Everything an author might type for a call, upper-cased.
+CODES: dict[str, int] = {name: code for code, name in enumerate(NAMES)}
+for _level in range(1, 8):
+    CODES[f'{_level}N'] = (_level - 1) * 5 + 4
+CODES.update({'P': PASS, 'X': DBL, 'D': DBL, 'XX': RDBL, 'R': RDBL})
+# The same, for calls that may be marked with '*'.
+MARKED_CODES: dict[str, int] = dict(CODES)
+MARKED_CODES.update({'*' + name: MARK | code for name, code in CODES.items()})
+DECODE: tuple[str, ...] = NAMES + ('',) * (MARK - len(NAMES)) \
+    + tuple('*' + name for name in NAMES) + ('',) * (MARK - len(NAMES))
+
+# question.py writes whole auctions compactly, e.g. '1np2cp'.
+COMPACT_CODES: dict[str, int] = {'p': PASS, 'x': DBL, 'r': RDBL}
+for _level in range(1, 8):
+    for _strain, _c in enumerate('cdhsn'):
+        COMPACT_CODES[f'{_level}{_c}'] = (_level - 1) * 5 + _strain
+COMPACT_RE = re.compile('[1-7][cdhsn]|[pxr]')
+# For parse_compact_many.
+COMPACT_BIDS = [(t.encode(), bytes([c])) for t, c in COMPACT_CODES.items() if len(t) == 2]
+COMPACT_CALLS = bytes.maketrans(b'pxr,', bytes([PASS, DBL, RDBL, 0xff]))
+COMPACT_CHARS = b'1234567cdhsnpxr,'
+VALID_BYTES = bytes(range(PASS + 3)) + b'\xff'
+
+
+class BidError(ValueError):
+    "A call we can't read. pos is its index in the auction or string."
+    text: str
+    pos: int
+
+    def __init__(self, text: str, pos: int):
+        super().__init__(f'Bad call at position {pos}: {text!r}')
+        self.text = text
+        self.pos = pos
+
+
+def encode(name: str) -> int:
+    "Return the code for a call, which may be marked with a leading '*'."
+    try:
+        return MARKED_CODES[name.upper()]
+    except KeyError:
+        raise BidError(name, 0) from None
+
+
+def decode(code: int) -> str:
+    return DECODE[code]
+
+
+def encode_calls(calls: list[str]) -> bytes:
+    "Return the codes for a list of calls, e.g. ['-', '1NT', 'P', '*2S']."
+    table = MARKED_CODES
+    try:
+        return bytes(map(table.__getitem__, map(str.upper, calls)))
+    except KeyError:
+        for pos, c in enumerate(calls):
+            if c.upper() not in table:
+                raise BidError(c, pos) from None
+        raise
+
+
+def names(codes: bytes) -> list[str]:
+    return list(map(DECODE.__getitem__, codes))
+
+
+def parse_compact(raw: str) -> bytes:
+    "Return the codes for a compact auction, e.g. '1np2cp'."
+    tokens = COMPACT_RE.findall(raw)
+    # findall skips what it can't match, so a short total means a bad call.
+    if sum(map(len, tokens)) != len(raw):
+        raise BidError(raw, bad_position(raw))
+    return bytes(map(COMPACT_CODES.__getitem__, tokens))
+
+
+def bad_position(raw: str) -> int:
+    "Return the index of the first character of raw that isn't part of a call."
+    pos = 0
+    while pos < len(raw):
+        m = COMPACT_RE.match(raw, pos)
+        if m is None:
+            return pos
+        pos = m.end()
+    return pos
+
+
+def parse_compact_many(raws: list[str]) -> list[bytes]:
+    "parse_compact for a whole corpus of auctions, in a few passes over all of them."
+    # Join the auctions with ',' and turn each call into the byte
+    # with its code: 35 replace()s for the bids, one translate() for
+    # the rest. Whatever is left over isn't a call.
+    data = ','.join(raws).encode('ascii', 'replace')
+    ok = not data.translate(None, COMPACT_CHARS)
+    for token, code in COMPACT_BIDS:
+        data = data.replace(token, code)
+    data = data.translate(COMPACT_CALLS)
+    if not ok or data.translate(None, VALID_BYTES):
+        for raw in raws:
+            parse_compact(raw)  # raises BidError for the bad one
+    return data.split(b'\xff')
+
+
+# Auction rules. Seats are numbered from North: N=0, E=1, S=2, W=3.
+SOUTH = 2
+
+
+def auction_errors(codes: bytes, dealer: int, padded: bool = True,
+                   student: int = SOUTH) -> list[tuple[int, str]]:
+    """Check an auction in one pass. Return (position, message) for every
+    broken rule. If padded, the auction starts with a '-' for each seat
+    before the dealer. Marked calls must be made by the student."""
+    errors: list[tuple[int, str]] = []
+    pads = 0
+    while padded and pads < len(codes) and codes[pads] & ~MARK == PAD:
+        pads += 1
+    if padded and pads != dealer:
+        errors.append((0, f"{pads} empty seats before the dealer, not {dealer}"))
+    last_bid = -1     # highest bid so far
+    bidder = -1       # seat that made it
+    doubled = 0       # 0, DBL or RDBL
+    passes = 0        # passes in a row
+    done = False
+    for pos in range(pads, len(codes)):
+        code = codes[pos]
+        seat = (dealer + pos - pads) % 4
+        if code & MARK:
+            code &= ~MARK
+            if seat != student:
+                errors.append((pos, f'marked call {NAMES[code]} is not made by {"NESW"[student]}'))
+        if done:
+            errors.append((pos, f'{NAMES[code]} after the auction is over'))
+            continue
+        if code < PASS:
+            if code <= last_bid:
+                errors.append((pos, f'{NAMES[code]} is not sufficient over {NAMES[last_bid]}'))
+            else:
+                last_bid, bidder, doubled = code, seat, 0
+            passes = 0
+        elif code == PASS:
+            passes += 1
+            if passes == 4 or (passes == 3 and last_bid >= 0):
+                done = True
+        elif code == DBL:
+            if last_bid < 0 or (seat - bidder) % 2 == 0 or doubled:
+                errors.append((pos, 'DBL is not allowed here'))
+            else:
+                doubled = DBL
+            passes = 0
+        elif code == RDBL:
+            if doubled != DBL or (seat - bidder) % 2 != 0:
+                errors.append((pos, 'RDBL is not allowed here'))
+            else:
+                doubled = RDBL
+            passes = 0
+        else:
+            errors.append((pos, f'unexpected {NAMES[code]!r}'))
+    return errors
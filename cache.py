@@ -0,0 +1,117 @@
+
+import hashlib
+import logging
+import os
+import pickle
+from typing import Optional
+from exercise import Exercise, read_file
+
+
+# A parsed exercise file 'foo.exr' is kept in 'foo.exr.cache'.
+# The file holds two pickles: a small header describing the source
+# file, and the list of exercises. We only unpickle the exercises
+# after the header says the source file hasn't changed.
+
+CACHE_SUFFIX = '.cache'
+CACHE_VERSION = 3
+
+
+class CacheKey:
+    path: str
+    size: int
+    mtime: int
+    digest: str
+
+    def __init__(self, path: str, size: int, mtime: int, digest: str):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.digest = digest
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CacheKey):
+            return NotImplemented
+        return (self.path, self.size, self.mtime, self.digest) == \
+            (other.path, other.size, other.mtime, other.digest)
+
+
+def cache_name(fname: str) -> str:
+    return fname + CACHE_SUFFIX
+
+
+def file_digest(fname: str) -> str:
+    h = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def source_key(fname: str, digest: str = '') -> CacheKey:
+    "Return the key for fname. The content hash is computed only if asked."
+    st = os.stat(fname)
+    return CacheKey(os.path.abspath(fname), st.st_size, st.st_mtime_ns, digest)
+
+
+def read_header(cname: str) -> Optional[tuple[int, CacheKey]]:
+    try:
+        with open(cname, 'rb') as f:
+            version, key = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+        return None
+    return version, key
+
+
+def is_fresh(fname: str) -> bool:
+    "Return True if the cache for fname matches the source file."
+    header = read_header(cache_name(fname))
+    if header is None:
+        return False
+    version, old = header
+    if version != CACHE_VERSION:
+        return False
+    new = source_key(fname)
+    if old.path != new.path or old.size != new.size:
+        return False
+    if old.mtime == new.mtime:
+        return True
+    # The file was touched. Trust the cache only if the contents are the same.
+    return old.digest == file_digest(fname)
+
+
+def load_cache(fname: str) -> list[Exercise]:
+    with open(cache_name(fname), 'rb') as f:
+        _ = pickle.load(f)
+        ex_list: list[Exercise] = pickle.load(f)
+    return ex_list
+
+
+def write_cache(fname: str, ex_list: list[Exercise]) -> None:
+    key = source_key(fname, file_digest(fname))
+    cname = cache_name(fname)
+    tmp = cname + '.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            pickle.dump((CACHE_VERSION, key), f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(ex_list, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cname)
+    except OSError as e:
+        # A read-only directory shouldn't stop the quiz.
+        logging.warning(f'Cannot write cache {cname}: {e}')
+
+
+def load_exercises(fname: str, rebuild: bool = False) -> list[Exercise]:
+    "Return the exercises in fname, from the cache if it's up to date."
+    if not rebuild and is_fresh(fname):
+        try:
+            ex_list = load_cache(fname)
+            logging.debug(f'{fname}: loaded {len(ex_list)} exercises from cache')
+            return ex_list
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError) as e:
+            logging.warning(f'Bad cache for {fname}: {e}')
+    ex_list = read_file(fname)
+    write_cache(fname, ex_list)
+    return ex_list
@@ -0,0 +1,126 @@
+
+import re
+from collections.abc import Sequence
+import handeval
+
+
+# A small language for describing hands. A description is a list of
+# terms separated by commas, and a hand must match all of them. A term
+# may list alternatives separated by '|'; one of them must match.
+#
+#   hcp 15-17, balanced
+#   hcp 10+, spades 5+ | hearts 5+
+#   major 5+, losers 7-, semi-balanced | two-suiter
+#
+# A range is N, N-M, N+ (N or more) or N- (N or fewer). The features are
+# hcp, controls, losers, spades, hearts, diamonds, clubs, major (the
+# longer major) and minor (the longer minor). The shape classes are
+# those in handeval.py, and 'unbalanced' is anything but balanced.
+
+FEATURES = ('hcp', 'controls', 'losers', 'spades', 'hearts', 'diamonds', 'clubs',
+            'major', 'minor')
+SHAPE_WORDS = {
+    handeval.BALANCED: (handeval.BALANCED,),
+    handeval.SEMI_BALANCED: (handeval.SEMI_BALANCED,),
+    handeval.TWO_SUITER: (handeval.TWO_SUITER,),
+    handeval.THREE_SUITER: (handeval.THREE_SUITER,),
+    handeval.ONE_SUITER: (handeval.ONE_SUITER,),
+    'unbalanced': (handeval.SEMI_BALANCED, handeval.TWO_SUITER,
+                   handeval.THREE_SUITER, handeval.ONE_SUITER),
+}
+RANGE_RE = re.compile(r'^(\d+)(?:(\+)|(-)(\d*))?$')
+MAX = 40
+
+
+class ConstraintError(Exception):
+    pass
+
+
+class Condition:
+    "One alternative: a feature in a range, or a hand shape."
+    feature: str  # one of FEATURES, or 'shape'
+    lo: int
+    hi: int
+    shapes: tuple[str, ...]
+
+    def __init__(self, feature: str, lo: int = 0, hi: int = MAX,
+                 shapes: tuple[str, ...] = ()):
+        self.feature = feature
+        self.lo = lo
+        self.hi = hi
+        self.shapes = shapes
+
+    def __repr__(self) -> str:
+        if self.feature == 'shape':
+            return '|'.join(self.shapes)
+        return f'{self.feature} {self.lo}-{self.hi}'
+
+
+# A compiled description: every clause must match, and a clause
+# matches if any of its conditions does.
+Constraints = list[list[Condition]]
+
+
+def parse(text: str) -> Constraints:
+    clauses: Constraints = []
+    for term in text.split(','):
+        term = term.strip()
+        if term == '':
+            continue
+        clauses.append([parse_condition(alt.strip()) for alt in term.split('|')])
+    return clauses
+
+
+def parse_condition(text: str) -> Condition:
+    fld = text.lower().split()
+    if len(fld) == 1 and fld[0] in SHAPE_WORDS:
+        return Condition('shape', shapes=SHAPE_WORDS[fld[0]])
+    if len(fld) != 2 or fld[0] not in FEATURES:
+        raise ConstraintError(f'Bad condition: {text!r}')
+    m = RANGE_RE.match(fld[1])
+    if m is None:
+        raise ConstraintError(f'Bad range: {text!r}')
+    lo = hi = int(m[1])
+    if m[2]:
+        hi = MAX
+    elif m[3] and m[4]:
+        hi = int(m[4])
+    elif m[3]:
+        lo, hi = 0, lo
+    if lo > hi:
+        raise ConstraintError(f'Empty range: {text!r}')
+    return Condition(fld[0], lo, hi)
+
+
+def features(cards: int, spots: int = 0) -> dict[str, int]:
+    "The numeric features of one hand, by name."
+    return feature_dict(handeval.hcp(cards), handeval.controls(cards),
+                        handeval.losers(cards, spots), handeval.lengths(cards, spots))
+
+
+def feature_dict(hcp: int, controls: int, losers: int,
+                 lengths: Sequence[int]) -> dict[str, int]:
+    "The features by name, given a hand's evaluation. lengths is spades first."
+    s, h, d, c = (int(n) for n in lengths)
+    return {
+        'hcp': int(hcp), 'controls': int(controls), 'losers': int(losers),
+        'spades': s, 'hearts': h, 'diamonds': d, 'clubs': c,
+        'major': max(s, h), 'minor': max(d, c),
+    }
+
+
+def matches(clauses: Constraints, feats: dict[str, int], shape: str) -> bool:
+    for clause in clauses:
+        for cond in clause:
+            if cond.feature == 'shape':
+                if shape in cond.shapes:
+                    break
+            elif cond.lo <= feats[cond.feature] <= cond.hi:
+                break
+        else:
+            return False
+    return True
+
+
+def hand_matches(clauses: Constraints, cards: int, spots: int = 0) -> bool:
+    return matches(clauses, features(cards, spots), handeval.shape(cards, spots))
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+"""
+corpus.py: Compile exercise files into one indexed binary corpus.
+quiz.py opens the corpus with mmap and decodes an exercise only
+when it is about to be shown.
+
+Usage:
+    corpus.py <corpus> EXERCISES...
+    corpus.py   --version
+    corpus.py   --help
+
+Options and commands:
+    --version          Show version and exit.
+    -h --help          Show this message and exit.
+"""
+
+
+import mmap
+import random
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from typing import Iterator, Optional, overload
+import docopt  # type: ignore
+from keyindex import KeyIndex, build_index
+from exercise import (Answer, Exercise, Hand, DEALERS, VULNERABLE, ParseError,
+                      intern_keys, read_file)
+
+
+VERSION = '0.01'
+CORPUS_SUFFIX = '.exb'
+
+# File layout:
+#   header
+#   count fixed-width records, one per exercise
+#   variable-length text blobs (keys, info and explanations)
+#   the keyword index: for each key, its name and exercise ids
+# A record holds the offset of its blob, so record i is at a known
+# position and can be decoded without looking at any other exercise.
+
+MAGIC = b'BIDPRAC\0'
+CORPUS_VERSION = 2
+HEADER = struct.Struct('<8sIIQ')  # magic, version, count, index offset
+KEY_HEADER = struct.Struct('<HI')  # length of key, number of ids
+MAX_AUCTION = 48
+MAX_ANSWERS = 8
+# blob offset, blob length, then the content: dealer, vulnerable,
+# auction length, answer count, 4 suit masks, 4 spot counts, auction
+# codes, answer codes. The content is what history.py hashes to name
+# an exercise.
+CONTENT = struct.Struct(f'<BBBB4H4B{MAX_AUCTION}s{MAX_ANSWERS}s')
+RECORD = struct.Struct('<QI' + CONTENT.format[1:])
+CONTENT_START = RECORD.size - CONTENT.size
+
+FIELD_SEP = '\x1e'
+LINE_SEP = '\x1f'
+
+
+class CorpusError(Exception):
+    pass
+
+
+class Corpus(Sequence):
+    "The exercises in one or more corpus files, decoded on demand."
+    maps: list[mmap.mmap]
+    starts: list[int]
+    count: int
+
+    def __init__(self, files: list[str]):
+        self.maps = []
+        self.starts = []
+        self.count = 0
+        for fname in files:
+            with open(fname, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, count, _ = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or version != CORPUS_VERSION:
+                mm.close()
+                raise CorpusError(f'{fname} is not a version {CORPUS_VERSION} corpus')
+            self.maps.append(mm)
+            self.starts.append(self.count)
+            self.count += count
+
+    def __len__(self) -> int:
+        return self.count
+
+    @overload
+    def __getitem__(self, i: int) -> Exercise: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> list[Exercise]: ...
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('corpus index out of range')
+        # There are only a few files, so a linear search is fine.
+        n = len(self.starts) - 1
+        while self.starts[n] > i:
+            n -= 1
+        mm = self.maps[n]
+        return decode_record(mm, HEADER.size + (i - self.starts[n]) * RECORD.size)
+
+    def auctions(self) -> Iterator[tuple[int, bytes, bytes]]:
+        "Yield dealer, auction codes and answer codes for each exercise, in order."
+        for mm in self.maps:
+            _, _, count, _ = HEADER.unpack_from(mm, 0)
+            for fld in RECORD.iter_unpack(mm[HEADER.size:HEADER.size + count * RECORD.size]):
+                yield fld[2], fld[14][:fld[4]], fld[15][:fld[5]]
+
+    def contents(self) -> Iterator[bytes]:
+        "Yield the content part of each record, in order. See CONTENT."
+        for mm in self.maps:
+            _, _, count, _ = HEADER.unpack_from(mm, 0)
+            for pos in range(HEADER.size, HEADER.size + count * RECORD.size, RECORD.size):
+                yield mm[pos + CONTENT_START:pos + RECORD.size]
+
+    def key_index(self) -> KeyIndex:
+        "Read the stored keyword indexes, without decoding any exercise."
+        index = KeyIndex(self.count)
+        for mm, start in zip(self.maps, self.starts):
+            _, _, _, pos = HEADER.unpack_from(mm, 0)
+            while pos < len(mm):
+                length, count = KEY_HEADER.unpack_from(mm, pos)
+                pos += KEY_HEADER.size
+                key = mm[pos:pos + length].decode()
+                pos += length
+                ids = array('I', mm[pos:pos + 4 * count])
+                pos += 4 * count
+                if sys.byteorder == 'big':
+                    ids.byteswap()
+                if start:
+                    ids = array('I', [n + start for n in ids])
+                if key in index.ids:
+                    index.ids[key] += ids
+                else:
+                    index.ids[key] = ids
+        return index
+
+    def close(self) -> None:
+        for mm in self.maps:
+            mm.close()
+        self.maps = []
+
+
+def decode_record(mm: mmap.mmap, pos: int) -> Exercise:
+    fld = RECORD.unpack_from(mm, pos)
+    offset, length, dealer, vuln, n_auction, n_answers = fld[0:6]
+    masks = fld[6:10]
+    spots = fld[10:14]
+    auction = fld[14]
+    answers = fld[15]
+    text = mm[offset:offset + length].decode()
+    parts = text.split(FIELD_SEP)
+    ex = Exercise()
+    ex.keys = intern_keys(parts[0].split())
+    ex.info = split_lines(parts[1])
+    ex.dealer = DEALERS[dealer]
+    ex.vulnerable = VULNERABLE[vuln]
+    ex.hand = Hand()
+    for i in range(4):
+        ex.hand.cards |= masks[i] << (13 * i)
+        ex.hand.spots |= spots[i] << (4 * i)
+    ex.codes = auction[:n_auction]
+    for i in range(n_answers):
+        ex.answers.append(Answer(answers[i], split_lines(parts[2 + i])))
+    return ex
+
+
+def split_lines(s: str) -> list[str]:
+    if s == '':
+        return []
+    return s.split(LINE_SEP)
+
+
+def check_size(ex: Exercise) -> None:
+    "Raise ParseError if ex is too long for a record."
+    if len(ex.codes) > MAX_AUCTION or len(ex.answers) > MAX_ANSWERS:
+        raise ParseError(f'{len(ex.codes)} calls and {len(ex.answers)} answers, but a corpus '
+                         f'holds {MAX_AUCTION} and {MAX_ANSWERS}')
+
+
+def encode_content(ex: Exercise) -> bytes:
+    "Return the content part of the record for ex. See CONTENT."
+    if len(ex.codes) > MAX_AUCTION or len(ex.answers) > MAX_ANSWERS:
+        raise CorpusError('Exercise is too long for a corpus record.')
+    hand = ex.hand
+    return CONTENT.pack(DEALERS.index(ex.dealer), VULNERABLE.index(ex.vulnerable),
+                        len(ex.codes), len(ex.answers),
+                        *[hand.suit_mask(i) for i in range(4)],
+                        *[hand.suit_spots(i) for i in range(4)],
+                        ex.codes, bytes(a.code for a in ex.answers))
+
+
+def encode_record(ex: Exercise, offset: int) -> tuple[bytes, bytes]:
+    "Return the fixed record and the text blob for ex."
+    content = encode_content(ex)
+    parts = [' '.join(ex.keys), LINE_SEP.join(ex.info)]
+    parts += [LINE_SEP.join(a.expl) for a in ex.answers]
+    blob = FIELD_SEP.join(parts).encode()
+    return struct.pack('<QI', offset, len(blob)) + content, blob
+
+
+def write_corpus(fname: str, ex_list: Sequence[Exercise]) -> None:
+    records: list[bytes] = []
+    blobs: list[bytes] = []
+    offset = HEADER.size + len(ex_list) * RECORD.size
+    for ex in ex_list:
+        record, blob = encode_record(ex, offset)
+        records.append(record)
+        blobs.append(blob)
+        offset += len(blob)
+    with open(fname, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, CORPUS_VERSION, len(ex_list), offset))
+        f.write(b''.join(records))
+        f.write(b''.join(blobs))
+        f.write(encode_index(build_index(ex_list)))
+
+
+def encode_index(index: KeyIndex) -> bytes:
+    parts: list[bytes] = []
+    for key, ids in index.ids.items():
+        name = key.encode()
+        parts.append(KEY_HEADER.pack(len(name), len(ids)))
+        parts.append(name)
+        if sys.byteorder == 'big':
+            ids = array('I', ids)
+            ids.byteswap()
+        parts.append(ids.tobytes())
+    return b''.join(parts)
+
+
+def lazy_shuffle(n: int, rng: Optional[random.Random] = None) -> Iterator[int]:
+    "Yield 0..n-1 in random order. Only the swapped slots are stored."
+    # This is a Fisher-Yates shuffle over a virtual array,
+    # so the first index is ready at once, whatever n is.
+    randrange = rng.randrange if rng else random.randrange
+    swapped: dict[int, int] = {}
+    for i in range(n):
+        j = randrange(i, n)
+        yield swapped.get(j, j)
+        swapped[j] = swapped.pop(i, i)
+
+
+def main() -> None:
+    args = docopt.docopt(__doc__, version=VERSION)
+    ex_list: list[Exercise] = []
+    for fname in args['EXERCISES']:
+        # Exercises too long for a record are reported and left out.
+        ex_list += read_file(fname, check_size)
+    write_corpus(args['<corpus>'], ex_list)
+    print(f'{len(ex_list)} exercises written to {args["<corpus>"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,645 @@
+#!/usr/bin/env python3
+
+"""
+ddsolve.py: Annotate deals with double-dummy results: the tricks
+each player can take as declarer in each strain, and the par contract.
+
+Usage:
+    ddsolve.py [-j <jobs>] [-c <cache>] [-v <vul>] [-o <file>] HANDS
+    ddsolve.py   --version
+    ddsolve.py   --help
+
+Options and commands:
+    --version          Show version and exit.
+    -h --help          Show this message and exit.
+    -j <jobs>          Solve with this many processes [default: 1].
+    -c <cache>         Keep results in this file [default: dd.cache].
+    -v <vul>           Vulnerability for par: none, n-s, e-w or both [default: none].
+    -o <file>          Write to this file instead of stdout.
+
+HANDS is a file made by 'dealgen.py --deal'. It is copied with each
+deal's results added to its hand comment, which mkexercises.py keeps.
+"""
+
+
+import hashlib
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import BinaryIO, Optional, TextIO
+import docopt  # type: ignore
+import bids
+
+
+VERSION = '0.01'
+
+# Hands are 52-bit masks as in handeval: bit 13 * suit + rank, suit 0 is
+# spades, rank 0 is the 2. Seats are N=0, E=1, S=2, W=3, and a side is
+# seat % 2. Strains are numbered as in bids: C D H S NT.
+SEATS = 'NESW'
+PBN_RANKS = '23456789TJQKA'
+STRAIN_SUITS = (3, 2, 1, 0, None)  # the trump suit for each strain
+SUIT_MASK = 0x1fff
+CACHE_RECORD = 40  # a 20 byte deal digest, then 20 trick counts
+
+
+class Entry:
+    """A transposition table result. It holds for every position with the
+    same suit lengths in each hand where, in each suit, the top ranks[s]
+    cards still out are held by the same seats; prefixes[s] codes their
+    seats as in suit_info. Below those, which card is which didn't matter."""
+    __slots__ = ('ranks', 'prefixes', 'lo', 'hi')
+    ranks: tuple[int, int, int, int]
+    prefixes: tuple[int, int, int, int]
+    lo: int
+    hi: int
+
+    def __init__(self, ranks: tuple[int, int, int, int],
+                 prefixes: tuple[int, int, int, int], lo: int, hi: int):
+        self.ranks = ranks
+        self.prefixes = prefixes
+        self.lo = lo
+        self.hi = hi
+
+
+class Solver:
+    """Double-dummy search for one deal and trump suit. Searches answer
+    'can the side on lead take at least target of the remaining tricks?',
+    and tricks() narrows the target down with them.
+
+    Every search also returns the cards whose rank decided a trick
+    somewhere below it. At the start of a trick, the result goes in the
+    transposition table for all positions that agree on those cards and
+    on the suit lengths (see Entry), so one result covers many positions.
+    The table is shared by every search on the deal."""
+    trump: Optional[int]
+    tt: dict[tuple[int, int], list[Entry]]  # by leader and suit lengths
+    nodes: int
+
+    def __init__(self, trump: Optional[int]):
+        self.trump = trump
+        self.tt = {}
+        self.nodes = 0
+
+    def tricks(self, hands: tuple[int, int, int, int], leader: int,
+               guess: Optional[int] = None) -> int:
+        """The tricks the leader's side takes with best play. A good guess
+        saves searches: the result is found by trying guess, then one
+        more or one less, and so on."""
+        lo = 0
+        hi = bin(hands[leader]).count('1')
+        while lo < hi:
+            if guess is not None and lo <= guess <= hi:
+                target = guess if guess > lo else guess + 1
+            else:
+                target = (lo + hi + 1) // 2
+            if self.win(hands, leader, target)[0]:
+                lo = target
+                guess = target + 1
+            else:
+                hi = target - 1
+                guess = target - 1
+        return lo
+
+    def win(self, hands: tuple[int, int, int, int], leader: int,
+            target: int) -> tuple[bool, int]:
+        """Can leader's side take target tricks? hands is at the start of a
+        trick. Also return a mask of the cards whose rank mattered."""
+        if target <= 0:
+            return True, 0
+        left = bin(hands[leader]).count('1')
+        if target > left:
+            return False, 0
+        info = [suit_info(hands, shift) for shift in (0, 13, 26, 39)]
+        key = (leader, info[0][2] | info[1][2] << 16 | info[2][2] << 32 | info[3][2] << 48)
+        entries = self.tt.get(key)
+        if entries is None:
+            entries = self.tt[key] = []
+        for e in entries:
+            if e.lo < target <= e.hi:
+                continue
+            r = e.ranks
+            p = e.prefixes
+            if info[0][0] >> 2 * (info[0][1] - r[0]) == p[0] and \
+                    info[1][0] >> 2 * (info[1][1] - r[1]) == p[1] and \
+                    info[2][0] >> 2 * (info[2][1] - r[2]) == p[2] and \
+                    info[3][0] >> 2 * (info[3][1] - r[3]) == p[3]:
+                return e.lo >= target, top_cards(info, r)
+        quick, rel = self.quick_tricks(hands, leader)
+        if quick >= target:
+            store(entries, info, rel, quick, left)
+            return True, rel
+        if self.trump is not None:
+            lost, rel = self.top_trumps(hands, (leader + 1) % 4, info[self.trump][3])
+            if left - lost < target:
+                store(entries, info, rel, 0, left - lost)
+                return False, rel
+        if left == 1:
+            ok, rel = self.last_trick(hands, leader)
+        else:
+            ok, rel = self.play(hands, leader, target, leader, 0, -1, -1, -1)
+        if ok:
+            store(entries, info, rel, target, left)
+        else:
+            store(entries, info, rel, 0, target - 1)
+        return ok, rel
+
+    def play(self, hands: tuple[int, int, int, int], leader: int, target: int,
+             seat: int, played: int, led: int, best: int, winner: int) -> tuple[bool, int]:
+        """Search the moves for seat, with played the cards on the table,
+        led the suit led, best the winning card and winner its seat."""
+        self.nodes += 1
+        trump = self.trump
+        ours = (seat - leader) % 2 == 0
+        rel_all = 0
+        for card in self.moves(hands, seat, played, led, best, winner):
+            bit = 1 << card
+            suit = card // 13
+            if led < 0:
+                new_led, new_best, new_winner = suit, card, seat
+            elif (suit == best // 13 and card > best) or \
+                    (suit == trump and best // 13 != trump):
+                new_led, new_best, new_winner = led, card, seat
+            else:
+                new_led, new_best, new_winner = led, best, winner
+            new_hands = hands[:seat] + (hands[seat] & ~bit,) + hands[seat + 1:]
+            nxt = (seat + 1) % 4
+            if nxt == leader:
+                # The trick is over. The winner leads to the next one.
+                if (new_winner - leader) % 2 == 0:
+                    ok, rel = self.win(new_hands, new_winner, target - 1)
+                else:
+                    left = bin(new_hands[0]).count('1')
+                    ok, rel = self.win(new_hands, new_winner, left + 1 - target)
+                    ok = not ok
+                # The winning card's rank mattered if it beat another card of its suit.
+                base = 13 * (new_best // 13)
+                if ((played | bit) >> base) & SUIT_MASK != 1 << (new_best - base):
+                    rel |= 1 << new_best
+            else:
+                ok, rel = self.play(new_hands, leader, target, nxt, played | bit,
+                                    new_led, new_best, new_winner)
+            if ok == ours:
+                return ok, rel
+            rel_all |= rel
+        return not ours, rel_all
+
+    def moves(self, hands: tuple[int, int, int, int], seat: int, played: int,
+              led: int, best: int, winner: int) -> list[int]:
+        """The cards seat should try, best first. Of cards in sequence,
+        counting the cards still in play, only one is tried."""
+        hand = hands[seat]
+        live = hands[0] | hands[1] | hands[2] | hands[3] | played
+        trump = self.trump
+        if led < 0:
+            return self.leads(hands, seat, live)
+        mine = (hand >> (13 * led)) & SUIT_MASK
+        if mine:
+            cards = suit_moves(mine, (live >> (13 * led)) & SUIT_MASK)
+            base = 13 * led
+            if (winner - seat) % 2 == 0 or best // 13 != led:
+                # Partner is winning, or the trick is ruffed: play low.
+                return [base + r for r in reversed(cards)]
+            top = best - base
+            over = [base + r for r in reversed(cards) if r > top]
+            under = [base + r for r in reversed(cards) if r < top]
+            return over + under
+        # Void in the suit led.
+        result: list[int] = []
+        low: list[int] = []
+        for suit in range(4):
+            mine = (hand >> (13 * suit)) & SUIT_MASK
+            if not mine:
+                continue
+            cards = suit_moves(mine, (live >> (13 * suit)) & SUIT_MASK)
+            base = 13 * suit
+            if suit == trump and (winner - seat) % 2 != 0:
+                # Ruff low, or overruff.
+                for r in reversed(cards):
+                    if best // 13 != trump or base + r > best:
+                        result.append(base + r)
+                        break
+            low.extend(base + r for r in reversed(cards))
+        return result + [c for c in low if c not in result]
+
+    def leads(self, hands: tuple[int, int, int, int], seat: int, live: int) -> list[int]:
+        """Leads to try: first cash a winner, then lead low to partner's
+        winner, then the rest, low cards first."""
+        hand = hands[seat]
+        partner = hands[(seat + 2) % 4]
+        cash: list[int] = []
+        to_partner: list[int] = []
+        rest: list[int] = []
+        for suit in range(4):
+            base = 13 * suit
+            mine = (hand >> base) & SUIT_MASK
+            if not mine:
+                continue
+            live_s = (live >> base) & SUIT_MASK
+            cards = suit_moves(mine, live_s)
+            top = 1 << (live_s.bit_length() - 1)
+            if mine & top:
+                cash.append(base + cards[0])
+                rest.extend(base + r for r in reversed(cards[1:]))
+            elif (partner >> base) & top:
+                to_partner.append(base + cards[-1])
+                rest.extend(base + r for r in reversed(cards[:-1]))
+            else:
+                rest.extend(base + r for r in reversed(cards))
+        return cash + to_partner + rest
+
+    def quick_tricks(self, hands: tuple[int, int, int, int], leader: int) -> tuple[int, int]:
+        """Tricks the leader's side can cash from the top without losing
+        the lead: the leader's own winners, or partner's if the leader
+        can get to partner with a winner partner holds. Also return the
+        winners counted."""
+        live = hands[0] | hands[1] | hands[2] | hands[3]
+        total, rel, _ = self.cash(hands, leader, live)
+        partner = (leader + 2) % 4
+        ptotal, prel, entries = self.cash(hands, partner, live)
+        if ptotal > total and entries & hands[leader]:
+            return ptotal, prel
+        return total, rel
+
+    def cash(self, hands: tuple[int, int, int, int], seat: int,
+             live: int) -> tuple[int, int, int]:
+        """The tricks seat can cash from the top: the top trumps, and in
+        each side suit the top cards, up to the length of the shorter
+        opponent if the opponents have trumps. Also return the cards
+        cashed, and a mask of the suits seat can safely be reached in."""
+        hand = hands[seat]
+        lho = hands[(seat + 1) % 4]
+        rho = hands[(seat + 3) % 4]
+        trump = self.trump
+        opp_trumps = trump is not None and \
+            ((lho | rho) >> (13 * trump)) & SUIT_MASK != 0
+        total = 0
+        cashed = 0
+        entries = 0
+        for suit in range(4):
+            base = 13 * suit
+            mine = (hand >> base) & SUIT_MASK
+            if not mine:
+                continue
+            live_s = (live >> base) & SUIT_MASK
+            n = top_run(mine, live_s)
+            if opp_trumps and suit != trump:
+                n = min(n, bin((lho >> base) & SUIT_MASK).count('1'),
+                        bin((rho >> base) & SUIT_MASK).count('1'))
+            if n:
+                entries |= SUIT_MASK << base
+                cashed |= top_bits(live_s, n) << base
+            total += n
+        return total, cashed, entries
+
+    def top_trumps(self, hands: tuple[int, int, int, int], seat: int,
+                   live: int) -> tuple[int, int]:
+        """Tricks that seat's side is sure to take with its top trumps,
+        which win whenever they're played; and those trumps. Two of them
+        can fall on the same trick, unless they're in the same hand."""
+        base = 13 * self.trump  # type: ignore
+        ours = ((hands[seat] | hands[(seat + 2) % 4]) >> base) & SUIT_MASK
+        top = top_bits(live, top_run(ours, live))
+        n = max(bin((hands[seat] >> base) & top).count('1'),
+                bin((hands[(seat + 2) % 4] >> base) & top).count('1'))
+        return n, top << base
+
+    def last_trick(self, hands: tuple[int, int, int, int], leader: int) -> tuple[bool, int]:
+        "With one card each, does the leader's side win the trick?"
+        cards = [h.bit_length() - 1 for h in hands]
+        best = cards[leader]
+        winner = leader
+        for i in range(1, 4):
+            seat = (leader + i) % 4
+            card = cards[seat]
+            suit = card // 13
+            if (suit == best // 13 and card > best) or \
+                    (suit == self.trump and best // 13 != self.trump):
+                best, winner = card, seat
+        rel = 0
+        if sum(c // 13 == best // 13 for c in cards) > 1:
+            rel = 1 << best
+        return (winner - leader) % 2 == 0, rel
+
+
+SUIT_INFO: dict[tuple[int, int, int, int], tuple[int, int, int, int]] = {}
+
+
+def suit_info(hands: tuple[int, int, int, int], shift: int) -> tuple[int, int, int, int]:
+    """For one suit: the seats holding the cards still out, high to low,
+    two bits each after a leading 1; how many cards are out; the length
+    of each hand, four bits each; and a mask of the cards out."""
+    suit = ((hands[0] >> shift) & SUIT_MASK, (hands[1] >> shift) & SUIT_MASK,
+            (hands[2] >> shift) & SUIT_MASK, (hands[3] >> shift) & SUIT_MASK)
+    info = SUIT_INFO.get(suit)
+    if info is None:
+        code = 1
+        count = 0
+        for r in range(12, -1, -1):
+            for seat in range(4):
+                if suit[seat] >> r & 1:
+                    code = code << 2 | seat
+                    count += 1
+        lengths = 0
+        for seat in range(4):
+            lengths |= bin(suit[seat]).count('1') << 4 * seat
+        info = SUIT_INFO[suit] = (code, count, lengths, suit[0] | suit[1] | suit[2] | suit[3])
+    return info
+
+
+def store(entries: list[Entry], info: list[tuple[int, int, int, int]], rel: int,
+          lo: int, hi: int) -> None:
+    "Add a result to the entries for a position, or narrow an entry's bounds."
+    ranks = []
+    prefixes = []
+    for s in range(4):
+        code, count, _, live = info[s]
+        mattered = (rel >> (13 * s)) & SUIT_MASK
+        # The cards out from the top down to the lowest one that mattered.
+        n = bin(live >> ((mattered & -mattered).bit_length() - 1)).count('1') if mattered else 0
+        ranks.append(n)
+        prefixes.append(code >> 2 * (count - n))
+    r = (ranks[0], ranks[1], ranks[2], ranks[3])
+    p = (prefixes[0], prefixes[1], prefixes[2], prefixes[3])
+    for e in entries:
+        if e.ranks == r and e.prefixes == p:
+            e.lo = max(e.lo, lo)
+            e.hi = min(e.hi, hi)
+            return
+    entries.append(Entry(r, p, lo, hi))
+
+
+def top_cards(info: list[tuple[int, int, int, int]], ranks: tuple[int, int, int, int]) -> int:
+    "The top ranks[s] cards out in each suit s."
+    mask = 0
+    for s in range(4):
+        if ranks[s]:
+            mask |= top_bits(info[s][3], ranks[s]) << (13 * s)
+    return mask
+
+
+TOP_BITS: dict[int, tuple[int, ...]] = {}
+
+
+def top_bits(live: int, n: int) -> int:
+    "The highest n bits of live."
+    tops = TOP_BITS.get(live)
+    if tops is None:
+        # tops[n] for every n at once.
+        masks = [0]
+        rest = live
+        while rest:
+            bit = 1 << (rest.bit_length() - 1)
+            masks.append(masks[-1] | bit)
+            rest &= ~bit
+        tops = TOP_BITS[live] = tuple(masks)
+    return tops[n]
+
+
+SUIT_MOVES: dict[tuple[int, int], tuple[int, ...]] = {}
+
+
+def suit_moves(mine: int, live: int) -> tuple[int, ...]:
+    """The ranks in mine worth trying, high to low: the top card of each
+    run of cards that no other live card splits."""
+    key = (mine, live)
+    moves = SUIT_MOVES.get(key)
+    if moves is None:
+        result: list[int] = []
+        in_run = False
+        for r in range(12, -1, -1):
+            if mine >> r & 1:
+                if not in_run:
+                    result.append(r)
+                in_run = True
+            elif live >> r & 1:
+                in_run = False
+        moves = SUIT_MOVES[key] = tuple(result)
+    return moves
+
+
+def top_run(mine: int, live: int) -> int:
+    "How many of the top live cards in a suit are in mine."
+    n = 0
+    for r in range(12, -1, -1):
+        if live >> r & 1:
+            if not mine >> r & 1:
+                break
+            n += 1
+    return n
+
+
+def parse_deal(text: str) -> tuple[int, int, int, int]:
+    "Return N, E, S, W hands from a PBN deal, e.g. 'S:AK5.QJ2.T98.7654 ...'."
+    first = SEATS.index(text[0].upper())
+    hands = [0, 0, 0, 0]
+    for i, hand in enumerate(text[2:].split()):
+        mask = 0
+        for suit, cards in enumerate(hand.split('.')):
+            for c in cards.upper():
+                mask |= 1 << (13 * suit + PBN_RANKS.index(c))
+        hands[(first + i) % 4] = mask
+    assert all(bin(h).count('1') == 13 for h in hands), text
+    assert hands[0] | hands[1] | hands[2] | hands[3] == (1 << 52) - 1, text
+    return hands[0], hands[1], hands[2], hands[3]
+
+
+def deal_digest(hands: tuple[int, int, int, int]) -> bytes:
+    return hashlib.sha1(b''.join(h.to_bytes(7, 'little') for h in hands)).digest()
+
+
+def solve(hands: tuple[int, int, int, int]) -> bytes:
+    """Return the tricks for each declarer in each strain, as 20 bytes:
+    4 * strain + declarer, strains as in bids, declarers from North."""
+    table = bytearray(20)
+    for strain, trump in enumerate(STRAIN_SUITS):
+        solver = Solver(trump)
+        guess = None
+        for leader in (1, 3, 0, 2):
+            # E and W leading usually give the same result, and so do N and S.
+            tricks = solver.tricks(hands, leader, guess)
+            table[4 * strain + (leader + 3) % 4] = 13 - tricks
+            guess = tricks if leader != 3 else 13 - tricks
+    return bytes(table)
+
+
+# Scores, from the point of view of the declaring side.
+
+def contract_score(level: int, strain: int, doubled: int, vul: bool, tricks: int) -> int:
+    "doubled is 0, 1 or 2 for undoubled, doubled and redoubled."
+    need = level + 6
+    if tricks < need:
+        down = need - tricks
+        if not doubled:
+            return -down * (100 if vul else 50)
+        if vul:
+            pen = 200 + 300 * (down - 1)
+        else:
+            pen = 100 + 200 * min(down - 1, 2) + 300 * max(down - 3, 0)
+        return -pen * doubled
+    per = 20 if strain < 2 else 30
+    points = per * level + (10 if strain == 4 else 0)
+    points *= (1, 2, 4)[doubled]
+    score = points + (50 * doubled)
+    if points >= 100:
+        score += 500 if vul else 300
+    else:
+        score += 50
+    if level == 6:
+        score += 750 if vul else 500
+    elif level == 7:
+        score += 1500 if vul else 1000
+    over = tricks - need
+    if doubled:
+        score += over * (200 if vul else 100) * doubled
+    else:
+        score += over * per
+    return score
+
+
+def par(table: bytes, vul: tuple[bool, bool]) -> tuple[str, int]:
+    """The par contract and its score for N-S. The sides take turns:
+    each outbids the other with a making contract, or a doubled
+    sacrifice that costs less than the other side's contract, until
+    neither can improve."""
+    def best_tricks(side: int, strain: int) -> tuple[int, int]:
+        a, b = table[4 * strain + side], table[4 * strain + side + 2]
+        return (a, side) if a >= b else (b, side + 2)
+
+    # Each side's best making contract anywhere, from scratch.
+    def best_contract(side: int, above: int) -> Optional[tuple[int, int, int]]:
+        "(score, code, declarer) of side's best making contract above code."
+        best: Optional[tuple[int, int, int]] = None
+        for code in range(above + 1, bids.PASS):
+            level, strain = code // 5 + 1, code % 5
+            tricks, declarer = best_tricks(side, strain)
+            if tricks >= level + 6:
+                score = contract_score(level, strain, 0, vul[side], tricks)
+                if best is None or score > best[0]:
+                    best = (score, code, declarer)
+        return best
+
+    def best_sacrifice(side: int, above: int) -> Optional[tuple[int, int, int]]:
+        "(score, code, declarer) of side's cheapest doubled sacrifice above code."
+        best: Optional[tuple[int, int, int]] = None
+        for code in range(above + 1, bids.PASS):
+            level, strain = code // 5 + 1, code % 5
+            tricks, declarer = best_tricks(side, strain)
+            if tricks < level + 6:
+                score = contract_score(level, strain, 1, vul[side], tricks)
+                if best is None or score > best[0]:
+                    best = (score, code, declarer)
+        return best
+
+    ns = best_contract(0, -1)
+    ew = best_contract(1, -1)
+    if ns is None and ew is None:
+        return 'PASS', 0
+    side = 0 if ew is None or (ns is not None and ns[0] >= ew[0]) else 1
+    score, code, declarer = ns if side == 0 else ew  # type: ignore
+    doubled = False
+    while True:
+        other = 1 - side
+        # The other side outbids with a contract of its own, if it pays.
+        options = [o for o in (best_contract(other, code), best_sacrifice(other, code))
+                   if o is not None and o[0] > -score]
+        if not options:
+            break
+        score, code, declarer = max(options)
+        doubled = score < 0
+        side = other
+    name = f'{bids.NAMES[code]}{"X" if doubled else ""}-{SEATS[declarer]}'
+    return name, score if side == 0 else -score
+
+
+def format_table(table: bytes) -> str:
+    "E.g. 'NS 9 9 8 7 9 EW 4 4 5 6 4', the tricks for the better of each pair."
+    ns = ' '.join(str(max(table[4 * s], table[4 * s + 2])) for s in range(5))
+    ew = ' '.join(str(max(table[4 * s + 1], table[4 * s + 3])) for s in range(5))
+    return f'NS {ns} EW {ew}'
+
+
+def load_results(fname: str) -> dict[bytes, bytes]:
+    "Results solved before, by deal digest."
+    results: dict[bytes, bytes] = {}
+    try:
+        with open(fname, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return results
+    # A partly written last record is ignored.
+    for i in range(0, len(data) - CACHE_RECORD + 1, CACHE_RECORD):
+        results[data[i:i + 20]] = data[i + 20:i + CACHE_RECORD]
+    return results
+
+
+def solve_all(deals: list[tuple[int, int, int, int]], cache: str, jobs: int) -> list[bytes]:
+    """Solve deals, skipping the ones in the cache. The cache is only
+    appended to, one deal at a time, so an interrupted run keeps what
+    it has solved."""
+    known = load_results(cache)
+    digests = [deal_digest(d) for d in deals]
+    todo: dict[bytes, tuple[int, int, int, int]] = {}
+    for digest, d in zip(digests, deals):
+        if digest not in known:
+            todo[digest] = d
+    try:
+        f: Optional[BinaryIO] = open(cache, 'ab', buffering=0)
+    except OSError as e:
+        logging.warning(f'Cannot write cache {cache}: {e}')
+        f = None
+    with ExitStack() as stack:
+        if jobs > 1 and len(todo) > 1:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+            tables = pool.map(solve, todo.values())
+        else:
+            tables = map(solve, todo.values())
+        for digest, table in zip(todo, tables):
+            known[digest] = table
+            if f:
+                f.write(digest + table)
+    if f:
+        f.close()
+    return [known[digest] for digest in digests]
+
+
+def main() -> None:
+    args = docopt.docopt(__doc__, version=VERSION)
+    vul_names = ('none', 'n-s', 'e-w', 'both')
+    if args['-v'].lower() not in vul_names:
+        sys.exit(f'Bad vulnerability: {args["-v"]}')
+    v = vul_names.index(args['-v'].lower())
+    vul = (v in (1, 3), v in (2, 3))
+    with open(args['HANDS']) as f:
+        lines = f.readlines()
+    deals: list[tuple[int, int, int, int]] = []
+    where: list[int] = []
+    for i, line in enumerate(lines):
+        deal = deal_in(line)
+        if deal is not None:
+            deals.append(parse_deal(deal))
+            where.append(i)
+    tables = solve_all(deals, args['-c'], int(args['-j']))
+    for i, table in zip(where, tables):
+        contract, score = par(table, vul)
+        lines[i] = f'{lines[i].rstrip()} | {format_table(table)} | par {contract} {score:+}\n'
+    out: TextIO = open(args['-o'], 'wt') if args['-o'] else sys.stdout
+    out.writelines(lines)
+    if out is not sys.stdout:
+        out.close()
+
+
+def deal_in(line: str) -> Optional[str]:
+    "The PBN deal in a 'Hand: # S:...' line, if it has one."
+    if not line.startswith('Hand'):
+        return None
+    _, _, comment = line.partition('#')
+    fld = comment.split()
+    if len(fld) < 4 or fld[0][:2].upper() not in ('N:', 'E:', 'S:', 'W:'):
+        return None
+    return ' '.join(fld[:4])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+"""
+dealgen.py: Deal random hands that match a description, and write
+them in the format that mkhands.py makes and mkexercises.py reads.
+
+Usage:
+    dealgen.py [-n <count>] [-j <jobs>] [-s <seed>] [-b <batch>] [-m <max>] [--deal] [-o <file>] <constraints>
+    dealgen.py   --version
+    dealgen.py   --help
+
+Options and commands:
+    --version          Show version and exit.
+    -h --help          Show this message and exit.
+    -n <count>         Number of hands to write [default: 10].
+    -j <jobs>          Deal with this many processes [default: 1].
+    -s <seed>          Seed for the random numbers, to repeat a run.
+    -b <batch>         Candidate deals per batch [default: 200000].
+    -m <max>           Give up after this many candidate deals [default: 100000000].
+    --deal             Add the whole deal, in PBN form, to each hand's comment.
+    -o <file>          Write to this file instead of stdout.
+
+The constraints describe South's hand, e.g. 'hcp 15-17, balanced'
+or 'hcp 10+, spades 5+ | hearts 5+'. See constraints.py.
+"""
+
+
+import sys
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Optional, TextIO
+import numpy as np
+import docopt  # type: ignore
+import constraints
+import handeval
+
+
+VERSION = '0.01'
+
+# Cards are numbered 13 * suit + rank, as in handeval: spades first,
+# rank 0 is the 2. These weights give each feature per card.
+HCP_WEIGHTS = np.tile(np.array([0] * 9 + [1, 2, 3, 4], dtype=np.uint8), 4)
+CONTROL_WEIGHTS = np.tile(np.array([0] * 11 + [1, 2], dtype=np.uint8), 4)
+SUIT_BITS = (1 << np.arange(13, dtype=np.int64))
+SHAPE_NAMES = (handeval.BALANCED, handeval.SEMI_BALANCED, handeval.TWO_SUITER,
+               handeval.THREE_SUITER, handeval.ONE_SUITER)
+# Shape class index for every (s, h, d, c), indexed by s * 14**3 + h * 14**2 + d * 14 + c.
+SHAPE_IDS = np.zeros(14 ** 4, dtype=np.uint8)
+for _code in range(14 ** 4):
+    _p = (_code // 2744, _code // 196 % 14, _code // 14 % 14, _code % 14)
+    if sum(_p) == 13:
+        SHAPE_IDS[_code] = SHAPE_NAMES.index(handeval.SHAPES[tuple(sorted(_p, reverse=True))])
+PBN_RANKS = '23456789TJQKA'
+
+
+class Batch:
+    "The hands one batch of candidate deals kept."
+    cards: list[int]   # 52-bit masks, as in handeval
+    deals: list[str]   # PBN deals, if asked for
+    tried: int
+
+    def __init__(self, cards: list[int], deals: list[str], tried: int):
+        self.cards = cards
+        self.deals = deals
+        self.tried = tried
+
+
+def main() -> None:
+    args = docopt.docopt(__doc__, version=VERSION)
+    try:
+        clauses = constraints.parse(args['<constraints>'])
+    except constraints.ConstraintError as e:
+        sys.exit(str(e))
+    seed = None if args['-s'] is None else int(args['-s'])
+    count = int(args['-n'])
+    opts = (int(args['-j']), int(args['-b']), int(args['-m']), seed, args['--deal'])
+    if args['-o']:
+        with open(args['-o'], 'wt', buffering=1 << 16) as f:
+            written, tried = write_hands(f, clauses, count, *opts)
+    else:
+        written, tried = write_hands(sys.stdout, clauses, count, *opts)
+    print(f'{written} hands from {tried} deals', file=sys.stderr)
+    if written < count:
+        sys.exit(1)
+
+
+def write_hands(f: TextIO, clauses: constraints.Constraints, count: int, jobs: int,
+                batch: int, max_tried: int, seed: Optional[int],
+                deal: bool) -> tuple[int, int]:
+    """Write count hands to f as they are dealt, trying at most about
+    max_tried deals. Return the number of hands written and deals tried."""
+    written = 0
+    tried = 0
+    for b in generate(clauses, jobs, batch, seed, deal):
+        tried += b.tried
+        out: list[str] = []
+        for i, cards in enumerate(b.cards[:count - written]):
+            comment = b.deals[i] if deal else ''
+            out.append(format_hand(cards, comment))
+        f.write(''.join(out))
+        written += len(out)
+        if written == count or tried >= max_tried:
+            break
+    return written, tried
+
+
+def generate(clauses: constraints.Constraints, jobs: int, batch: int,
+             seed: Optional[int], deal: bool):
+    """Yield a Batch for each batch of candidates, in order. With more
+    than one job, a few batches are kept running ahead."""
+    seeds = np.random.SeedSequence(seed)
+    if jobs == 1:
+        while True:
+            yield deal_batch(clauses, batch, seeds.spawn(1)[0], deal)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        running: list[Future] = []
+        try:
+            while True:
+                while len(running) < 2 * jobs:
+                    running.append(pool.submit(deal_batch, clauses, batch,
+                                               seeds.spawn(1)[0], deal))
+                yield running.pop(0).result()
+        finally:
+            for fut in running:
+                fut.cancel()
+
+
+def deal_batch(clauses: constraints.Constraints, batch: int,
+               seed: np.random.SeedSequence, deal: bool) -> Batch:
+    """Deal batch candidate hands for South and keep the ones that
+    match. South gets the 13 cards with the smallest random keys."""
+    rng = np.random.default_rng(seed)
+    keys = rng.integers(0, 1 << 32, (batch, 52), dtype=np.uint32)
+    south = keys <= np.partition(keys, 12, axis=1)[:, 12:13]
+    ok = south.sum(axis=1, dtype=np.uint8) == 13  # a tie at the 13th key gives 14 cards
+    ok &= accept(clauses, south)
+    hands = south[ok]
+    masks = hands.reshape(-1, 4, 13) @ SUIT_BITS
+    cards = (masks[:, 0] | masks[:, 1] << 13 | masks[:, 2] << 26 | masks[:, 3] << 39).tolist()
+    deals: list[str] = []
+    if deal:
+        # The other 39 cards, shuffled and split among West, North and East.
+        rest = np.nonzero(~hands)[1].reshape(-1, 39)
+        rest = rng.permuted(rest, axis=1)
+        for h, r in zip(hands, rest):
+            seats = [np.flatnonzero(h), np.sort(r[:13]), np.sort(r[13:26]), np.sort(r[26:])]
+            deals.append('S:' + ' '.join(pbn_hand(s) for s in seats))
+    return Batch(cards, deals, batch)
+
+
+def accept(clauses: constraints.Constraints, south: np.ndarray) -> np.ndarray:
+    "Return a mask of the hands (rows of south) that match the clauses."
+    suits = south.reshape(-1, 4, 13)
+    lengths = suits.sum(axis=2, dtype=np.uint8)
+    feats: dict[str, np.ndarray] = {}
+
+    def feature(name: str) -> np.ndarray:
+        # Only compute what the clauses ask for.
+        if name not in feats:
+            if name == 'hcp':
+                feats[name] = south @ HCP_WEIGHTS
+            elif name == 'controls':
+                feats[name] = south @ CONTROL_WEIGHTS
+            elif name == 'losers':
+                n = np.minimum(lengths, 3)
+                won = (suits[:, :, 12].astype(np.uint8) + (suits[:, :, 11] & (n >= 2))
+                       + (suits[:, :, 10] & (n >= 3)))
+                feats[name] = (n - won).sum(axis=1)
+            elif name == 'major':
+                feats[name] = lengths[:, :2].max(axis=1)
+            elif name == 'minor':
+                feats[name] = lengths[:, 2:].max(axis=1)
+            elif name == 'shape':
+                codes = lengths.astype(np.intp) @ np.array([2744, 196, 14, 1])
+                feats[name] = SHAPE_IDS[codes]
+            else:
+                feats[name] = lengths[:, ('spades', 'hearts', 'diamonds', 'clubs').index(name)]
+        return feats[name]
+
+    ok = np.ones(len(south), dtype=bool)
+    for clause in clauses:
+        any_ok = np.zeros(len(south), dtype=bool)
+        for cond in clause:
+            if cond.feature == 'shape':
+                ids = [SHAPE_NAMES.index(s) for s in cond.shapes]
+                any_ok |= np.isin(feature('shape'), ids)
+            else:
+                values = feature(cond.feature)
+                any_ok |= (values >= cond.lo) & (values <= cond.hi)
+        ok &= any_ok
+    return ok
+
+
+def format_hand(cards: int, comment: str) -> str:
+    "A hand as mkhands.print_hand writes it; a void is '-'."
+    masks = handeval.suit_masks(cards)
+    suits = '\n'.join(handeval.decode_suit(m, 0) for m in masks)
+    return f'\nHand: # {comment}\n\n{suits}\n\n\n'
+
+
+def pbn_hand(cards: np.ndarray) -> str:
+    "Sorted card numbers to PBN, e.g. 'AK5.QJ2.T98.7654'."
+    suits = [''.join(PBN_RANKS[c % 13] for c in reversed(cards[(cards // 13) == s].tolist()))
+             for s in range(4)]
+    return '.'.join(suits)
+
+
+if __name__ == '__main__':
+    main()
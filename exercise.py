@@ -1,47 +1,93 @@
 
 import logging
-import random
+import re
 import sys
-from collections import Counter
-from typing import TextIO
+from typing import Callable, Iterator, NamedTuple, Optional, TextIO, Union
+import bids
+import handeval
+from handeval import decode_suit, encode_suit
 
 
 SUIT_SYMS = "\u2660\u2665\u2666\u2663"
+DEALERS = ('N', 'E', 'S', 'W')
+VULNERABLE = ('NONE', 'N-S', 'E-W', 'BOTH')
+# Deleting these from the codes with bytes.translate leaves the marked calls.
+UNMARKED = bytes(range(bids.MARK))
+
+
+class ParseError(Exception):
+    "A broken exercise or question, and the line of the file it starts on."
+    msg: str
+    fname: str
+    line: int
+
+    def __init__(self, msg: str, fname: str = '', line: int = 0):
+        super().__init__(f'{fname}:{line}: {msg}' if fname else msg)
+        self.msg = msg
+        self.fname = fname
+        self.line = line
 
 
 class Answer:
-    bid: str
+    __slots__ = ('code', 'expl')
+    code: int  # see bids.py
     expl: list[str]
 
-    def __init__(self, bid: str, expl: list[str]):
-        self.bid = bid
+    def __init__(self, bid: Union[str, int], expl: list[str]):
+        "bid is a call, e.g. '1NT', or its code."
+        self.code = bid if isinstance(bid, int) else bids.encode(bid)
         self.expl = expl
 
+    @property
+    def bid(self) -> str:
+        return bids.NAMES[self.code]
 
-class Hand:
-    suits: list[str]
 
-    def __init__(self, f: TextIO):
+class Hand(handeval.HandFeatures):
+    __slots__ = ('cards', 'spots')
+    # Bit 13 * suit + rank is set for each card we hold. Suit 0 is spades,
+    # and rank 0 is the 2. Cards written as 'x' are counted in spots,
+    # four bits per suit.
+    cards: int
+    spots: int
+
+    def __init__(self, f: Optional[TextIO] = None):
         "Read suits from f. There may be leading blank lines."
-        self.suits = []
+        self.cards = 0
+        self.spots = 0
+        if f is None:
+            return
+        suits: list[str] = []
         while True:
             line = get_line(f)
             line = line.rstrip()
             if line == '':
                 continue
             line = line.upper()
-            line = replace_xs(line)
-            self.suits.append(line)
-            if len(self.suits) == 4:
+            suits.append(line)
+            if len(suits) == 4:
                 break
-        # We should have exactly 13 cards.
-        cards = 0
-        for suit in self.suits:
-            fld = suit.split()
-            if fld[0] == '-':
-                continue
-            cards += len(fld)
-        assert cards == 13
+        check_cards(suits)
+        self.suits = suits
+
+    @property
+    def suits(self) -> list[str]:
+        return [decode_suit(self.suit_mask(i), self.suit_spots(i)) for i in range(4)]
+
+    @suits.setter
+    def suits(self, suits: list[str]) -> None:
+        self.cards = 0
+        self.spots = 0
+        for i, suit in enumerate(suits):
+            mask, spots = encode_suit(suit)
+            self.cards |= mask << (13 * i)
+            self.spots |= spots << (4 * i)
+
+    def suit_mask(self, i: int) -> int:
+        return (self.cards >> (13 * i)) & 0x1fff
+
+    def suit_spots(self, i: int) -> int:
+        return (self.spots >> (4 * i)) & 0xf
 
     def __str__(self) -> str:
         ss: list[str] = []
@@ -54,22 +100,36 @@ class Hand:
         return '\n'.join(ss)
 
 
+class Step(NamedTuple):
+    "What is shown and graded for one answer. It never changes once made."
+    before: bytes             # the codes of the calls before the answer
+    lines: tuple[str, ...]    # those calls and a '?', four to a line from North
+    answer: Answer
+
+
 class Exercise:
+    __slots__ = ('valid', 'keys', 'info', 'dealer', 'vulnerable', 'hand',
+                 'codes', 'answers', 'compiled')
     valid: bool
-    keys: list[str]
+    keys: tuple[str, ...]
     info: list[str]
     dealer: str
     vulnerable: str
     hand: Hand
-    auction: list[str]
+    codes: bytes  # the auction, one code per call, see bids.py
     answers: list[Answer]
+    compiled: Optional[tuple[Step, ...]]
 
-    def __init__(self, f: TextIO):
+    def __init__(self, f: Optional[TextIO] = None):
+        "Read the next exercise from f. With no file, make an empty one."
         self.valid = True
-        self.keys = []
+        self.keys = ()
         self.info = []
-        self.auction = []
+        self.codes = b''
         self.answers = []
+        self.compiled = None
+        if f is None:
+            return
         while True:
             line = get_line(f, allow_eof=True)
             if line == ')EOF(':
@@ -84,21 +144,21 @@ class Exercise:
         while True:
             line = get_line(f)
             line = line.rstrip()
-            print('line:', line)
-            logging.debug('line: ' + line)
+            logging.debug('line: %s', line)
             if line.startswith('Keys:'):
-                fld = line.split()
-                self.keys = fld[1:]
+                self.keys = intern_keys(line.split()[1:])
             elif line.startswith('Dealer'):
                 fld = line.split()
                 d = fld[1].upper()
-                assert d in ('N', 'S', 'E', 'W')
-                self.dealer = d
+                if d not in DEALERS:
+                    raise ParseError(f'bad dealer {fld[1]!r}')
+                self.dealer = sys.intern(d)
             elif line.startswith('Vulnerable:'):
                 fld = line.split()
                 v = fld[1].upper()
-                assert v in ('N-S', 'E-W', 'BOTH', 'NONE')
-                self.vulnerable = v
+                if v not in VULNERABLE:
+                    raise ParseError(f'bad vulnerability {fld[1]!r}')
+                self.vulnerable = sys.intern(v)
             elif line.startswith('Info:'):
                 self.store_info(f)
             elif line.startswith('Hand:'):
@@ -107,15 +167,16 @@ class Exercise:
                 # WE should have a blank line next.
                 line = get_line(f)
                 line = line.rstrip()
-                assert line == ''
+                if line != '':
+                    raise ParseError('no blank line after the hand')
             elif line.startswith('Auction:'):
                 self.store_auction(f)
             elif line.startswith('Answers:'):
                 self.store_answers(f)
+                check_answers(self)
                 break
             else:
-                logging.debug('Invalid line: ' + line)
-                sys.exit(1)
+                raise ParseError(f'invalid line {line!r}')
 
     def store_info(self, f: TextIO) -> None:
         # print('store info...')
@@ -126,21 +187,41 @@ class Exercise:
             if line == '':
                 break
             self.info.append(line)
-        assert len(self.info) <= 4
+        if len(self.info) > 4:
+            raise ParseError('more than 4 lines of info')
 
     def store_auction(self, f: TextIO) -> None:
         line = get_line(f)
-        assert 'N' in line
+        if 'N' not in line:
+            raise ParseError('no N E S W line in the auction')
         line = get_line(f)
-        assert line.startswith('---')
+        if not line.startswith('---'):
+            raise ParseError('no ---- line in the auction')
+        auction: list[str] = []
         while True:
             line = get_line(f)
             line = line.rstrip()
             if line == '':
                 break
-            fld = line.split()
-            for bid in fld:
-                self.auction.append(bid.upper())
+            auction += line.split()
+        self.auction = auction
+
+    @property
+    def auction(self) -> list[str]:
+        "The calls, e.g. ['-', '1NT', 'PASS', '*2S']."
+        return bids.names(self.codes)
+
+    @auction.setter
+    def auction(self, calls: list[str]) -> None:
+        self.codes = bids.encode_calls(calls)
+
+    @property
+    def steps(self) -> tuple[Step, ...]:
+        """A step for each answer. They are made when first asked for,
+        not while a big file is loading, and kept."""
+        if self.compiled is None:
+            self.compiled = compile_steps(self.codes, self.answers)
+        return self.compiled
 
     def store_answers(self, f: TextIO) -> None:
         while True:
@@ -150,10 +231,294 @@ class Exercise:
             fld = line.split()
             bid = fld[1].upper()
             expl = read_paragraph(f)
-            assert len(expl) <= 4
+            if len(expl) > 4:
+                raise ParseError(f'more than 4 lines explaining {bid}')
             self.answers.append(Answer(bid, expl))
 
 
+def read_file(fname: str, check: Optional[Callable[[Exercise], None]] = None) -> list[Exercise]:
+    """Parse every exercise in the file fname. Broken ones, and those
+    check rejects, are logged and skipped. See parse_exercises."""
+    errors: list[ParseError] = []
+    with open(fname) as f:
+        ex_list = list(parse_exercises(f.read(), fname, errors, check=check))
+    for e in errors:
+        logging.warning(str(e))
+    logging.debug('%s: %d exercises', fname, len(ex_list))
+    return ex_list
+
+
+# The usual layout of an exercise, as in template.txt. Exercises laid
+# out some other way are parsed a line at a time by exercise_from_lines.
+EXERCISE_RE = re.compile(r"""
+    ---.*\n
+    Keys:(?P<keys>.*)\n
+    Dealer\S*[ \t]+(?P<dealer>\S+).*\n
+    Vulnerable:[ \t]+(?P<vuln>\S+).*\n
+    Info:.*\n
+    (?P<info>(?:[ \t]*\S.*\n)*)[ \t]*\n
+    Hand:.*\n
+    (?:[ \t]*\n)*
+    (?P<hand>(?:[ \t]*\S.*\n){4})[ \t]*\n
+    Auction:.*\n
+    .*N.*\n
+    ---.*\n
+    (?P<auction>(?:[ \t]*\S.*\n)*)[ \t]*\n
+    Answers:.*\n
+    (?P<answers>(?:(?!===).*\n)*)
+    ===.*""", re.VERBOSE)
+ANSWER_RE = re.compile(r'^\S+[ \t]+(\S+).*\n((?:[ \t]*\S.*\n)*)', re.MULTILINE)
+START_RE = re.compile(r'^---', re.MULTILINE)
+# An exercise starts with '-----'. The auction's '---- ----' line doesn't.
+RESYNC_RE = re.compile(r'^-----', re.MULTILINE)
+END_RE = re.compile(r'^===.*', re.MULTILINE)
+COMMENT_RE = re.compile(r'^#.*\n?', re.MULTILINE)
+
+
+def parse_exercises(text: str, fname: str = '', errors: Optional[list[ParseError]] = None,
+                    first_line: int = 1,
+                    check: Optional[Callable[[Exercise], None]] = None) -> Iterator[Exercise]:
+    """Parse the exercises in text, which is a whole file, or the part
+    of one starting at first_line.
+    This gives the same results as calling Exercise(f) until EOF,
+    but matches each exercise with one regular expression instead
+    of reading the file a line at a time.
+    A broken exercise raises ParseError. If there is a list of errors,
+    the error is added to it instead, and parsing goes on at the next
+    '-----' line. check may reject a parsed exercise the same way, by
+    raising ParseError."""
+    source = text
+    if '#' in text:
+        text = COMMENT_RE.sub('', text)
+    pos = 0
+    while True:
+        start = START_RE.search(text, pos)
+        if start is None:
+            return
+        try:
+            m = EXERCISE_RE.match(text, start.start())
+            if m is not None:
+                if text.find('\n-----', start.end(), m.end()) >= 0:
+                    raise ParseError('no ===== line before the next exercise')
+                ex = exercise_from_match(m)
+                pos = m.end()
+            else:
+                ex, pos = exercise_at(text, start.start())
+            if check:
+                check(ex)
+        except (ParseError, ValueError, IndexError, KeyError) as e:
+            # A KeyError is a card we don't know.
+            msg = f'bad card {e.args[0]!r}' if isinstance(e, KeyError) else str(e)
+            line = source_line(source, text.count('\n', 0, start.start())) + first_line
+            error = ParseError(msg or 'broken exercise', fname, line)
+            if errors is None:
+                raise error from None
+            errors.append(error)
+            resync = RESYNC_RE.search(text, start.end())
+            pos = resync.start() if resync else len(text)
+            continue
+        yield ex
+
+
+def exercise_at(text: str, start: int) -> tuple[Exercise, int]:
+    """Parse the exercise at start a line at a time. Return it, and where
+    it ends. It must end with a '===' line before the next exercise."""
+    end = END_RE.search(text, start)
+    if end is None:
+        raise ParseError('no ===== line at the end')
+    resync = RESYNC_RE.search(text, start + 1)
+    if resync and resync.start() < end.start():
+        raise ParseError('no ===== line before the next exercise')
+    lines = text[start:end.start()].splitlines()[1:]
+    return exercise_from_lines([line.rstrip() for line in lines]), end.end()
+
+
+def source_line(source: str, line: int) -> int:
+    "The line of source that is the line'th (from 0) once comments are removed."
+    if '#' not in source:
+        return line
+    pos = n = 0
+    for m in COMMENT_RE.finditer(source):
+        n += source.count('\n', pos, m.start())
+        pos = m.start()
+        if n > line:
+            break
+        line += 1
+    return line
+
+
+def exercise_from_match(m: re.Match) -> Exercise:
+    keys, dealer, vuln, info, hand, auction, answers = m.groups()
+    ex = Exercise()
+    ex.keys = intern_keys(keys.split())
+    ex.dealer = sys.intern(dealer.upper())
+    if ex.dealer not in DEALERS:
+        raise ParseError(f'bad dealer {dealer!r}')
+    ex.vulnerable = sys.intern(vuln.upper())
+    if ex.vulnerable not in VULNERABLE:
+        raise ParseError(f'bad vulnerability {vuln!r}')
+    ex.info = split_lines(info)
+    if len(ex.info) > 4:
+        raise ParseError('more than 4 lines of info')
+    ex.hand = Hand()
+    suits = split_lines(hand)
+    # We should have exactly 13 cards. A void is one '-'.
+    if len(hand.split()) - suits.count('-') != 13:
+        raise ParseError('the hand is not 13 cards')
+    ex.hand.suits = suits
+    ex.auction = auction.split()
+    for bid, expl in ANSWER_RE.findall(answers):
+        expl = split_lines(expl)
+        if len(expl) > 4:
+            raise ParseError(f'more than 4 lines explaining {bid}')
+        ex.answers.append(Answer(bid, expl))
+    check_answers(ex)
+    return ex
+
+
+def compile_steps(codes: bytes, answers: list[Answer]) -> tuple[Step, ...]:
+    """A step for each marked call in the auction, and its answer. The
+    lines of every step share the strings of the full lines before it."""
+    cells = [f'{bids.NAMES[code & ~bids.MARK]:6}' for code in codes]
+    rows = [''.join(cells[i:i + 4]) for i in range(0, len(cells) - len(cells) % 4, 4)]
+    marked = [pos for pos, code in enumerate(codes) if code & bids.MARK]
+    if len(marked) != len(answers):
+        raise ParseError(f'{len(marked)} marked calls but {len(answers)} answers')
+    steps = []
+    for pos, answer in zip(marked, answers):
+        row = pos // 4
+        last = ''.join(cells[4 * row:pos]) + f'{"?":6}'
+        steps.append(Step(codes[:pos], tuple(rows[:row]) + (last,), answer))
+    return tuple(steps)
+
+
+def format_exercise(ex: Exercise) -> str:
+    "The text of an exercise, laid out as in template.txt."
+    lines = ['-----', ' '.join(['Keys:', *ex.keys]), f'Dealer: {ex.dealer}',
+             f'Vulnerable: {ex.vulnerable}', 'Info:', *ex.info, '', 'Hand:',
+             *ex.hand.suits, '', 'Auction:', ' N    E    S    W', '---- ---- ---- ----']
+    auction = ex.auction
+    for i in range(0, len(auction), 4):
+        lines.append(' ' + ' '.join(f'{call:4}' for call in auction[i:i + 4]).rstrip())
+    lines += ['', 'Answers:']
+    for n, answer in enumerate(ex.answers, 1):
+        lines += [f'{n} {answer.bid}', *answer.expl, '']
+    lines += ['=====', '', '']
+    return '\n'.join(lines)
+
+
+def intern_keys(keys: list[str]) -> tuple[str, ...]:
+    "Keys repeat across a corpus, so keep one copy of each."
+    return tuple(sys.intern(key) for key in keys)
+
+
+def split_lines(text: str) -> list[str]:
+    "Split text, which ends with a newline, into rstripped lines."
+    if ' \n' in text or '\t\n' in text:
+        return [line.rstrip() for line in text.splitlines()]
+    return text.split('\n')[:-1]
+
+
+def exercise_from_lines(lines: list[str]) -> Exercise:
+    "Parse the lines of an exercise, after the '---' line and before the '===' line."
+    ex = Exercise()
+    n = len(lines)
+    i = 0
+    try:
+        while True:
+            line = lines[i]
+            i += 1
+            if line == '':
+                continue
+            if line.startswith('Keys:'):
+                ex.keys = intern_keys(line.split()[1:])
+            elif line.startswith('Dealer'):
+                ex.dealer = sys.intern(line.split()[1].upper())
+                if ex.dealer not in DEALERS:
+                    raise ParseError(f'bad dealer {ex.dealer!r}')
+            elif line.startswith('Vulnerable:'):
+                ex.vulnerable = sys.intern(line.split()[1].upper())
+                if ex.vulnerable not in VULNERABLE:
+                    raise ParseError(f'bad vulnerability {ex.vulnerable!r}')
+            elif line.startswith('Info:'):
+                j = lines.index('', i)
+                ex.info = lines[i:j]
+                if len(ex.info) > 4:
+                    raise ParseError('more than 4 lines of info')
+                i = j + 1
+            elif line.startswith('Hand:'):
+                while lines[i] == '':
+                    i += 1
+                suits = lines[i:i + 4]
+                if len(suits) != 4 or '' in suits:
+                    raise ParseError('the hand is not 4 suits')
+                check_cards(suits)
+                ex.hand = Hand()
+                ex.hand.suits = suits
+                i += 4
+                # We should have a blank line next.
+                if lines[i] != '':
+                    raise ParseError('no blank line after the hand')
+                i += 1
+            elif line.startswith('Auction:'):
+                if 'N' not in lines[i]:
+                    raise ParseError('no N E S W line in the auction')
+                if not lines[i + 1].startswith('---'):
+                    raise ParseError('no ---- line in the auction')
+                j = lines.index('', i + 2)
+                ex.auction = ' '.join(lines[i + 2:j]).split()
+                i = j + 1
+            elif line.startswith('Answers:'):
+                store_answers(ex, lines[i:n])
+                check_answers(ex)
+                return ex
+            else:
+                raise ParseError(f'invalid line {line!r}')
+    except (IndexError, ValueError) as e:
+        if isinstance(e, bids.BidError):
+            raise
+        # We ran off the end of the exercise.
+        raise ParseError('unexpected end of exercise') from None
+
+
+def store_answers(ex: Exercise, lines: list[str]) -> None:
+    "Store the answers and explanations in lines, separated by blank lines."
+    n = len(lines)
+    i = 0
+    while i < n:
+        if lines[i] == '':
+            i += 1
+            continue
+        bid = lines[i].split()[1].upper()
+        j = i + 1
+        while j < n and lines[j] != '':
+            j += 1
+        expl = lines[i + 1:j]
+        if len(expl) > 4:
+            raise ParseError(f'more than 4 lines explaining {bid}')
+        ex.answers.append(Answer(bid, expl))
+        i = j
+
+
+def check_answers(ex: Exercise) -> None:
+    "There should be an answer for each marked call."
+    marked = len(ex.codes.translate(None, UNMARKED))
+    if marked != len(ex.answers):
+        raise ParseError(f'{marked} marked calls but {len(ex.answers)} answers')
+
+
+def check_cards(suits: list[str]) -> None:
+    "We should have exactly 13 cards."
+    cards = 0
+    for suit in suits:
+        fld = suit.split()
+        if fld[0] == '-':
+            continue
+        cards += len(fld)
+    if cards != 13:
+        raise ParseError('the hand is not 13 cards')
+
+
 def get_line(f: TextIO, allow_eof=False) -> str:
     "Return the next 'rstripped' non-comment line."
     while True:
@@ -161,62 +526,13 @@ def get_line(f: TextIO, allow_eof=False) -> str:
         if line == '':
             if allow_eof:
                 return ')EOF('
-            else:
-                logging.fatal('Unexpected EOF.')
-                sys.exit(1)
+            raise ParseError('unexpected end of file')
         if line.startswith('#'):
             continue
         line = line.rstrip()
         return line
 
 
-def decode_auction(raw: str, dealer: str) -> list[str]:
-    bids: list[str] = []
-    i = 0
-    while i < len(raw):
-        c = raw[i]
-        i += 1
-        if c == 'p':
-            bids.append('Pass')
-        elif c == 'x':
-            bids.append('Dbl')
-        elif c == 'r':
-            bids.append('Rdbl')
-        elif c in '1234567':
-            c2 = raw[i]
-            i += 1
-            if c2 in 'shdc':
-                bids.append(c + c2.upper())
-            elif c2 == 'n':
-                bids.append(c + 'NT')
-            else:
-                print('BAD auction:', raw)
-                assert False
-        else:
-            print('BAD auction:', raw)
-            assert False
-    return bids
-
-
-def replace_xs(suit: str) -> str:
-    "Replace, e.g., 'A K x x x' with random low cards: 'A K 9 5 3'"
-    cards = ['2', '3', '4', '5', '6', '7', '8', '9']
-    random.shuffle(cards)
-    d = dict(Counter(suit))
-    if 'x' not in d:
-        return suit
-    n = d['x']
-    cards = cards[0:n]  # get one card for each 'x in the string
-    cards.sort()  # sort them ascending
-    new = ''
-    for c in suit:
-        if c != 'x':
-            new += c.upper()
-        else:
-            new += cards.pop()  # replace 'x' with largest remaining card
-    return new
-
-
 def read_paragraph(f: TextIO) -> list[str]:
     "Return lines from the file down to the first blank line."
     para: list[str] = []
@@ -0,0 +1,105 @@
+"""
+grading.py: Check the student's calls against the answers, with no
+screen. quiz.py grades with this on screen and for --replay.
+"""
+
+
+from collections.abc import Collection, Iterable, Sequence
+from typing import TextIO
+import bids
+import corpus
+from exercise import Exercise
+
+
+class ReplayError(Exception):
+    pass
+
+
+class Score:
+    "Calls answered and right, so far."
+    answers: int
+    right: int
+
+    def __init__(self) -> None:
+        self.answers = 0
+        self.right = 0
+
+    def check(self, bid: int, code: int, allowed: Collection[int] = ()) -> bool:
+        """Count one call. Return True if it is the answer, or one of the
+        calls allowed as well (see system.System.allowed)."""
+        self.answers += 1
+        if bid == code or bid in allowed:
+            self.right += 1
+            return True
+        return False
+
+    def __str__(self) -> str:
+        pct = self.right / self.answers if self.answers else 0.0
+        return f'Total: {self.answers}  Correct: {self.right}  Score: {100 * pct:2.0f}%'
+
+
+def bid_error(before: bytes, dealer: int, bid: int) -> str:
+    "Why bid can't follow the calls before it, or '' if it can."
+    for pos, msg in bids.auction_errors(before + bytes([bid]), dealer):
+        if pos == len(before):
+            return msg
+    return ''
+
+
+def answer_codes(exercises: Sequence[Exercise]) -> list[bytes]:
+    "The answer codes of each exercise. A corpus is not decoded."
+    if isinstance(exercises, corpus.Corpus):
+        return [answers for _, _, answers in exercises.auctions()]
+    return [bytes(a.code for a in ex.answers) for ex in exercises]
+
+
+def grade(answers: bytes, calls: Sequence[int]) -> int:
+    "Return a bitmask of the calls that match the answers."
+    right = 0
+    for i, (want, call) in enumerate(zip(answers, calls)):
+        if want == call:
+            right |= 1 << i
+    return right
+
+
+def replay(answers: list[bytes], ids: Sequence[int], lines: Iterable[str],
+           out: TextIO) -> Score:
+    """Grade a line of calls, e.g. '1NT p X', for each exercise in ids.
+    A short line, or fewer lines than exercises, means the student stopped
+    early; the rest are not graded. Write a line for each exercise graded:
+    its number, right/answered, and answer:call for each miss."""
+    score = Score()
+    # Most calls are typed all in lower case or all in upper case.
+    codes = {name: code for name, code in bids.CODES.items() if code != bids.PAD}
+    codes.update({name.lower(): code for name, code in codes.items()})
+    names = bids.NAMES
+    results: list[str] = []
+    count = 0
+    for count, line in enumerate(lines, 1):
+        if len(results) >= 4096:
+            out.write('\n'.join(results) + '\n')
+            results = []
+        if count > len(ids):
+            raise ReplayError(f'line {count}: more lines than the {len(ids)} exercises')
+        try:
+            calls = bytes([codes[call] if call in codes else codes[call.upper()]
+                           for call in line.split()])
+        except KeyError as e:
+            raise ReplayError(f'line {count}: bad call {e.args[0]!r}') from None
+        n = ids[count - 1]
+        want = answers[n]
+        answered = len(calls)
+        if answered > len(want):
+            raise ReplayError(f'line {count}: {answered} calls for {len(want)} answers')
+        score.answers += answered
+        if calls == want[:answered]:
+            score.right += answered
+            results.append(f'{n + 1} {answered}/{answered}')
+            continue
+        right_count = bin(grade(want, calls)).count('1')
+        score.right += right_count
+        misses = ''.join(f' {names[w]}:{names[c]}' for w, c in zip(want, calls) if w != c)
+        results.append(f'{n + 1} {right_count}/{answered}{misses}')
+    if results:
+        out.write('\n'.join(results) + '\n')
+    return score
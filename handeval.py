@@ -0,0 +1,195 @@
+
+from collections.abc import Sequence
+import numpy as np
+
+
+# Hands are a 52-bit mask, 13 bits per suit (spades in the low bits,
+# bit 0 of a suit is the 2), plus a count of unnamed low cards ('x') per suit,
+# four bits per suit. See exercise.Hand. Everything here is a table
+# lookup on one suit's 13 bits, so a hand costs four lookups. For many
+# hands, evaluate_many does the lookups with numpy arrays.
+
+RANKS = ('2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A')
+CARD_BITS = {rank: 1 << r for r, rank in enumerate(RANKS)}
+CARD_BITS['T'] = CARD_BITS['10']
+
+ACE = 1 << 12
+KING = 1 << 11
+QUEEN = 1 << 10
+JACK = 1 << 9
+
+POPCOUNT = bytes(bin(m).count('1') for m in range(1 << 13))
+HCP = bytes(4 * bool(m & ACE) + 3 * bool(m & KING) + 2 * bool(m & QUEEN) + bool(m & JACK)
+            for m in range(1 << 13))
+CONTROLS = bytes(2 * bool(m & ACE) + bool(m & KING) for m in range(1 << 13))
+# Losing trick count: with n = min(3, length), count the top n cards
+# that aren't the ace, king or queen. x's are low, so they never
+# push an honour out of the top n.
+AKQ = bytes((m >> 10) & 7 for m in range(1 << 13))  # bit 2 ace, 1 king, 0 queen
+LOSERS = bytes(max(0, min(3, n) - bool(akq & 4) - (n >= 2 and bool(akq & 2))
+                   - (n >= 3 and bool(akq & 1)))
+               for n in range(14) for akq in range(8))  # index 8 * length + akq
+
+BALANCED = 'balanced'
+SEMI_BALANCED = 'semi-balanced'
+TWO_SUITER = 'two-suiter'
+THREE_SUITER = 'three-suiter'
+ONE_SUITER = 'one-suiter'
+
+
+def shape_class(pattern: tuple[int, ...]) -> str:
+    "pattern is the suit lengths, longest first."
+    if pattern in ((4, 3, 3, 3), (4, 4, 3, 2), (5, 3, 3, 2)):
+        return BALANCED
+    if pattern in ((5, 4, 2, 2), (6, 3, 2, 2)):
+        return SEMI_BALANCED
+    if pattern[2] >= 4 or pattern == (5, 4, 4, 0):
+        return THREE_SUITER
+    if pattern[0] >= 5 and pattern[1] >= 4:
+        return TWO_SUITER
+    return ONE_SUITER
+
+
+# Every way to split 13 cards into four suits, and its class.
+SHAPES: dict[tuple[int, ...], str] = {}
+for _a in range(14):
+    for _b in range(14 - _a):
+        for _c in range(14 - _a - _b):
+            _p = tuple(sorted((_a, _b, _c, 13 - _a - _b - _c), reverse=True))
+            SHAPES[_p] = shape_class(_p)
+
+
+def encode_suit(suit: str) -> tuple[int, int]:
+    "Return a mask of the named cards in suit (bit 0 is the 2) and the number of x's."
+    mask = 0
+    spots = 0
+    for card in suit.upper().split():
+        if card == 'X':
+            spots += 1
+        elif card != '-':
+            mask |= CARD_BITS[card]
+    return mask, spots
+
+
+def decode_suit(mask: int, spots: int) -> str:
+    "The inverse of encode_suit: 'A K 10 X X', or '-' for a void."
+    cards = [RANKS[r] for r in range(12, -1, -1) if mask & (1 << r)]
+    cards += ['X'] * spots
+    if not cards:
+        return '-'
+    return ' '.join(cards)
+
+
+def suit_masks(cards: int) -> tuple[int, int, int, int]:
+    return (cards & 0x1fff, (cards >> 13) & 0x1fff, (cards >> 26) & 0x1fff, cards >> 39)
+
+
+def suit_spots(spots: int) -> tuple[int, int, int, int]:
+    return (spots & 0xf, (spots >> 4) & 0xf, (spots >> 8) & 0xf, spots >> 12)
+
+
+def lengths(cards: int, spots: int = 0) -> tuple[int, int, int, int]:
+    "Suit lengths, spades first."
+    s, h, d, c = suit_masks(cards)
+    xs, xh, xd, xc = suit_spots(spots)
+    return (POPCOUNT[s] + xs, POPCOUNT[h] + xh, POPCOUNT[d] + xd, POPCOUNT[c] + xc)
+
+
+def hcp(cards: int) -> int:
+    s, h, d, c = suit_masks(cards)
+    return HCP[s] + HCP[h] + HCP[d] + HCP[c]
+
+
+def controls(cards: int) -> int:
+    s, h, d, c = suit_masks(cards)
+    return CONTROLS[s] + CONTROLS[h] + CONTROLS[d] + CONTROLS[c]
+
+
+def losers(cards: int, spots: int = 0) -> int:
+    total = 0
+    for mask, n in zip(suit_masks(cards), lengths(cards, spots)):
+        total += LOSERS[8 * n + AKQ[mask]]
+    return total
+
+
+def shape(cards: int, spots: int = 0) -> str:
+    return SHAPES[tuple(sorted(lengths(cards, spots), reverse=True))]
+
+
+class HandFeatures:
+    """The features of a hand, for a class with cards and spots as in
+    exercise.Hand."""
+    __slots__ = ()
+    cards: int
+    spots: int
+
+    @property
+    def hcp(self) -> int:
+        return hcp(self.cards)
+
+    @property
+    def lengths(self) -> tuple[int, int, int, int]:
+        return lengths(self.cards, self.spots)
+
+    @property
+    def shape(self) -> str:
+        return shape(self.cards, self.spots)
+
+    @property
+    def losers(self) -> int:
+        return losers(self.cards, self.spots)
+
+    @property
+    def controls(self) -> int:
+        return controls(self.cards)
+
+
+# The tables again, as arrays, to look up many hands at once.
+POPCOUNT_ARRAY = np.frombuffer(POPCOUNT, np.uint8)
+HCP_ARRAY = np.frombuffer(HCP, np.uint8)
+CONTROLS_ARRAY = np.frombuffer(CONTROLS, np.uint8)
+AKQ_ARRAY = np.frombuffer(AKQ, np.uint8)
+LOSERS_ARRAY = np.frombuffer(LOSERS, np.uint8)
+SUIT_SHIFTS = np.arange(0, 52, 13, dtype=np.uint64)
+SPOT_SHIFTS = np.arange(0, 16, 4, dtype=np.uint16)
+# A pattern's class, by 196 * longest + 14 * second + third.
+SHAPE_CLASSES = (BALANCED, SEMI_BALANCED, TWO_SUITER, THREE_SUITER, ONE_SUITER)
+SHAPE_NAMES = np.array(SHAPE_CLASSES, dtype=object)
+SHAPE_CLASS = np.zeros(14 ** 3, np.uint8)
+for _p, _name in SHAPES.items():
+    SHAPE_CLASS[196 * _p[0] + 14 * _p[1] + _p[2]] = SHAPE_CLASSES.index(_name)
+
+
+class HandTable:
+    "The features of many hands, one array per feature, in the hands' order."
+    hcp: np.ndarray
+    controls: np.ndarray
+    losers: np.ndarray
+    lengths: np.ndarray  # a row per hand, spades first
+    shapes: np.ndarray   # the shape class names
+
+    def __init__(self, hcp: np.ndarray, controls: np.ndarray, losers: np.ndarray,
+                 lengths: np.ndarray, shapes: np.ndarray):
+        self.hcp = hcp
+        self.controls = controls
+        self.losers = losers
+        self.lengths = lengths
+        self.shapes = shapes
+
+
+def evaluate_many(cards: Sequence[int], spots: Sequence[int]) -> HandTable:
+    """Evaluate a whole corpus of hands at once, by indexing the tables
+    with arrays. cards and spots may be arrays as spotfill.hand_arrays
+    makes them."""
+    cards = np.asarray(cards, np.uint64)
+    spots = np.asarray(spots, np.uint16)
+    masks = ((cards[:, None] >> SUIT_SHIFTS) & 0x1fff).astype(np.intp)
+    lens = POPCOUNT_ARRAY[masks] + ((spots[:, None] >> SPOT_SHIFTS) & 0xf).astype(np.uint8)
+    pattern = -np.sort(-lens.astype(np.intp), axis=1)
+    return HandTable(HCP_ARRAY[masks].sum(axis=1, dtype=np.uint8),
+                     CONTROLS_ARRAY[masks].sum(axis=1, dtype=np.uint8),
+                     LOSERS_ARRAY[8 * lens.astype(np.intp) + AKQ_ARRAY[masks]].sum(
+                         axis=1, dtype=np.uint8),
+                     lens,
+                     SHAPE_NAMES[SHAPE_CLASS[196 * pattern[:, 0] + 14 * pattern[:, 1]
+                                             + pattern[:, 2]]])
@@ -0,0 +1,247 @@
+"""
+history.py: Remember how the student did on each exercise, and choose
+the next exercise to show, SM-2 style.
+
+The answer log is append-only. Each time an exercise is shown, one
+fixed-size record is added: the exercise id, the time, how many of its
+calls were answered, and which of them were right. An exercise id is
+a hash of the exercise's content (hand, auction, answers), so it stays
+the same when files are renamed, merged or compiled into a corpus,
+and when an explanation is reworded. Only the first RIGHT_BITS calls
+of an exercise are logged.
+"""
+
+
+import hashlib
+import heapq
+import os
+import struct
+import time
+from collections.abc import Sequence
+from typing import Iterator, Optional
+import numpy as np
+import corpus
+from exercise import DEALERS, VULNERABLE, Exercise
+
+
+ID_SIZE = 8
+# An exercise too long for a corpus record is hashed in this form: the
+# fields of corpus.CONTENT, but with 0xff first, which no dealer is,
+# and then the whole auction and answers.
+LONG_CONTENT = struct.Struct('<BBBII4H4B')
+# exercise id, time in seconds, calls answered, right calls as a bitmask
+LOG_RECORD = struct.Struct(f'<{ID_SIZE}sIHQ')
+LOG_DTYPE = np.dtype([('id', '<u8'), ('when', '<u4'), ('answered', '<u2'), ('right', '<u8')])
+RIGHT_BITS = 64
+BIT_COUNT = np.array([bin(i).count('1') for i in range(256)], np.int64)
+DAY = 24 * 60 * 60
+
+# SM-2
+START_EASE = 2.5
+MIN_EASE = 1.3
+PASS_GRADE = 3
+
+
+def exercise_id(content: bytes) -> bytes:
+    "The id of an exercise, from corpus.encode_content() or Corpus.contents()."
+    return hashlib.blake2b(content, digest_size=ID_SIZE).digest()
+
+
+def exercise_ids(exercises: Sequence[Exercise]) -> list[bytes]:
+    "The ids of exercises, in order. A corpus is not decoded."
+    if isinstance(exercises, corpus.Corpus):
+        contents: Iterator[bytes] = exercises.contents()
+    else:
+        contents = (content(ex) for ex in exercises)
+    return [exercise_id(c) for c in contents]
+
+
+def content(ex: Exercise) -> bytes:
+    """What exercise_id hashes for ex: corpus.encode_content(ex), or
+    LONG_CONTENT for an exercise too long for a corpus."""
+    if len(ex.codes) <= corpus.MAX_AUCTION and len(ex.answers) <= corpus.MAX_ANSWERS:
+        return corpus.encode_content(ex)
+    hand = ex.hand
+    return LONG_CONTENT.pack(0xff, DEALERS.index(ex.dealer), VULNERABLE.index(ex.vulnerable),
+                             len(ex.codes), len(ex.answers),
+                             *[hand.suit_mask(i) for i in range(4)],
+                             *[hand.suit_spots(i) for i in range(4)]) \
+        + ex.codes + bytes(a.code for a in ex.answers)
+
+
+def bit_counts(masks: np.ndarray) -> np.ndarray:
+    "The number of bits set in each of an array of 64-bit masks."
+    octets = np.ascontiguousarray(masks, '<u8').view('u1').reshape(-1, 8)
+    return BIT_COUNT[octets].sum(axis=1)
+
+
+def grade(answered: int, right: int) -> int:
+    "SM-2 quality, 0 to 5, from the number of calls answered and right."
+    return 5 * right // answered if answered else 0
+
+
+def sm2(ease: float, reps: int, interval: int, quality: int) -> tuple[float, int, int]:
+    "One SM-2 review. Return the new ease, reps and interval in days."
+    if quality < PASS_GRADE:
+        reps = 0
+        interval = 1
+    else:
+        reps += 1
+        interval = 1 if reps == 1 else 6 if reps == 2 else round(interval * ease)
+    miss = 5 - quality
+    return max(MIN_EASE, ease + 0.1 - miss * (0.08 + miss * 0.02)), reps, interval
+
+
+class Scheduler:
+    """Choose exercises: those due first, most overdue first, then those
+    never shown, in the order given. The due times are kept in a heap,
+    so each choice costs O(log n)."""
+    ids: list[bytes]
+    # The SM-2 state of each exercise
+    ease: list[float]
+    reps: list[int]        # right in a row
+    interval: list[int]    # days
+    due: list[int]         # time it should next be shown, 0 if never shown
+    heap: list[tuple[int, int]]  # due, exercise number
+    fresh: Iterator[int]         # exercises never shown
+    log: Optional['AnswerLog']
+
+    def __init__(self, ids: list[bytes], new_order: Iterator[int],
+                 log: Optional['AnswerLog'] = None):
+        "ids are the exercises' ids. new_order is the order to show new ones in."
+        self.ids = ids
+        self.log = log
+        state = log.replay(ids) if log else new_state(len(ids))
+        self.ease, self.reps, self.interval, self.due = (a.tolist() for a in state)
+        self.heap = [(due, n) for n, due in enumerate(self.due) if due]
+        heapq.heapify(self.heap)
+        self.fresh = (n for n in new_order if not self.due[n])
+
+    def __iter__(self) -> Iterator[int]:
+        return self
+
+    def __next__(self) -> int:
+        "Return the number of the next exercise to show."
+        while self.heap:
+            due, n = self.heap[0]
+            if due != self.due[n]:  # reviewed since this was pushed
+                heapq.heappop(self.heap)
+                continue
+            if due <= time.time():
+                return n
+            break
+        for n in self.fresh:
+            return n
+        raise StopIteration
+
+    def review(self, n: int, answered: int, right_mask: int) -> None:
+        "Record how exercise n went. Bit i of right_mask is set if call i was right."
+        if answered == 0:
+            return
+        when = int(time.time())
+        quality = grade(answered, bin(right_mask).count('1'))
+        self.ease[n], self.reps[n], self.interval[n] = \
+            sm2(self.ease[n], self.reps[n], self.interval[n], quality)
+        self.due[n] = when + self.interval[n] * DAY
+        heapq.heappush(self.heap, (self.due[n], n))
+        if self.log:
+            self.log.append(self.ids[n], when, answered, right_mask)
+
+
+def new_state(count: int) -> tuple[np.ndarray, ...]:
+    "ease, reps, interval and due for count exercises never shown."
+    return (np.full(count, START_EASE), np.zeros(count, np.int64),
+            np.zeros(count, np.int64), np.zeros(count, np.int64))
+
+
+class AnswerLog:
+    "The answer log file, read once and then only appended to."
+    fname: str
+
+    def __init__(self, fname: str):
+        self.fname = fname
+
+    def records(self) -> np.ndarray:
+        "Every record, as an array of LOG_DTYPE."
+        if not os.path.exists(self.fname):
+            return np.zeros(0, LOG_DTYPE)
+        with open(self.fname, 'rb') as f:
+            data = f.read()
+        # A record cut short by a crash is ignored.
+        return np.frombuffer(data, LOG_DTYPE, len(data) // LOG_DTYPE.itemsize)
+
+    def replay(self, ids: list[bytes]) -> tuple[np.ndarray, ...]:
+        """Return the SM-2 state of the exercises with these ids, as in
+        new_state. Records for other exercises are skipped."""
+        ease, reps, interval, due = new_state(len(ids))
+        log = self.records()
+        log = log[log['answered'] > 0]
+        # Group the records by exercise. A stable sort would keep each
+        # exercise's records in time order, but is 4 times slower than
+        # sorting again by group and record number.
+        order = np.argsort(log['id'])
+        log_ids = log['id'][order]
+        group = np.cumsum(np.r_[False, log_ids[1:] != log_ids[:-1]])
+        order = np.sort(group * len(log) + order) % max(len(log), 1)
+        when = log['when'][order]
+        quality = 5 * bit_counts(log['right'][order]) // log['answered'][order]
+        starts = np.flatnonzero(np.r_[True, log_ids[1:] != log_ids[:-1]])[:len(log)]
+        counts = np.diff(np.r_[starts, len(log)])
+        # Find each group's exercise number.
+        keys = np.frombuffer(b''.join(ids), '<u8')
+        by_key = np.argsort(keys)
+        pos = np.searchsorted(keys[by_key], log_ids[starts]).clip(0, max(len(ids) - 1, 0))
+        known = keys[by_key][pos] == log_ids[starts] if len(ids) else pos < 0
+        starts, counts, number = starts[known], counts[known], by_key[pos[known]]
+        # SM-2 goes through an exercise's reviews in turn, but the
+        # exercises don't depend on each other. So review the first
+        # time each exercise was shown, for all of them at once, then
+        # the second time, and so on. With the most reviewed exercises
+        # first, those still to go are always a prefix of the arrays.
+        most = np.argsort(-counts, kind='stable')
+        starts, counts, number = starts[most], counts[most], number[most]
+        e, r, i, d = new_state(len(number))
+        for k in range(counts.max(initial=0)):
+            m = np.searchsorted(-counts, -k)
+            rows = starts[:m] + k
+            q = quality[rows]
+            ok = q >= PASS_GRADE
+            r[:m] = np.where(ok, r[:m] + 1, 0)
+            i[:m] = np.where(~ok | (r[:m] == 1), 1,
+                             np.where(r[:m] == 2, 6, np.round(i[:m] * e[:m])))
+            miss = 5 - q
+            e[:m] = np.maximum(MIN_EASE, e[:m] + 0.1 - miss * (0.08 + miss * 0.02))
+            d[:m] = when[rows] + i[:m] * DAY
+        ease[number], reps[number], interval[number], due[number] = e, r, i, d
+        return ease, reps, interval, due
+
+    def misses(self, ids: list[bytes], decay: float) -> np.ndarray:
+        """How much each exercise with these ids has been missed lately:
+        the fraction of its calls missed the last time it was shown, plus
+        decay times that of the time before, and so on."""
+        misses = np.zeros(len(ids))
+        log = self.records()
+        log = log[log['answered'] > 0]
+        if len(ids) == 0 or len(log) == 0:
+            return misses
+        keys = np.frombuffer(b''.join(ids), '<u8')
+        by_key = np.argsort(keys)
+        pos = np.searchsorted(keys[by_key], log['id']).clip(0, len(ids) - 1)
+        known = keys[by_key][pos] == log['id']
+        log, number = log[known], by_key[pos[known]]
+        missed = 1 - bit_counts(log['right']) / log['answered']
+        # The log is in time order, and a stable sort keeps each
+        # exercise's records so. Count the records after each one.
+        order = np.argsort(number, kind='stable')
+        number, missed = number[order], missed[order]
+        later = np.searchsorted(number, number, side='right') - np.arange(len(number)) - 1
+        np.add.at(misses, number, missed * decay ** later)
+        return misses
+
+    def append(self, ex_id: bytes, when: int, answered: int, right_mask: int) -> None:
+        "Log a record. Calls past the first RIGHT_BITS are left out."
+        answered = min(answered, RIGHT_BITS)
+        right_mask &= (1 << RIGHT_BITS) - 1
+        # Open for each record, so nothing is lost if the quiz is killed.
+        with open(self.fname, 'ab') as f:
+            f.write(LOG_RECORD.pack(ex_id, when, answered, right_mask))
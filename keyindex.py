@@ -0,0 +1,67 @@
+
+from array import array
+from collections.abc import Iterable, Sequence
+from exercise import Exercise
+
+
+# A keyword query is a list of terms, all of which must match:
+#   stayman          exercises with the key 'stayman'
+#   !transfer        exercises without the key 'transfer'
+#   stayman|puppet   exercises with either key
+
+
+class KeyIndex:
+    "Map each key on a 'Keys:' line to the ids of its exercises."
+    ids: dict[str, array]
+    count: int
+
+    def __init__(self, count: int):
+        self.ids = {}
+        self.count = count
+
+    def add(self, key: str, n: int) -> None:
+        if key not in self.ids:
+            self.ids[key] = array('I')
+        self.ids[key].append(n)
+
+    def lookup(self, alternatives: str) -> set[int]:
+        found: set[int] = set()
+        for key in alternatives.split('|'):
+            found.update(self.ids.get(key, ()))
+        return found
+
+    def select(self, terms: Iterable[str]) -> Sequence[int]:
+        "Return the ids matching every term, in ascending order."
+        wanted: list[set[int]] = []
+        unwanted: set[int] = set()
+        for term in terms:
+            if term.startswith('!'):
+                unwanted |= self.lookup(term[1:])
+            else:
+                wanted.append(self.lookup(term))
+        if not wanted:
+            if not unwanted:
+                return range(self.count)
+            return [n for n in range(self.count) if n not in unwanted]
+        wanted.sort(key=len)
+        found = wanted[0].intersection(*wanted[1:])
+        return sorted(found - unwanted)
+
+
+def matches(keys: Sequence[str], terms: Iterable[str]) -> bool:
+    "Does an exercise with these keys match every term? See select."
+    for term in terms:
+        if term.startswith('!'):
+            if any(key in keys for key in term[1:].split('|')):
+                return False
+        elif not any(key in keys for key in term.split('|')):
+            return False
+    return True
+
+
+def build_index(ex_list: Sequence[Exercise]) -> KeyIndex:
+    index = KeyIndex(len(ex_list))
+    for n, ex in enumerate(ex_list):
+        for key in set(ex.keys):
+            index.add(key, n)
+    return index
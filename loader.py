@@ -0,0 +1,195 @@
+
+import logging
+import os
+import queue
+import random
+import threading
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Optional
+import cache
+import corpus
+import keyindex
+from exercise import Exercise, ParseError, parse_exercises
+
+
+# Files bigger than this are split into chunks that are parsed in parallel.
+CHUNK_SIZE = 4 << 20
+SEPARATOR = b'\n-----'
+# Prefetcher reads exercise files this much at a time, and corpora
+# this many exercises at a time.
+BLOCK_SIZE = 64 << 10
+BATCH_SIZE = 256
+
+
+def read_exercises(files: list[str], rebuild: bool = False,
+                   jobs: int = 1) -> Sequence[Exercise]:
+    "Return the exercises in files, in order. Parse with up to jobs processes."
+    if all(f.endswith(corpus.CORPUS_SUFFIX) for f in files):
+        exercises = corpus.Corpus(files)
+        logging.debug(f'Corpus has {len(exercises)} exercises')
+        return exercises
+    if jobs > 1:
+        ex_list = read_parallel(files, rebuild, jobs)
+    else:
+        ex_list = []
+        for fname in files:
+            ex_list += read_one(fname, rebuild)
+    logging.debug(f'Total exercises read: {len(ex_list)}')
+    return ex_list
+
+
+def read_one(fname: str, rebuild: bool) -> list[Exercise]:
+    logging.debug(f'Reading file {fname}')
+    if fname.endswith(corpus.CORPUS_SUFFIX):
+        return list(corpus.Corpus([fname]))
+    return cache.load_exercises(fname, rebuild)
+
+
+def read_parallel(files: list[str], rebuild: bool, jobs: int) -> list[Exercise]:
+    # Small files, and files with a fresh cache, are one task each.
+    # Big files are parsed in chunks, and their caches written here.
+    big = {f for f in files
+           if not f.endswith(corpus.CORPUS_SUFFIX)
+           and os.path.getsize(f) > CHUNK_SIZE
+           and (rebuild or not cache.is_fresh(f))}
+    ex_list: list[Exercise] = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # Submit everything first; map() keeps the results in order.
+        pending = []
+        for fname in files:
+            if fname in big:
+                chunks = split_file(fname, jobs)
+                lines = [1]
+                for chunk in chunks[:-1]:
+                    lines.append(lines[-1] + chunk.count(b'\n'))
+                pending.append((fname, pool.map(parse_chunk, chunks, [fname] * len(chunks),
+                                                lines)))
+            else:
+                pending.append((fname, pool.map(read_one, [fname], [rebuild])))
+        for fname, results in pending:
+            part: list[Exercise] = []
+            for chunk in results:
+                part += chunk
+            if fname in big:
+                cache.write_cache(fname, part)
+            ex_list += part
+    return ex_list
+
+
+def split_file(fname: str, n: int) -> list[bytes]:
+    "Split the file into about n chunks, each starting at an exercise separator."
+    with open(fname, 'rb') as f:
+        data = f.read()
+    size = max(CHUNK_SIZE // 4, len(data) // n)
+    chunks: list[bytes] = []
+    start = 0
+    while start < len(data):
+        end = data.find(SEPARATOR, start + size)
+        if end < 0:
+            end = len(data)
+        else:
+            end += 1  # the newline ends this chunk
+        chunks.append(data[start:end])
+        start = end
+    return chunks
+
+
+def parse_chunk(data: bytes, fname: str = '', first_line: int = 1) -> list[Exercise]:
+    "Parse part of fname, starting at first_line. Broken exercises are logged and skipped."
+    errors: list[ParseError] = []
+    ex_list = list(parse_exercises(data.decode(), fname, errors, first_line))
+    for e in errors:
+        logging.warning(str(e))
+    return ex_list
+
+
+class Prefetcher:
+    """Parse exercise files in a background thread, so the first
+    exercises can be shown while the rest are read. Caches are
+    neither read nor written: a cache must be read whole before its
+    first exercise can be used."""
+    queue: queue.Queue
+    error: Optional[BaseException]
+    done: bool     # every batch has been handed over
+    count: int     # exercises handed over so far
+
+    def __init__(self, files: list[str], keys: list[str]):
+        "Only exercises matching keys, as quiz.py -k, are handed over."
+        self.queue = queue.Queue()
+        self.error = None
+        self.done = False
+        self.count = 0
+        threading.Thread(target=self.run, args=(files, keys), daemon=True).start()
+
+    def run(self, files: list[str], keys: list[str]) -> None:
+        try:
+            for fname in files:
+                for batch in read_batches(fname):
+                    if keys:
+                        batch = [ex for ex in batch if keyindex.matches(ex.keys, keys)]
+                    self.queue.put(batch)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.queue.put(None)
+
+    def batches(self, wait: bool) -> Iterator[list[Exercise]]:
+        "Yield the batches parsed so far. If wait, wait for at least one."
+        while not self.done:
+            try:
+                batch = self.queue.get(block=wait)
+            except queue.Empty:
+                return
+            if batch is None:
+                self.done = True
+                if self.error:
+                    raise self.error
+                return
+            self.count += len(batch)
+            yield batch
+            wait = False
+
+    def __iter__(self) -> Iterator[Exercise]:
+        "The exercises in file order."
+        while not self.done:
+            for batch in self.batches(wait=True):
+                yield from batch
+
+    def shuffled(self, rng: Optional[random.Random] = None) -> Iterator[Exercise]:
+        """The exercises in random order. Each one is chosen from all
+        those parsed but not yet shown, so early exercises are more
+        likely to come early, but nothing waits for the whole corpus."""
+        randrange = rng.randrange if rng else random.randrange
+        pool: list[Exercise] = []
+        while True:
+            for batch in self.batches(wait=not pool):
+                pool += batch
+            if not pool:
+                return
+            i = randrange(len(pool))
+            pool[i], pool[-1] = pool[-1], pool[i]
+            yield pool.pop()
+
+
+def read_batches(fname: str) -> Iterator[list[Exercise]]:
+    "Yield the exercises in fname a few at a time, as they are parsed."
+    if fname.endswith(corpus.CORPUS_SUFFIX):
+        exercises = iter(corpus.Corpus([fname]))
+        while batch := list(islice(exercises, BATCH_SIZE)):
+            yield batch
+        return
+    with open(fname, 'rb') as f:
+        rest = b''
+        line = 1
+        while block := f.read(BLOCK_SIZE):
+            data = rest + block
+            # Parse up to the last separator; the rest may be cut short.
+            end = data.rfind(SEPARATOR) + 1
+            if end > 0:
+                yield parse_chunk(data[:end], fname, line)
+                line += data.count(b'\n', 0, end)
+            rest = data[end:]
+        if rest:
+            yield parse_chunk(rest, fname, line)
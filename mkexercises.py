@@ -6,24 +6,36 @@ Create a file of exercises, one exercise for each hand in the
 <hands> file. User will have to manually complete the exercises.
 
 Usage:
-    mkexercises.py <hands>
+    mkexercises.py [-t <template>] [-D <dealer>] [-V <vul>] [-K <keys>] [-n <files>] <hands>
     mkexercises.py   --version
     mkexercises.py   --help
 
 Options and commands:
     --version          Show version and exit.
     -h --help          Show this message and exit.
+    -t <template>      The template [default: template.txt].
+    -D <dealer>        Put this on the template's 'Dealer:' line.
+    -V <vul>           Put this on the template's 'Vulnerable:' line.
+    -K <keys>          Put these on the template's 'Keys:' line.
+    -n <files>         Split the exercises over this many files, written
+                       in parallel: foo-1.exr, foo-2.exr... [default: 1].
 """
 
 
 import os.path
-from typing import TextIO
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from typing import Optional
 import docopt  # type: ignore
 
 
 VERSION = '0.01'
-TEMPLATE = 'template.txt'
-DEBUG = True
+DEBUG = False
+# Hands are read this much at a time, and their exercises are
+# joined and written at once.
+READ_BLOCK = 1 << 20
+SEPARATOR = b'\nHand'
 
 
 class Hand:
@@ -34,63 +46,123 @@ class Hand:
         self.label = label
         self.suits = suits
 
+    def text(self) -> str:
+        "The 'Hand:' line and the suits, as they go in the template."
+        if '#' in self.label:
+            # The label keeps its newline, so a blank line follows.
+            comment = self.label[self.label.index('#'):]
+        else:
+            comment = '#'
+        return f'Hand: {comment}\n' + '\n'.join(self.suits) + '\n'
+
 
 def main() -> None:
     args = docopt.docopt(__doc__, version='0.01')
     fname = args['<hands>']
     base, _ = os.path.splitext(fname)
-    outfile = base + '.exr'
-    template = read_template(TEMPLATE)
-    with open(fname) as fh, open(outfile, 'wt') as fex:
-        while True:
-            while True:
-                line = fh.readline()
-                if line == '':
-                    debug('eof looking for hand')
-                    return
-                if line.startswith('Hand'):
-                    break
-            hand = read_hand(line, fh)
-            debug('got complete hand')
-            write_exercise(template, hand, fex)
-
-
-def read_hand(label: str, fh: TextIO) -> Hand:
-    debug('reading hand')
-    _ = fh.readline()  # blank line after 'Hand:'
-    suits: list[str] = []
-    while True:
-        line = fh.readline()
-        if line == '':
+    fields = {'Dealer:': args['-D'], 'Vulnerable:': args['-V'], 'Keys:': args['-K']}
+    parts = compile_template(read_template(args['-t']), fields)
+    files = int(args['-n'])
+    if files == 1:
+        count = write_exercises(fname, 0, os.path.getsize(fname), base + '.exr', parts)
+    else:
+        count = write_shards(fname, base, files, parts)
+    debug(f'{count} exercises')
+
+
+def write_shards(fname: str, base: str, files: int, parts: list[str]) -> int:
+    "Write the exercises to base-1.exr ... base-<files>.exr in parallel."
+    bounds = split_points(fname, files)
+    outfiles = [f'{base}-{i + 1}.exr' for i in range(files)]
+    with ProcessPoolExecutor(max_workers=min(files, os.cpu_count() or 1)) as pool:
+        counts = pool.map(write_exercises, [fname] * files, bounds[:-1], bounds[1:],
+                          outfiles, [parts] * files)
+        return sum(counts)
+
+
+def split_points(fname: str, n: int) -> list[int]:
+    "Cut fname into n byte ranges, each starting with a 'Hand' line."
+    size = os.path.getsize(fname)
+    points = [0]
+    with open(fname, 'rb') as f:
+        for i in range(1, n):
+            f.seek(max(size * i // n, points[-1]))
+            block = f.read(1 << 16)
+            pos = block.find(SEPARATOR)
+            points.append(size if pos < 0 else f.tell() - len(block) + pos + 1)
+    points.append(size)
+    return points
+
+
+def write_exercises(fname: str, start: int, end: int, outfile: str,
+                    parts: list[str]) -> int:
+    "Merge the hands in bytes start to end of fname into outfile. Return the count."
+    count = 0
+    with open(outfile, 'wt') as fex:
+        for text in read_blocks(fname, start, end):
+            exercises = [hand.text().join(parts) for hand in read_hands(StringIO(text))]
+            fex.write(''.join(exercises))
+            count += len(exercises)
+    return count
+
+
+def read_blocks(fname: str, start: int, end: int) -> Iterator[str]:
+    "Yield bytes start to end of fname, in blocks that each end before a 'Hand' line."
+    with open(fname, 'rb') as f:
+        f.seek(start)
+        rest = b''
+        while start < end:
+            block = f.read(min(READ_BLOCK, end - start))
+            start += len(block)
+            data = rest + block
+            cut = data.rfind(SEPARATOR) + 1 if start < end else len(data)
+            if cut > 0:
+                yield data[:cut].decode()
+            rest = data[cut:]
+        if rest:
+            yield rest.decode()
+
+
+def read_hands(lines: Iterable[str]) -> Iterator[Hand]:
+    "Yield each hand in a hands file, as mkhands.py and dealgen.py write them."
+    lines = iter(lines)
+    for line in lines:
+        if not line.startswith('Hand'):
+            continue
+        next(lines, '')  # blank line after 'Hand:'
+        suits: list[str] = []
+        for suit in lines:
+            suit = suit.rstrip()
+            if suit == '':
+                break
+            suits.append(suit)
+        else:
             assert 'EOF while reading hand' == ''
-        line = line.rstrip()
-        debug('hand: ' + line)
-        if line == '':
-            break
-        suits.append(line)
-    assert len(suits) == 4
-    return Hand(label, suits)
+        assert len(suits) == 4
+        yield Hand(line, suits)
 
 
-def write_exercise(template: list[str], hand: Hand, fex: TextIO) -> None:
-    # print('write exercise')
+def compile_template(template: list[str], fields: dict[str, Optional[str]]) -> list[str]:
+    """Return the text of the template before, between and after its
+    'Hand:' lines, so an exercise is the hand's text joined with them.
+    Lines starting with a key of fields get that value, if it isn't None."""
+    parts: list[str] = []
+    text: list[str] = []
     for line in template:
         if line.startswith('Hand:'):
-            debug('hand goes here')
-            if '#' in hand.label:
-                i = hand.label.index('#')
-                comment = hand.label[i:]
-            else:
-                comment = '#'
-            print(f'Hand: {comment}', file=fex)
-            for suit in hand.suits:
-                print(suit, file=fex)
-        else:
-            print(line, file=fex)
+            parts.append(''.join(text))
+            text = []
+            continue
+        for name, value in fields.items():
+            if value is not None and line.startswith(name):
+                line = f'{name} {value}'
+        text.append(line + '\n')
+    parts.append(''.join(text))
+    assert len(parts) > 1, "The template has no 'Hand:' line."
+    return parts
 
 
 def read_template(fname: str) -> list[str]:
-    # print('read template')
     lines: list[str] = []
     with open(fname) as f:
         for line in f.readlines():
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+
+"""
+pbn.py: Make exercises of deals played at the table, from PBN files
+and BBO LIN hand records, and write exercises as PBN.
+
+Usage:
+    pbn.py import [-q] [-s <seat>] [-K <keys>] [-o <out>] FILES...
+    pbn.py export [-o <out>] EXERCISES...
+    pbn.py   --version
+    pbn.py   --help
+
+Options and commands:
+    --version          Show version and exit.
+    -h --help          Show this message and exit.
+    import             Write an exercise for each deal in FILES, which are
+                       PBN or LIN, and may be compressed with gzip, xz or bzip2.
+    export             Write the exercises in EXERCISES, .exr files or .exb
+                       corpora, as PBN.
+    -o <out>           Write to this file, '-' for stdout [default: -].
+    -q                 Write questions, as question.py reads them.
+    -s <seat>          The student's seat [default: S]. The deal is turned
+                       so the student sits South.
+    -K <keys>          Put these on each exercise's 'Keys:' line.
+
+The student's calls are the answers, and the auction stops at the
+last of them. An alert or a note on one of them is its explanation. Deals
+with an unknown or illegal auction are skipped. Files are read and
+written a deal at a time, so they can be any size.
+
+PBN has no 'x' for a low card. An exercise's x's are exported as they
+are, and other programs may not accept them.
+"""
+
+
+import bz2
+import gzip
+import logging
+import lzma
+import re
+import sys
+import textwrap
+from collections.abc import Iterable, Iterator
+from itertools import chain
+from typing import Optional, TextIO
+import docopt  # type: ignore
+import bids
+import loader
+import question
+from exercise import (Answer, Exercise, Hand, DEALERS, format_exercise,
+                      intern_keys)
+
+
+VERSION = '0.01'
+LOG_LEVEL = 'INFO'
+SOUTH = 2
+# Exercises are written this many at a time.
+WRITE_BATCH = 1024
+COMPRESSED = ((b'\x1f\x8b', gzip.open), (b'\xfd7zXZ\x00', lzma.open), (b'BZh', bz2.open))
+PBN_HEADER = '% PBN 2.1\n% EXPORT\n\n'
+PBN_RANKS = 'AKQJT98765432'
+RANK_BITS = {rank: 1 << (12 - r) for r, rank in enumerate(PBN_RANKS)}
+RANK_BITS.update({rank.lower(): bit for rank, bit in RANK_BITS.items()})
+# Calls as PBN and LIN write them: 'Pass', 'p', '1NT', '1n', 'X', 'd'...
+CALLS = {spelling: code for name, code in bids.CODES.items() if code != bids.PAD
+         for spelling in (name, name.lower(), name.capitalize())}
+PBN_CALLS = bids.NAMES[:bids.PASS] + ('Pass', 'X', 'XX')
+PBN_VULNERABLE = {'NONE': 'NONE', 'LOVE': 'NONE', '-': 'NONE', 'NS': 'N-S',
+                  'EW': 'E-W', 'ALL': 'BOTH', 'BOTH': 'BOTH'}
+PBN_VULNERABLE_NAMES = {'NONE': 'None', 'N-S': 'NS', 'E-W': 'EW', 'BOTH': 'All'}
+LIN_VULNERABLE = {'O': 'NONE', '0': 'NONE', '-': 'NONE', 'N': 'N-S', 'E': 'E-W', 'B': 'BOTH'}
+# LIN numbers the seats 1 to 4 from South, and lists the hands from South.
+LIN_SEATS = (SOUTH, 3, 0, 1)
+LIN_SUIT_RE = re.compile('([SHDC])([^SHDC]*)')
+TAG_RE = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+EXPLANATION_WIDTH = 60
+HOLDINGS: dict[str, tuple[int, int, int]] = {}
+
+
+class Deal:
+    "A deal as it was played: the hands that are known, and the auction."
+    __slots__ = ('title', 'keys', 'dealer', 'vulnerable', 'hands', 'calls', 'notes')
+    title: str                     # event and board
+    keys: tuple[str, ...]
+    dealer: int                    # 0 is North
+    vulnerable: str                # as in exercise.VULNERABLE
+    hands: list[str]               # N E S W, e.g. 'AK5.QJ2.T98.7654', '' if not known
+    calls: list[int]               # codes, see bids.py. PAD is an unknown call.
+    notes: dict[int, str]          # alerts and notes, by call
+
+    def __init__(self, dealer: int, hands: list[str]):
+        self.title = ''
+        self.keys = ()
+        self.dealer = dealer
+        self.vulnerable = 'NONE'
+        self.hands = hands
+        self.calls = []
+        self.notes = {}
+
+
+def main() -> None:
+    args = docopt.docopt(__doc__, version=VERSION)
+    logging.basicConfig(level=LOG_LEVEL, format='%(message)s')
+    seat = args['-s'].upper()
+    if seat not in DEALERS:
+        sys.exit(f'{args["-s"]} is not a seat.')
+    with open_output(args['-o']) as out:
+        if args['import']:
+            keys = intern_keys((args['-K'] or '').split())
+            deals, count = import_files(args['FILES'], out, DEALERS.index(seat),
+                                        keys, args['-q'])
+            logging.info(f'{deals} deals, {count} exercises')
+        else:
+            count = export_files(args['EXERCISES'], out)
+            logging.info(f'{count} deals')
+
+
+def open_output(fname: str) -> TextIO:
+    if fname == '-':
+        return open(sys.stdout.fileno(), 'wt', closefd=False)
+    return open(fname, 'wt')
+
+
+# ----- import -----
+
+def import_files(files: list[str], out: TextIO, seat: int, keys: tuple[str, ...],
+                 questions: bool) -> tuple[int, int]:
+    "Write an exercise for each deal in files. Return the deals read and exercises written."
+    write = question.format_question if questions else format_exercise
+    texts: list[str] = []
+    deals = count = 0
+    for fname in files:
+        for deal in read_deals(fname):
+            deals += 1
+            ex = make_exercise(deal, seat, keys)
+            if ex is None:
+                continue
+            count += 1
+            texts.append(write(ex))
+            if len(texts) >= WRITE_BATCH:
+                out.write(''.join(texts))
+                texts = []
+    if questions:
+        texts.append('End\n')
+    out.write(''.join(texts))
+    return deals, count
+
+
+def make_exercise(deal: Deal, seat: int, keys: tuple[str, ...]) -> Optional[Exercise]:
+    """Return the deal as an exercise for the player in seat, turned so
+    they sit South, or None if it won't make one."""
+    hand = make_hand(deal.hands[seat]) if deal.hands[seat] else missing_hand(deal.hands)
+    calls = deal.calls
+    if hand is None or bids.PAD in calls:
+        return None
+    marked = range((seat - deal.dealer) % 4, len(calls), 4)
+    if not marked:
+        return None
+    turn = (SOUTH - seat) % 4
+    dealer = (deal.dealer + turn) % 4
+    codes = bytearray([bids.PAD] * dealer)
+    codes += bytes(calls[:marked[-1] + 1])
+    for i in marked:
+        codes[dealer + i] |= bids.MARK
+    if bids.auction_errors(bytes(codes), dealer):
+        return None
+    ex = Exercise()
+    ex.keys = keys + deal.keys
+    ex.dealer = DEALERS[dealer]
+    ex.vulnerable = deal.vulnerable
+    if turn % 2:
+        ex.vulnerable = {'N-S': 'E-W', 'E-W': 'N-S'}.get(ex.vulnerable, ex.vulnerable)
+    if deal.title:
+        ex.info = [' ' + deal.title]
+    ex.hand = hand
+    ex.codes = bytes(codes)
+    ex.answers = [Answer(calls[i], explanation(deal.notes.get(i, ''))) for i in marked]
+    return ex
+
+
+def missing_hand(hands: list[str]) -> Optional[Hand]:
+    "If only one hand is unknown, and the others have no x's, it has the rest of the cards."
+    known = [make_hand(text) for text in hands if text]
+    if len(known) != 3 or any(hand is None or hand.spots for hand in known):
+        return None
+    hand = Hand()
+    hand.cards = ((1 << 52) - 1) ^ known[0].cards ^ known[1].cards ^ known[2].cards
+    return hand if bin(hand.cards).count('1') == 13 else None
+
+
+def explanation(text: str) -> list[str]:
+    "An alert or note as the lines of an explanation."
+    if len(text) <= EXPLANATION_WIDTH and '\n' not in text:
+        return [' ' + text] if text.strip() else []
+    return [' ' + line for line in textwrap.wrap(text, EXPLANATION_WIDTH)[:4]]
+
+
+def read_deals(fname: str) -> Iterator[Deal]:
+    "Yield each deal in a PBN or LIN file."
+    with open_deals(fname) as f:
+        for first in f:
+            if first.strip():
+                break
+        else:
+            return
+        lines = chain([first], f)
+        if '|' in first and not first.lstrip().startswith(('%', '[', '{')):
+            yield from read_lin(lines)
+        else:
+            yield from read_pbn(lines)
+
+
+def open_deals(fname: str) -> TextIO:
+    "Open a file as text, uncompressing it if it starts like gzip, xz or bzip2."
+    with open(fname, 'rb') as f:
+        magic = f.read(6)
+    for prefix, opener in COMPRESSED:
+        if magic.startswith(prefix):
+            return opener(fname, 'rt', encoding='utf-8', errors='replace')
+    return open(fname, encoding='utf-8', errors='replace')
+
+
+def make_hand(text: str) -> Optional[Hand]:
+    "A hand in PBN, e.g. 'AK5.QJ2.T98.765x', or None if it isn't 13 cards."
+    suits = text.split('.')
+    if len(suits) != 4:
+        return None
+    hand = Hand()
+    length = 0
+    for i, suit in enumerate(suits):
+        # There are only a few thousand holdings, and they repeat.
+        bits = HOLDINGS.get(suit) or holding(suit)
+        if bits is None:
+            return None
+        mask, spots, n = bits
+        hand.cards |= mask << (13 * i)
+        hand.spots |= spots << (4 * i)
+        length += n
+    return hand if length == 13 else None
+
+
+def holding(suit: str) -> Optional[tuple[int, int, int]]:
+    "The mask, x's and length of one suit, e.g. 'AK5x'. Remember it in HOLDINGS."
+    mask = spots = 0
+    for card in suit:
+        if card in 'xX':
+            spots += 1
+        elif card in RANK_BITS and not mask & RANK_BITS[card]:
+            mask |= RANK_BITS[card]
+        else:
+            return None
+    if len(suit) > 13:
+        return None
+    HOLDINGS[suit] = (mask, spots, len(suit))
+    return HOLDINGS[suit]
+
+
+# ----- PBN -----
+
+def read_pbn(lines: Iterable[str]) -> Iterator[Deal]:
+    "Yield each game in a PBN file that has a deal. Games end at a blank line."
+    tags: dict[str, str] = {}
+    last: dict[str, str] = {}    # the previous game's tags, for '#'
+    auction: list[str] = []      # the tokens after the Auction tag
+    notes: list[str] = []
+    section = ''
+    comment = False              # in a { } comment over several lines
+    for line in lines:
+        if comment:
+            if '}' not in line:
+                continue
+            line = line[line.index('}') + 1:]
+            comment = False
+        line = line.strip()
+        first = line[:1]
+        if first == '%':
+            continue
+        if first == '[':
+            if line[-2:] == '"]' and '\\' not in line:
+                section, _, value = line[1:-2].partition(' "')
+            elif m := TAG_RE.match(line):
+                section, value = m.groups()
+                value = value.replace('\\"', '"').replace('\\\\', '\\')
+            else:
+                section = ''
+            if section:
+                if value == '#':
+                    value = last.get(section, '')
+                if section == 'Note':
+                    notes.append(value)
+                else:
+                    tags[section] = value
+                continue
+        if '{' in line or ';' in line:
+            line, comment = strip_comment(line)
+        if line:
+            if section == 'Auction':
+                auction += line.split()
+        elif tags and not comment:
+            deal = pbn_deal(tags, auction, notes)
+            if deal:
+                yield deal
+            last, tags, auction, notes, section = tags, {}, [], [], ''
+    if tags:
+        deal = pbn_deal(tags, auction, notes)
+        if deal:
+            yield deal
+
+
+def strip_comment(line: str) -> tuple[str, bool]:
+    "Remove { } and ; comments from a line. Return what is left, and whether a { comment goes on."
+    text = ''
+    while line:
+        brace, semi = line.find('{'), line.find(';')
+        if semi >= 0 and (brace < 0 or semi < brace):
+            return text + line[:semi].strip(), False
+        if brace < 0:
+            return text + line, False
+        text += line[:brace] + ' '
+        end = line.find('}', brace)
+        if end < 0:
+            return text.strip(), True
+        line = line[end + 1:]
+    return text.strip(), False
+
+
+def pbn_deal(tags: dict[str, str], auction: list[str], notes: list[str]) -> Optional[Deal]:
+    "The deal in one game's tags and auction, or None if it has none."
+    dealer = tags.get('Dealer', '').upper()
+    if dealer not in DEALERS or 'Deal' not in tags:
+        return None
+    hands = pbn_hands(tags['Deal'])
+    if hands is None:
+        return None
+    deal = Deal(DEALERS.index(dealer), hands)
+    deal.title = ', '.join(filter(None, [tags.get('Event', '').strip(),
+                                         tags.get('Board', '') and 'board ' + tags['Board']]))
+    if 'Keys' in tags:
+        deal.keys = intern_keys(tags['Keys'].split())
+    deal.vulnerable = PBN_VULNERABLE.get(tags.get('Vulnerable', '').upper(), 'NONE')
+    # The auction must start with the dealer.
+    if tags.get('Auction', '').upper() != dealer:
+        deal.calls = [bids.PAD]
+        return deal
+    texts = dict(note.partition(':')[::2] for note in notes)
+    calls = deal.calls
+    for token in auction:
+        code = CALLS.get(token)
+        if code is not None:
+            calls.append(code)
+        elif token[0] == '=':
+            # A note on the call before, e.g. '=1='
+            if calls:
+                deal.notes[len(calls) - 1] = texts.get(token.strip('='), '')
+        elif token == 'AP':
+            calls += [bids.PASS] * 3
+        elif token != '*' and token[0] != '$':
+            # '*' ends an unfinished auction, and '$1' is a comment on a call.
+            calls.append(CALLS.get(token.rstrip('!?').upper(), bids.PAD))
+    return deal
+
+
+def pbn_hands(text: str) -> Optional[list[str]]:
+    "The N, E, S, W hands of a PBN deal, e.g. 'S:AK5.QJ2.T98.7654 - ...'."
+    if text[1:2] != ':' or text[:1].upper() not in DEALERS:
+        return None
+    first = DEALERS.index(text[0].upper())
+    hands = ['', '', '', '']
+    for i, cards in enumerate(text[2:].split()[:4]):
+        if cards != '-':
+            hands[(first + i) % 4] = cards
+    return hands
+
+
+# ----- LIN -----
+
+def read_lin(lines: Iterable[str]) -> Iterator[Deal]:
+    "Yield each deal in a LIN file. A deal starts at its 'md' or 'qx' pair."
+    deal: Optional[Deal] = None
+    event = ''
+    for key, value in lin_pairs(lines):
+        if key == 'md' or key == 'qx':
+            if deal:
+                yield deal
+            deal = lin_deal(value, event) if key == 'md' else None
+        elif key == 'vg':
+            event = value.split(',')[0].strip()
+        elif deal is None:
+            continue
+        elif key == 'mb':
+            deal.calls.append(CALLS.get(value.rstrip('!').upper(), bids.PAD))
+        elif key == 'an':
+            if deal.calls:
+                deal.notes[len(deal.calls) - 1] = value
+        elif key == 'sv':
+            deal.vulnerable = LIN_VULNERABLE.get(value.upper(), 'NONE')
+        elif key == 'ah':
+            deal.title = ', '.join(filter(None, [event, value.strip()]))
+    if deal:
+        yield deal
+
+
+def lin_pairs(lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+    "Yield each key|value| pair in a LIN file. A pair may go on over several lines."
+    rest = ''
+    key = None
+    for line in lines:
+        fields = (rest + line.rstrip('\r\n')).split('|')
+        rest = fields.pop()
+        for field in fields:
+            if key is None:
+                key = field.strip().lower()
+            else:
+                yield key, field
+                key = None
+
+
+def lin_deal(md: str, event: str) -> Optional[Deal]:
+    "A deal from a LIN 'md' value, e.g. '3SAKQ2H...,S...,S...,'."
+    dealer = 2
+    if md[:1].isdigit():
+        dealer = LIN_SEATS[(int(md[0]) - 1) % 4]
+        md = md[1:]
+    hands = ['', '', '', '']
+    for i, cards in enumerate(md.split(',')[:4]):
+        if cards:
+            suits = dict(LIN_SUIT_RE.findall(cards.upper()))
+            hands[LIN_SEATS[i]] = '.'.join(suits.get(suit, '') for suit in 'SHDC')
+    deal = Deal(dealer, hands)
+    deal.title = event
+    return deal
+
+
+# ----- export -----
+
+def export_files(files: list[str], out: TextIO) -> int:
+    "Write the exercises in files as PBN games. Return how many."
+    out.write(PBN_HEADER)
+    board = 0
+    for fname in files:
+        for batch in loader.read_batches(fname):
+            texts = []
+            for ex in batch:
+                board += 1
+                texts.append(format_pbn(ex, board))
+            out.write(''.join(texts))
+    return board
+
+
+def format_pbn(ex: Exercise, board: int) -> str:
+    """One exercise as a PBN game. Only South's hand is known. The
+    answers are noted on the student's calls, with their explanations."""
+    lines = [tag('Event', ex.info[0].strip() if ex.info else ''), tag('Board', str(board)),
+             tag('Dealer', ex.dealer), tag('Vulnerable', PBN_VULNERABLE_NAMES[ex.vulnerable]),
+             tag('Deal', 'S:' + pbn_hand(ex.hand) + ' - - -')]
+    if ex.keys:
+        lines.append(tag('Keys', ' '.join(ex.keys)))
+    lines.append(tag('Auction', ex.dealer))
+    calls: list[str] = []
+    notes: list[str] = []
+    answers = iter(ex.answers)
+    for code in ex.codes:
+        call = code & ~bids.MARK
+        if call == bids.PAD:
+            continue
+        name = PBN_CALLS[call]
+        if code & bids.MARK:
+            text = ' '.join(line.strip() for line in next(answers).expl)
+            if text:
+                notes.append(text)
+                name += f' ={len(notes)}='
+        calls.append(name)
+    if not auction_over(ex.codes):
+        calls.append('*')
+    lines += [' '.join(calls[i:i + 4]) for i in range(0, len(calls), 4)]
+    lines += [tag('Note', f'{n}:{text}') for n, text in enumerate(notes, 1)]
+    return '\n'.join(lines) + '\n\n'
+
+
+def tag(name: str, value: str) -> str:
+    value = value.replace('\\', '\\\\').replace('"', '\\"')
+    return f'[{name} "{value}"]'
+
+
+def pbn_hand(hand: Hand) -> str:
+    "A hand in PBN, e.g. 'AK5.QJ2.T98.76xx'."
+    suits = []
+    for i in range(4):
+        suit = hand.suit_mask(i)
+        suits.append(''.join(rank for rank in PBN_RANKS if suit & RANK_BITS[rank])
+                     + 'x' * hand.suit_spots(i))
+    return '.'.join(suits)
+
+
+def auction_over(codes: bytes) -> bool:
+    "Has the auction ended, with three passes after a bid or four passes?"
+    calls = [code & ~bids.MARK for code in codes if code & ~bids.MARK != bids.PAD]
+    if len(calls) < 4 or calls[-3:] != [bids.PASS] * 3:
+        return False
+    return calls[-4] != bids.PASS or len(calls) == 4
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 
-import random
-from collections import Counter
-from typing import TextIO
+from io import StringIO
+from typing import Optional, TextIO
+import bids
+import handeval
+from exercise import Exercise, ParseError, check_cards
 
 
 SUIT_SYMS = "\u2660\u2665\u2666\u2663"
@@ -21,13 +23,14 @@ class Step:
             if line.startswith('Auction'):
                 fld = line.split()
                 if len(fld) > 1:
-                    self.auction += decode_auction(fld[1], dealer)
+                    self.auction += bids.names(bids.parse_compact(fld[1]))
             elif line.startswith('Answer'):
                 fld = line.split()
                 self.answer = fld[1]
             elif line.startswith('Explanation'):
                 last_line = self.store_explanation(f)
-                assert last_line.startswith('Ends')
+                if not last_line.startswith('Ends'):
+                    raise ParseError(f'{last_line!r} where Ends should be')
                 # print('end step')
                 break
 
@@ -40,18 +43,27 @@ class Step:
                 return line
 
 
-class Hand:
+class Hand(handeval.HandFeatures):
     suits: list[str]
+    cards: int  # as in exercise.Hand
+    spots: int
 
     def __init__(self, f: TextIO):
         self.suits = []
+        self.cards = 0
+        self.spots = 0
         for i in range(4):
             line = get_line(f)
-            assert line[0] == ' '
-            line = replace_xs(line)
+            if line[0] != ' ':
+                raise ParseError(f'{line!r} is not a suit')
             self.suits.append(line)
+            mask, spots = handeval.encode_suit(line)
+            self.cards |= mask << (13 * i)
+            self.spots |= spots << (4 * i)
+        check_cards(self.suits)
         line = get_line(f)
-        assert line.startswith('Endh')
+        if not line.startswith('Endh'):
+            raise ParseError(f'{line!r} where Endh should be')
         # print('end hand')
 
     def __str__(self) -> str:
@@ -104,18 +116,18 @@ class Question:
                 fld = line.split()
                 self.keywords = fld[1]
             else:
-                print('Unknown:', line)
-                assert False
+                raise ParseError(f'unknown line {line!r}')
 
     def store_dealer(self, line) -> None:
         fld = line.split()
         dealer = fld[1]
-        assert dealer in ('n', 's', 'e', 'w')
+        if dealer not in ('n', 's', 'e', 'w'):
+            raise ParseError(f'bad dealer {dealer!r}')
         self.dealer = dealer.upper()
 
     # def store_auction(self, line) -> None:
     #     fld = line.split()
-    #     self.auction = decode_auction(fld[1], self.dealer)
+    #     self.auction = bids.names(bids.parse_compact(fld[1]))
 
     # def __str__(self) -> str:
     #     s = f'dealer: {self.dealer}\nauction: {self.auction}\n'
@@ -125,68 +137,76 @@ class Question:
     #     return s
 
 
+def read_questions(f: TextIO, fname: str = '',
+                   errors: Optional[list[ParseError]] = None) -> list[Question]:
+    """Read questions until the 'End' line. A broken question raises
+    ParseError. If there is a list of errors, the error is added to it
+    instead, and reading goes on at the next 'Question' line."""
+    lines = f.read().splitlines(keepends=True)
+    end = next((i for i, line in enumerate(lines) if line.rstrip() == 'End'), None)
+    stop = len(lines) if end is None else end
+    starts = [i for i, line in enumerate(lines[:stop]) if line.rstrip() == 'Question']
+    questions: list[Question] = []
+    for start, next_start in zip(starts, starts[1:] + [stop]):
+        try:
+            questions.append(Question(StringIO(''.join(lines[start + 1:next_start]))))
+        except (ParseError, ValueError, IndexError, KeyError) as e:
+            if isinstance(e, ParseError):
+                msg = e.msg
+            else:
+                msg = f'bad card {e.args[0]!r}' if isinstance(e, KeyError) else str(e)
+            error = ParseError(msg or 'broken question', fname, start + 1)
+            if errors is None:
+                raise error from None
+            errors.append(error)
+    if end is None:
+        error = ParseError('no End line', fname, stop)
+        if errors is None:
+            raise error
+        errors.append(error)
+    return questions
+
+
+def format_question(ex: Exercise) -> str:
+    "The text of an exercise as a question, with a step for each answer."
+    lines = ['Question']
+    if ex.keys:
+        lines.append('Keywords ' + ','.join(ex.keys))
+    lines += [f'Vulnerable {ex.vulnerable.lower()}', f'Dealer {ex.dealer.lower()}', 'Hand']
+    lines += [' ' + suit.replace('X', 'x') for suit in ex.hand.suits]
+    lines += ['Endh', '']
+    answers = iter(ex.answers)
+    # A step's auction starts with the answer to the step before.
+    calls = ''
+    for code in ex.codes:
+        call = code & ~bids.MARK
+        if code & bids.MARK:
+            expl = next(answers).expl
+            lines += ['Step', f'Auction {calls}'.rstrip(), f'Answer {compact_name(call)}',
+                      'Explanation', *expl, 'Ends', '']
+            calls = compact_name(call, True)
+        elif call != bids.PAD:
+            calls += compact_name(call, True)
+    lines += ['Endq', '', '']
+    return '\n'.join(lines)
+
+
+def compact_name(code: int, short: bool = False) -> str:
+    "A call as questions write it: 1nt, p, x, xx; if short, 1n, p, x, r."
+    if code == bids.RDBL:
+        return 'r' if short else 'xx'
+    name = {bids.PASS: 'p', bids.DBL: 'x'}.get(code, bids.NAMES[code].lower())
+    return name[:2] if short else name
+
+
 def get_line(f: TextIO) -> str:
     while True:
         line = f.readline()
         if line == '':
-            print('Unexpected EOF.')
-            assert False
+            raise ParseError('unexpected end of question')
         if line.startswith('#'):
             continue
         line = line.rstrip()
         if line != '':
             # print('debug:', line)
             return line
-
-
-def decode_auction(raw: str, dealer: str) -> list[str]:
-    bids: list[str] = []
-    i = 0
-    while i < len(raw):
-        c = raw[i]
-        i += 1
-        if c == 'p':
-            bids.append('Pass')
-        elif c == 'x':
-            bids.append('Dbl')
-        elif c == 'r':
-            bids.append('Rdbl')
-        elif c in '1234567':
-            c2 = raw[i]
-            i += 1
-            if c2 in 'shdc':
-                bids.append(c + c2.upper())
-            elif c2 == 'n':
-                bids.append(c + 'NT')
-            else:
-                print('BAD auction:', raw)
-                assert False
-        else:
-            print('BAD auction:', raw)
-            assert False
-    # Normalize auction, so North's bids are on the left.
-    # bids.append('?')
-    # if dealer != 'n':
-    #     count = BID_PADDING[dealer]
-    #     for i in range(count):
-    #         bids.insert(0, '-')
-    return bids
-
-
-def replace_xs(suit: str) -> str:
-    "Replace, e.g., 'A K x x x' with random low cards: 'A K 9 5 3'"
-    cards = ['2', '3', '4', '5', '6', '7', '8', '9']
-    random.shuffle(cards)
-    d = dict(Counter(suit))
-    if 'x' not in d:
-        return suit
-    n = d['x']
-    cards = cards[0:n]
-    cards.sort()
-    new = ''
-    for c in suit:
-        if c != 'x':
-            new += c.upper()
-        else:
-            new += cards.pop()
-    return new
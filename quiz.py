@@ -4,24 +4,68 @@
 quiz.py: Display bidding exercises and check answers
 
 Usage:
-    quiz.py [-k <key>] [-s] EXERCISES...
+    quiz.py [-k <key>]... [-s | -w] [-j <jobs>] [-l <log>] [--system <rules>] [--seed <n>]
+            [--rebuild-cache] EXERCISES...
+    quiz.py [-k <key>]... [-s] [-j <jobs>] [-l <log>] [--system <rules>] [--seed <n>]
+            [--rebuild-cache] --stream EXERCISES...
+    quiz.py [-k <key>]... [-j <jobs>] [--rebuild-cache] --replay <answers> EXERCISES...
     quiz.py   --version
     quiz.py   --help
 
 Options and commands:
     --version          Show version and exit.
     -h --help          Show this message and exit.
-    -k <key>           Show only exercises with this keyword.
-    -s                 Sequential. Don't shuffle exercises before showing.
+    -k <key>           Show only exercises with this keyword. Repeat -k to
+                       require several keys. '!key' excludes a key, and
+                       'key1|key2' accepts either one.
+    -s                 Sequential. Show new exercises in file order, not
+                       shuffled.
+    -w                 Weighted. Choose each exercise at random, more often
+                       those missed lately and those with the same keys.
+                       Exercises repeat, until you quit.
+                       See sampler.py.
+    -j <jobs>          Parse the exercise files with this many processes
+                       [default: 1].
+    -l <log>           Keep every answer in this file [default: answers.log].
+    --system <rules>   Also accept the calls this bidding system allows with
+                       the hand, as well as the answer. See system.txt.
+    --seed <n>         Shuffle, and deal the cards written as x, from this
+                       seed. Without it a seed is chosen, and logged.
+    --rebuild-cache    Parse the exercise files even if their caches are fresh.
+    --stream           Show the first exercise at once, while the rest are
+                       read in the background. Exercises are shuffled among
+                       those read so far, and due ones don't come first.
+    --replay <answers> Grade the calls in this file ('-' for stdin), with no
+                       screen. Each line has the calls for one exercise, in
+                       file order. Print each exercise's result, then totals.
+
+EXERCISES are .exr files, or .exb corpora made by corpus.py.
+Exercises that are due again, going by the answer log, come first,
+then those never shown. The quiz ends when there are no more.
+The same seed, files, options and answer log give the same session,
+except with --stream and no -s.
 """
 
 
 import curses
 import logging
 import random
-# import sys
+import sys
+import time
+from collections.abc import Collection, Iterator, Sequence
+from typing import Optional, Union
 import docopt  # type: ignore
-from exercise import Exercise
+import numpy as np
+import bids
+import corpus
+import grading
+import history
+import keyindex
+import loader
+import sampler
+import spotfill
+import system
+from exercise import DEALERS, Answer, Exercise, Hand, ParseError
 
 
 VERSION = '0.01'
@@ -40,9 +84,20 @@ COL_BID_BOX = 40
 ROW_DIVIDER = 25
 ROW_RESULT = 26
 ROW_EXPL = 27
-ROW_HINT = 29
+EXPL_ROWS = 4
+ROW_HINT = 31
+ROW_ENTRY = 32
 ROW_DEBUG = 35
 ROW_AUCTION = 11
+AUCTION_ROWS = ROW_HAND - ROW_AUCTION  # a longer auction shows its last rows
+
+# The bid box, top row first: the calls in each row, and how many
+# columns each one takes. Both drawing the box and reading clicks on it
+# go by this.
+BID_BOX: list[tuple[list[int], int]] = \
+    [([(level - 1) * 5 + strain for strain in range(5)], 4) for level in range(7, 0, -1)] \
+    + [([bids.PASS, bids.DBL, bids.RDBL], 6)]
+BID_BOX_WIDTH = 20
 
 BG_COLOR1 = curses.COLOR_RED
 BG_COLOR2 = curses.COLOR_BLUE
@@ -55,115 +110,294 @@ class MyError(Exception):
 
 class Globals:
     click_count: int
-    exercises: list[Exercise]
-    total_answers: int
-    total_right: int
+    exercises: Sequence[Exercise]
+    score: grading.Score
     count: int
+    system: Optional[system.System]
+    seed: int
+
+
+class BidTrie:
+    """Calls as they may be typed, one character to a node. code is the
+    call spelled by the path to this node, or -1. A call is taken as soon
+    as nothing longer can be typed, as with 1S, 1NT or XX. Enter takes a
+    shorter spelling such as 1N, P or X."""
+    __slots__ = ('children', 'code')
+    children: dict[str, 'BidTrie']
+    code: int
+
+    def __init__(self) -> None:
+        self.children = {}
+        self.code = -1
+
+    def add(self, spelling: str, code: int) -> None:
+        node = self
+        for c in spelling:
+            node = node.children.setdefault(c, BidTrie())
+        node.code = code
+
+
+def make_bid_trie() -> BidTrie:
+    "A trie of every spelling of a call in bids.CODES: 1n, 1nt, p, x, xx..."
+    trie = BidTrie()
+    for spelling, code in bids.CODES.items():
+        if code != bids.PAD:
+            trie.add(spelling, code)
+    return trie
+
+
+def make_bid_cells() -> dict[tuple[int, int], int]:
+    "Map each screen cell (y, x) of the bid box to the call shown there."
+    cells: dict[tuple[int, int], int] = {}
+    for i, (codes, width) in enumerate(BID_BOX):
+        for j in range(BID_BOX_WIDTH):
+            if j // width < len(codes):
+                cells[ROW_BID_BOX + 2 + i, COL_BID_BOX + j] = codes[j // width]
+    return cells
+
+
+BID_TRIE = make_bid_trie()
+BID_CELLS = make_bid_cells()
+KEYS_ENTER = (curses.KEY_ENTER, ord('\n'), ord('\r'))
+KEYS_BACKSPACE = (curses.KEY_BACKSPACE, 8, 127)
 
 
 g = Globals()
 g.click_count = 0
 g.exercises = []
-g.total_answers = 0
-g.total_right = 0
+g.score = grading.Score()
 g.count = 0
+g.system = None
 
 
 class Window:
+    """The screen, split into windows that keep their contents between
+    exercises. The bid box, divider and hint never change, so they are
+    drawn once on the main window. Each exercise redraws only the
+    windows that change, and a step ends with one doupdate(), so curses
+    sends the terminal just the cells that differ."""
     scr: curses.window
     rows: int
     cols: int
+    top: curses.window      # info, dealer and the auction header
+    auction: curses.window
+    hand: curses.window
+    result: curses.window
+    expl: curses.window
+    entry: curses.window    # what has been typed of a bid
+    debug: curses.window
 
     def __init__(self, win: curses.window):
         self.scr = win
         curses.mousemask(1)
         self.rows, self.cols = self.scr.getmaxyx()
 
-
-def main(scr) -> None:
+    def make_windows(self) -> None:
+        "Call once the screen is known to be big enough."
+        curses.init_pair(1, FG_COLOR, BG_COLOR1)
+        curses.init_pair(2, FG_COLOR, BG_COLOR2)
+        attr = curses.color_pair(1) | curses.A_BOLD
+        self.scr.bkgd(' ', attr)
+        self.scr.erase()
+        show_bid_box(self.scr, ROW_BID_BOX, COL_BID_BOX)
+        self.scr.addstr(ROW_DIVIDER, 0, '------------------------------')
+        self.scr.addstr(ROW_HINT, 0, "Click or type a bid, ' ' to continue, 'q' to quit")
+        self.top = curses.newwin(ROW_AUCTION - ROW_TOP, self.cols, ROW_TOP, 0)
+        self.auction = curses.newwin(AUCTION_ROWS, COL_BID_BOX, ROW_AUCTION, 0)
+        self.hand = curses.newwin(ROW_DIVIDER - ROW_HAND, COL_BID_BOX, ROW_HAND, 0)
+        self.result = curses.newwin(1, self.cols, ROW_RESULT, 0)
+        self.expl = curses.newwin(EXPL_ROWS, self.cols, ROW_EXPL, 0)
+        self.entry = curses.newwin(1, self.cols, ROW_ENTRY, 0)
+        self.debug = curses.newwin(1, self.cols, ROW_DEBUG, 0)
+        for w in self.windows():
+            w.bkgd(' ', attr)
+        self.scr.noutrefresh()
+        self.update()
+
+    def windows(self) -> tuple[curses.window, ...]:
+        return (self.top, self.auction, self.hand, self.result, self.expl, self.entry,
+                self.debug)
+
+    def update(self) -> None:
+        "Send the changes in every window to the terminal at once."
+        for w in self.windows():
+            w.noutrefresh()
+        curses.doupdate()
+
+
+def start_logging() -> None:
     logging.basicConfig(level=LOG_LEVEL, filename='LOG.txt', filemode='w',
                         format='%(asctime)s %(levelname)s %(message)s')
     logging.debug(f'quiz.py {VERSION}')
 
+
+def main(scr, args: dict) -> None:
     win = Window(scr)
     logging.debug(f'screen rows: {win.rows} cols: {win.cols}')
     if win.rows < 40 or win.cols < 80:
         logging.fatal('Screen must be at least 40x80.')
         raise MyError('Screen must be at least 40x80')
-    keyword = ''
-    args = docopt.docopt(__doc__, version='0.01')
-    logging.debug(args)
-    if args['-k']:
-        keyword = args['-k']
-    g.exercises = read_exercises(args['EXERCISES'])
-    if not args['-s']:
-        random.shuffle(g.exercises)
-    for ex in g.exercises:
-        if keyword != '' and keyword not in ex.keys:
-            continue
-        want_more = show_exercise(ex, win)
+    win.make_windows()
+    if args['--stream']:
+        stream(args, win)
+        return
+    g.exercises = loader.read_exercises(args['EXERCISES'], args['--rebuild-cache'],
+                                        int(args['-j']))
+    ids = select_exercises(g.exercises, args['-k'])
+    logging.debug(f'{len(ids)} exercises selected')
+    if args['-s']:
+        order: Iterator[int] = iter(range(len(ids)))
+    else:
+        order = corpus.lazy_shuffle(len(ids), random.Random(g.seed))
+    # Deal the x's of every selected hand now, in one go.
+    cards, spots = spotfill.hand_arrays(g.exercises)
+    if not isinstance(ids, range):
+        cards, spots = cards[ids], spots[ids]
+    filled = spotfill.fill(cards, spots, np.random.default_rng(g.seed))
+    all_ids = history.exercise_ids(g.exercises)
+    ex_ids = [all_ids[i] for i in ids]
+    log = history.AnswerLog(args['-l'])
+    scheduler: Union[history.Scheduler, sampler.WeightedScheduler]
+    if args['-w']:
+        scheduler = sampler.WeightedScheduler(
+            ex_ids, key_members(key_index(g.exercises), ids),
+            lambda n: g.exercises[ids[n]].keys, log, random.Random(g.seed))
+    else:
+        scheduler = history.Scheduler(ex_ids, order, log)
+    for n in scheduler:
+        ex = g.exercises[ids[n]]
+        answered, right, want_more = show_exercise(ex, win, spotfill.filled_hand(filled[n]))
+        scheduler.review(n, answered, right)
         if not want_more:
             break
     curses.endwin()
 
-    pct = float(g.total_right / g.total_answers)
-    msg = f'Total: {g.total_answers}  Correct: {g.total_right}  Score: {100 * pct:2.0f}% '
-    print(msg)
-
-
-def read_exercises(files: list[str]) -> list[Exercise]:
-    ex_list: list[Exercise] = []
-    for fname in files:
-        logging.debug(f'Reading file {fname}')
-        with open(fname) as f:
-            while True:
-                ex = Exercise(f)
-                logging.debug('Return from Exercise()')
-                if not ex.valid:
-                    break
-                logging.debug('Read 1 exercise.')
-                ex_list.append(ex)
-    logging.debug(f'Total exercises read: {len(ex_list)}')
-    return ex_list
+    if g.score.answers == 0:
+        print('Nothing is due.')
+        return
+    print(g.score)
+
+
+def stream(args: dict, win: Window) -> None:
+    "Show exercises as they are read. Log the answers, but don't schedule them."
+    start = time.perf_counter()
+    exercises = loader.Prefetcher(args['EXERCISES'], args['-k'])
+    order = iter(exercises) if args['-s'] else exercises.shuffled(random.Random(g.seed))
+    log = history.AnswerLog(args['-l'])
+    # The hands arrive one at a time, so they are dealt one at a time.
+    rng = np.random.default_rng(g.seed)
+    for n, ex in enumerate(order):
+        if n == 0:
+            logging.debug(f'first exercise after {time.perf_counter() - start:.3f} s')
+        cards, spots = spotfill.hand_arrays([ex])
+        hand = spotfill.filled_hand(spotfill.fill(cards, spots, rng)[0])
+        answered, right, want_more = show_exercise(ex, win, hand)
+        if answered:
+            ex_id = history.exercise_id(history.content(ex))
+            log.append(ex_id, int(time.time()), answered, right)
+        if not want_more:
+            break
+    logging.debug(f'{exercises.count} exercises read')
+    curses.endwin()
+    print(g.score if g.score.answers else 'Nothing is due.')
 
 
-def show_exercise(ex: Exercise, win: Window) -> bool:
+def replay(args: dict) -> int:
+    "Grade the calls in the --replay file, with no screen. Return the exit status."
+    exercises = loader.read_exercises(args['EXERCISES'], args['--rebuild-cache'],
+                                      int(args['-j']))
+    ids = select_exercises(exercises, args['-k'])
+    answers = grading.answer_codes(exercises)
+    fname = args['--replay']
+    f = sys.stdin if fname == '-' else open(fname)
+    try:
+        score = grading.replay(answers, ids, f, sys.stdout)
+    except grading.ReplayError as e:
+        print(f'{fname}: {e}', file=sys.stderr)
+        return 1
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    print(score)
+    return 0
+
+
+def select_exercises(exercises: Sequence[Exercise], keys: list[str]) -> Sequence[int]:
+    "Return the ids of the exercises matching the -k options."
+    if not keys:
+        return range(len(exercises))
+    return key_index(exercises).select(keys)
+
+
+def key_index(exercises: Sequence[Exercise]) -> keyindex.KeyIndex:
+    "The keyword index. A corpus has one stored."
+    if isinstance(exercises, corpus.Corpus):
+        return exercises.key_index()
+    return keyindex.build_index(exercises)
+
+
+def key_members(index: keyindex.KeyIndex, ids: Sequence[int]) -> dict[str, np.ndarray]:
+    "For each key, the positions in ids (which ascend) of the exercises with it."
+    members = {}
+    wanted = np.asarray(ids)
+    for key, numbers in index.ids.items():
+        if len(wanted) == 0:
+            break
+        found = np.asarray(numbers, np.intp)
+        pos = np.searchsorted(wanted, found).clip(0, len(wanted) - 1)
+        pos = pos[wanted[pos] == found]
+        if len(pos):
+            members[key] = pos
+    return members
+
+
+def show_exercise(ex: Exercise, win: Window, hand: Hand) -> tuple[int, int, bool]:
+    """Show ex, with hand: its hand with the x's dealt. Return how many
+    calls were answered, which were right as a bitmask, and whether the
+    student wants more."""
     logging.debug('New exercise')
-    if g.count % 2 == 0:
-        curses.init_pair(1, FG_COLOR, BG_COLOR1)
-    else:
-        curses.init_pair(1, FG_COLOR, BG_COLOR2)
-    g.count += 1
-    win.scr.bkgd(' ', curses.color_pair(1) | curses.A_BOLD)
-    win.scr.clear()
-
-    show_screen_top(ex, win.scr, ROW_TOP)
-    show_hand(ex, win.scr, ROW_HAND)
-    show_bid_box(win.scr, ROW_BID_BOX, COL_BID_BOX)
-    win.scr.addstr(ROW_DIVIDER, 0, '------------------------------')
-    win.scr.addstr(ROW_HINT, 0, "Click to bid, ' ' to continue, 'q' to quit")
-    win.scr.refresh()
-
-    for i, answer in enumerate(ex.answers):
-        g.total_answers += 1
+    draw_exercise(ex, win, hand)
+    right = 0
+    for i, step in enumerate(ex.steps):
         logging.debug('Next auction.')
-        show_auction(win.scr, ROW_AUCTION, ex.auction)
-        bid = get_bid(win.scr)
-        win.scr.addstr(ROW_RESULT, 0, bid)
-        if bid == ex.answers[i].bid:
-            win.scr.addstr(ROW_RESULT, 6, 'Yes  ')
-            g.total_right += 1
-        else:
-            win.scr.addstr(ROW_RESULT, 6, 'WRONG')
-            show_explanation(win.scr, ROW_EXPL, ex.answers[i].expl)
-        pct = float(g.total_right / g.total_answers)
-        msg = f'Total: {g.total_answers}  Correct: {g.total_right}  Score: {100 * pct:2.0f} '
-        win.scr.addstr(ROW_RESULT, 15, msg)
+        show_auction(win.auction, 0, step.lines)
+        win.update()
+        bid = get_bid(win, step.before, DEALERS.index(ex.dealer))
+        allowed = g.system.allowed(step.before, ex.hand) if g.system else []
+        if g.score.check(bid, step.answer.code, allowed):
+            right |= 1 << i
+        draw_result(win, bid, step.answer, allowed)
+        win.update()
         logging.debug('wait for click')
-        _, _, ch = get_mouse_click(win.scr)
+        _, _, ch = get_mouse_click(win)
         if ch == ord('q'):
-            return False
-    return True
+            return i + 1, right, False
+    return len(ex.steps), right, True
+
+
+def draw_exercise(ex: Exercise, win: Window, hand: Hand) -> None:
+    "Draw a new exercise. The top window changes color, to show it's new."
+    g.count += 1
+    win.top.bkgd(' ', curses.color_pair(1 + g.count % 2) | curses.A_BOLD)
+    for w in (win.top, win.auction, win.hand, win.result, win.expl, win.entry):
+        w.erase()
+    show_screen_top(ex, win.top, 0)
+    show_hand(hand, win.hand, 0)
+
+
+def draw_result(win: Window, bid: int, answer: Answer, allowed: Collection[int]) -> None:
+    win.result.addstr(0, 0, f'{bids.NAMES[bid]:5}')
+    if bid == answer.code:
+        win.result.addstr(0, 6, 'Yes  ')
+        win.expl.erase()
+    elif bid in allowed:
+        win.result.addstr(0, 6, 'Yes  ')
+        show_explanation(win.expl, 0, [f'The system allows it. The answer is {answer.bid}.']
+                         + answer.expl)
+    else:
+        win.result.addstr(0, 6, 'WRONG')
+        show_explanation(win.expl, 0, answer.expl)
+    win.result.addstr(0, 15, f'{g.score} ')
 
 
 def show_screen_top(ex: Exercise, scr: curses.window, row: int) -> None:
@@ -176,106 +410,103 @@ def show_screen_top(ex: Exercise, scr: curses.window, row: int) -> None:
     scr.addstr(row + 9, 0, '----- ----- ----- -----')
 
 
-def show_hand(ex: Exercise, scr: curses.window, row: int) -> None:
+def show_hand(hand: Hand, scr: curses.window, row: int) -> None:
     scr.addstr(row, 0, '---------- Your hand ----------')
     row += 2
-    for i, suit in enumerate(ex.hand.suits):
+    for i, suit in enumerate(hand.suits):
         scr.addstr(row + i, 0, f'{SUIT_SYMS[i]} {suit}')
 
 
 def show_bid_box(scr: curses.window, row: int, col: int) -> None:
     scr.addstr(row, col, '    BID BOX')
     scr.addstr(row + 1, col, '--------------------')
-    scr.addstr(row + 2, col, f'7{C}  7{D}  7{H}  7{S}  7NT')
-    scr.addstr(row + 3, col, f'6{C}  6{D}  6{H}  6{S}  6NT')
-    scr.addstr(row + 4, col, f'5{C}  5{D}  5{H}  5{S}  5NT')
-    scr.addstr(row + 5, col, f'4{C}  4{D}  4{H}  4{S}  4NT')
-    scr.addstr(row + 6, col, f'3{C}  3{D}  3{H}  3{S}  3NT')
-    scr.addstr(row + 7, col, f'2{C}  2{D}  2{H}  2{S}  2NT')
-    scr.addstr(row + 8, col, f'1{C}  1{D}  1{H}  1{S}  1NT')
-    scr.addstr(row + 9, col, 'PASS  DBL   RDBL')
-
-
-def show_auction(scr: curses.window, row: int, auction: list[str]) -> None:
-    next = []
-    # Append bids to 'next' until we find one that starts with '*'.
-    for bid in auction:
-        if bid.startswith('*'):
-            break
-        next.append(bid)
-    n = len(next)
-    auction[n] = auction[n][1:]  # remove the '*' from this bid
-    next.append('?')
-    # scr.addstr(row, 0, ' '.join(next))
-    i = 0
-    # Print the auction, 4 bids on each line.
-    while i < len(next):
-        this_line = next[i:i + 4]
-        s = ''
-        for bid in this_line:
-            s += f'{bid:6}'
-        scr.addstr(row + i // 4, 0, s)
-        i += 4
-
-
-def get_bid(scr: curses.window) -> str:
-    "Translate a bidbox click to a bid."
-    logging.debug('get_bid')
-    top = ROW_BID_BOX
-    left = COL_BID_BOX
-    # Loop until he clicks somewhere in the bidbox.
-    while True:
-        x, y, ch = get_mouse_click(scr)
-        logging.debug(f'click y: {y}  x: {x}')
-        if x >= left and x < left + 20 and y >= top + 2 and y < top + 7 + 2:
-            bid = level_and_suit(y, x)
-            logging.debug(f'bid was: {bid}')
-            return bid
-        if y == top + 9 and x >= 39 and x <= 54:
-            bid = pass_dbl_rdbl(x)
-            logging.debug(f'bid was: {bid}')
-            return bid
-
+    for i, (codes, width) in enumerate(BID_BOX):
+        s = ''.join(f'{box_name(code):{width}}' for code in codes)
+        scr.addstr(row + 2 + i, col, s.rstrip())
 
-SUITS = ('C', 'D', 'H', 'S', 'NT')
 
+def box_name(code: int) -> str:
+    "How a call is shown in the bid box: 1\u2663, 1NT, PASS..."
+    if code >= bids.PASS or code % 5 == 4:
+        return bids.NAMES[code]
+    return f'{code // 5 + 1}{SUIT_SYMS[3 - code % 5]}'
 
-def level_and_suit(y: int, x: int) -> str:
-    "Translate click to <level><suit>."
-    level = 7 - (y - ROW_BID_BOX - 2)
-    suit = (x - COL_BID_BOX) // 4
-    return str(level) + SUITS[suit]
 
-
-CALLS = ('PASS', 'DBL', 'RDBL')
+def show_auction(scr: curses.window, row: int, lines: Sequence[str]) -> None:
+    """Show the auction up to a step's call, e.g. Exercise.steps[n].lines.
+    Only the last AUCTION_ROWS rows fit."""
+    if len(lines) > AUCTION_ROWS:
+        # The rows have moved up, so write over all of each old one.
+        lines = [line.ljust(COL_BID_BOX - 1) for line in lines[-AUCTION_ROWS:]]
+    for i, line in enumerate(lines):
+        scr.addstr(row + i, 0, line)
 
 
-def pass_dbl_rdbl(x: int) -> str:
-    "Translate click to PASS, DBL, or RDBL."
-    offset = (x - COL_BID_BOX) // 6
-    return CALLS[offset]
+def get_bid(win: Window, before: bytes, dealer: int) -> int:
+    """Read a call, clicked in the bid box or typed, and return its code.
+    Calls that can't follow the auction so far are refused."""
+    logging.debug('get_bid')
+    node = BID_TRIE
+    typed = ''
+    while True:
+        x, y, ch = get_mouse_click(win)
+        bid = -1
+        if ch == curses.KEY_MOUSE:
+            logging.debug(f'click y: {y}  x: {x}')
+            bid = BID_CELLS.get((y, x), -1)
+            node, typed = BID_TRIE, ''
+        elif ch in KEYS_ENTER:
+            bid = node.code
+            node, typed = BID_TRIE, ''
+        elif ch in KEYS_BACKSPACE:
+            typed = typed[:-1]
+            node = BID_TRIE
+            for c in typed:
+                node = node.children[c]
+        elif 0 <= ch < 256 and chr(ch).upper() in node.children:
+            typed += chr(ch).upper()
+            node = node.children[typed[-1]]
+            if not node.children:
+                bid = node.code
+                node, typed = BID_TRIE, ''
+        else:
+            node, typed = BID_TRIE, ''
+        msg = f'Your bid: {typed}'
+        if bid >= 0:
+            logging.debug(f'bid was: {bid}')
+            error = grading.bid_error(before, dealer, bid)
+            if not error:
+                win.entry.erase()
+                return bid
+            msg = f'{bids.NAMES[bid]}: {error}'
+        win.entry.erase()
+        win.entry.addstr(0, 0, msg)
+        win.entry.refresh()
 
 
 def show_explanation(scr: curses.window, row: int, expl: list[str]) -> None:
-    for i in range(4):
-        scr.addstr(row + i, 0, 80 * ' ')
-    for i, line in enumerate(expl):
+    for i in range(EXPL_ROWS):
+        scr.move(row + i, 0)
+        scr.clrtoeol()
+    for i, line in enumerate(expl[:EXPL_ROWS]):
         scr.addstr(row + i, 0, line)
 
 
-def get_mouse_click(scr: curses.window) -> tuple[int, int, int]:
+def get_mouse_click(win: Window) -> tuple[int, int, int]:
     " return x, y, char"
     x = -1
     y = -1
     try:
-        ch = scr.getch()
+        # Nothing is drawn on the main window after the start, so
+        # getch() has nothing to refresh.
+        ch = win.scr.getch()
         if ch == ord('q'):  # XXX Probably not good code.
             return x, y, ch
         if ch == curses.KEY_MOUSE:
             g.click_count += 1
             _, x, y, _, _ = curses.getmouse()
             logging.debug(f'mouse: y: {y}  x: {x}')
-            debug(scr, f'click {g.click_count}  y: {y}, x: {x}')
+            debug(win, f'click {g.click_count}  y: {y}, x: {x}')
     except curses.error:
         logging.debug('curses error')
         raise MyError('curses error')
@@ -292,12 +523,25 @@ def print_explanation(expl: list[str]) -> None:
         print(line)
 
 
-def debug(scr: curses.window, msg: str) -> None:
+def debug(win: Window, msg: str) -> None:
     "Write a message to the bottom line on screen."
-    scr.move(ROW_DEBUG, 0)
-    scr.clrtoeol()
-    scr.addstr(ROW_DEBUG, 0, 'debug: ' + msg)
+    win.debug.erase()
+    win.debug.addstr(0, 0, 'debug: ' + msg)
+    win.debug.refresh()
 
 
 if __name__ == '__main__':
-    curses.wrapper(main)
+    args = docopt.docopt(__doc__, version=VERSION)
+    start_logging()
+    logging.debug(args)
+    if args['--replay']:
+        sys.exit(replay(args))
+    g.seed = int(args['--seed']) if args['--seed'] else random.randrange(1 << 32)
+    logging.debug(f'seed {g.seed}')
+    if args['--system']:
+        try:
+            g.system = system.read_system(args['--system'])
+        except (OSError, ParseError) as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+    curses.wrapper(main, args)
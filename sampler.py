@@ -0,0 +1,188 @@
+"""
+sampler.py: Choose exercises at random, more often the ones the student
+gets wrong, and those sharing their keys. quiz.py -w uses this.
+
+An exercise's weight is 1 + MISS_WEIGHT * misses, where misses is the
+fraction of its calls missed the last time it was shown, plus half of
+that of the time before, and so on. Besides that, each key gets
+KEY_SHARE of the extra weight of its exercises, spread evenly over all
+of its exercises. So a missed Stayman exercise comes up more often, and
+so do the other Stayman exercises, a little.
+
+A draw takes O(1) time. The exercises are kept in classes by weight:
+class c holds those with weight up to 2 ** c. One of the classes or
+keys is chosen with Walker's alias method, then an exercise in it at
+random, and an exercise of a class is kept with probability weight /
+2 ** c, at least 1/2; otherwise the draw starts again. After an answer
+the exercise moves to its new class in O(1), and the alias table, which
+has one entry per class and key, is rebuilt. Nothing takes time in
+proportion to the number of exercises, after the start.
+"""
+
+
+import math
+import random
+import time
+from array import array
+from collections.abc import Callable, Iterator, Sequence
+import numpy as np
+import history
+
+
+MISS_WEIGHT = 4.0
+KEY_SHARE = 0.25
+DECAY = 0.5
+# misses is at most 1 / (1 - DECAY) = 2, so a weight is at most 9,
+# in class 4.
+CLASSES = 5
+
+
+def alias_table(weights: Sequence[float]) -> tuple[list[float], list[int]]:
+    """Walker's alias table for choosing i with probability proportional
+    to weights[i]: pick a slot i at random, then take i with probability
+    prob[i], or else alias[i]. Vose's construction, O(len(weights))."""
+    n = len(weights)
+    total = sum(weights)
+    assert n and total > 0, 'nothing to choose from'
+    scaled = [w * n / total for w in weights]
+    prob = [1.0] * n
+    alias = list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1]
+    large = [i for i, p in enumerate(scaled) if p >= 1]
+    while small and large:
+        s = small.pop()
+        g = large[-1]
+        prob[s] = scaled[s]
+        alias[s] = g
+        scaled[g] -= 1 - scaled[s]
+        if scaled[g] < 1:
+            small.append(large.pop())
+    # What is left is 1, give or take rounding.
+    return prob, alias
+
+
+def weight_class(weight: float) -> int:
+    "The class of an exercise with this weight: the least c with weight <= 2 ** c."
+    return 0 if weight <= 1 else min(CLASSES - 1, math.ceil(math.log2(weight)))
+
+
+class WeightedScheduler:
+    """Choose exercises as history.Scheduler does, but at random, by
+    weight. Exercises repeat, so the quiz goes on until the student quits."""
+    ids: list[bytes]
+    keys_of: Callable[[int], Sequence[str]]
+    rng: random.Random
+    log: history.AnswerLog
+    misses: list[float]
+    # members[c] holds the exercises of class c, and where[n] is n's
+    # index in its class's list, so an exercise can be moved in O(1).
+    members: list[list[int]]
+    where: array
+    klass: array
+    keys: list[str]
+    key_members: list[array]  # the exercises with each key
+    key_extra: list[float]    # the extra weight of each key's exercises
+    key_number: dict[str, int]
+    # The alias table: entries 0 to CLASSES - 1 are the classes, then the keys.
+    prob: list[float]
+    alias: list[int]
+    last: int
+
+    def __init__(self, ids: list[bytes], key_members: dict[str, np.ndarray],
+                 keys_of: Callable[[int], Sequence[str]], log: history.AnswerLog,
+                 rng: random.Random):
+        """ids are the exercises' ids. key_members holds the numbers of the
+        exercises with each key, and keys_of(n) gives exercise n's keys."""
+        self.ids = ids
+        self.keys_of = keys_of
+        self.rng = rng
+        self.log = log
+        misses = log.misses(ids, DECAY)
+        weights = 1 + MISS_WEIGHT * misses
+        # weight_class, for all of them at once.
+        klass = np.where(weights <= 1, 0,
+                         np.minimum(CLASSES - 1, np.ceil(np.log2(weights)))).astype(np.intp)
+        self.misses = misses.tolist()
+        self.klass = array('B', klass.astype(np.uint8).tobytes())
+        order = np.argsort(klass, kind='stable')
+        bounds = np.searchsorted(klass[order], np.arange(CLASSES + 1))
+        self.members = [order[bounds[c]:bounds[c + 1]].tolist() for c in range(CLASSES)]
+        where = np.zeros(len(ids), np.int64)
+        where[order] = np.arange(len(ids)) - bounds[klass[order]]
+        self.where = array('q', where.tobytes())
+        self.keys = sorted(key_members)
+        self.key_number = {key: i for i, key in enumerate(self.keys)}
+        self.key_members = []
+        self.key_extra = []
+        for key in self.keys:
+            numbers = key_members[key]
+            self.key_members.append(array('I', numbers.astype(np.uint32).tobytes()))
+            self.key_extra.append(float((weights[numbers] - 1).sum()))
+        self.last = -1
+        if ids:
+            self.rebuild()
+
+    def weight(self, n: int) -> float:
+        return 1 + MISS_WEIGHT * self.misses[n]
+
+    def rebuild(self) -> None:
+        "Make the alias table again. It has an entry for each class and key."
+        entries = [(1 << c) * len(m) for c, m in enumerate(self.members)]
+        # A key's extra weight is a running sum, so it may round to just under 0.
+        entries += [KEY_SHARE * max(0.0, extra) for extra in self.key_extra]
+        self.prob, self.alias = alias_table(entries)
+
+    def __iter__(self) -> Iterator[int]:
+        return self
+
+    def __next__(self) -> int:
+        "Return the number of the next exercise to show. It is never the last one shown."
+        if not self.ids:
+            raise StopIteration
+        rand = self.rng.random
+        prob, alias, members = self.prob, self.alias, self.members
+        while True:
+            slot = int(rand() * len(prob))
+            entry = slot if rand() < prob[slot] else alias[slot]
+            if entry < CLASSES:
+                exercises = members[entry]
+                if not exercises:  # rounding gave an empty class a slot
+                    continue
+                n = exercises[int(rand() * len(exercises))]
+                if rand() * (1 << entry) >= self.weight(n):
+                    continue
+            else:
+                exercises = self.key_members[entry - CLASSES]
+                n = exercises[int(rand() * len(exercises))]
+            if n != self.last or len(self.ids) == 1:
+                self.last = n
+                return n
+
+    def review(self, n: int, answered: int, right_mask: int) -> None:
+        "Record how exercise n went, and change its weight."
+        if answered == 0:
+            return
+        missed = 1 - bin(right_mask).count('1') / answered
+        before = self.weight(n)
+        self.misses[n] = DECAY * self.misses[n] + missed
+        after = self.weight(n)
+        self.move(n, weight_class(after))
+        for key in set(self.keys_of(n)):
+            if key in self.key_number:
+                self.key_extra[self.key_number[key]] += after - before
+        self.rebuild()
+        self.log.append(self.ids[n], int(time.time()), answered, right_mask)
+
+    def move(self, n: int, klass: int) -> None:
+        "Move exercise n to another class."
+        old = self.members[self.klass[n]]
+        # Put the last member in n's place.
+        i = self.where[n]
+        moved = old.pop()
+        if moved != n:
+            old[i] = moved
+            self.where[moved] = i
+        new = self.members[klass]
+        self.where[n] = len(new)
+        new.append(n)
+        self.klass[n] = klass
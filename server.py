@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+"""
+server.py: Serve bidding exercises to many students at once, over a
+line protocol that telnet or nc can talk.
+
+Usage:
+    server.py [-p <port>] [-u <path>] [-j <jobs>] [--system <rules>] [--seed <n>]
+              [--rebuild-cache] EXERCISES...
+    server.py   --version
+    server.py   --help
+
+Options and commands:
+    --version          Show version and exit.
+    -h --help          Show this message and exit.
+    -p <port>          Listen on this TCP port on localhost [default: 7777].
+    -u <path>          Listen on this Unix socket instead.
+    -j <jobs>          Parse the exercise files with this many processes
+                       [default: 1].
+    --system <rules>   Also accept the calls this bidding system allows with
+                       the hand, as well as the answer. See system.txt.
+    --seed <n>         Deal the cards written as x, and shuffle for each
+                       session, from this seed. Without it a seed is
+                       chosen, and logged.
+    --rebuild-cache    Parse the exercise files even if their caches are fresh.
+
+EXERCISES are .exr files, or .exb corpora made by corpus.py. They are
+loaded once and shared by every session. Each session has its own
+order, keyword filter and score. Sessions are numbered from 0 as they
+connect, and a session's order comes from the seed and its number.
+A student types a call at the '> ' prompt, or one of:
+    keys [<key>...]    Show only exercises with these keys, as quiz.py -k.
+    score              Show the score.
+    quit               Leave.
+"""
+
+
+import asyncio
+import logging
+import random
+from collections.abc import Iterator, Sequence
+from typing import Optional
+import docopt  # type: ignore
+import numpy as np
+import bids
+import corpus
+import grading
+import keyindex
+import loader
+import spotfill
+import system
+from exercise import DEALERS, Exercise, ParseError
+
+
+VERSION = '0.01'
+LOG_LEVEL = 'INFO'
+PROMPT = b'> '
+HELP = "Type a call (1NT, 2s, p, x, xx), 'keys <key>...', 'score' or 'quit'."
+
+
+class Shared:
+    """What every session reads: the exercises, their keyword index, the
+    system, and each hand's cards with the x's dealt."""
+    exercises: Sequence[Exercise]
+    index: Optional[keyindex.KeyIndex]
+    system: Optional[system.System]
+    seed: int
+    filled: np.ndarray
+    sessions: int              # sessions started so far
+
+    def __init__(self, exercises: Sequence[Exercise],
+                 bidding: Optional[system.System] = None, seed: int = 0):
+        self.exercises = exercises
+        self.index = None
+        self.system = bidding
+        self.seed = seed
+        cards, spots = spotfill.hand_arrays(exercises)
+        self.filled = spotfill.fill(cards, spots, np.random.default_rng(seed))
+        self.sessions = 0
+
+    def select(self, keys: list[str]) -> Sequence[int]:
+        "Return the ids of the exercises with these keys, as quiz.py -k."
+        if not keys:
+            return range(len(self.exercises))
+        if self.index is None:
+            if isinstance(self.exercises, corpus.Corpus):
+                self.index = self.exercises.key_index()
+            else:
+                self.index = keyindex.build_index(self.exercises)
+        return self.index.select(keys)
+
+
+class Session:
+    "One student: the exercises chosen, their order, and the score."
+    shared: Shared
+    number: int
+    rng: random.Random
+    ids: Sequence[int]
+    order: Iterator[int]
+    ex: Optional[Exercise]
+    hand: list[str]            # the lines showing ex's hand
+    step: int                  # the answer being asked for
+    score: grading.Score
+
+    def __init__(self, shared: Shared):
+        self.shared = shared
+        self.number = shared.sessions
+        shared.sessions += 1
+        self.rng = random.Random(shared.seed + self.number)
+        self.score = grading.Score()
+        self.set_keys([])
+
+    def set_keys(self, keys: list[str]) -> None:
+        "Choose the exercises with these keys, shuffled, and go to the first."
+        self.ids = self.shared.select(keys)
+        self.order = corpus.lazy_shuffle(len(self.ids), self.rng)
+        self.next_exercise()
+
+    def next_exercise(self) -> None:
+        n = next(self.order, None)
+        self.ex = None if n is None else self.shared.exercises[self.ids[n]]
+        self.step = 0
+        # The hand is shown at every step.
+        if n is not None:
+            hand = spotfill.filled_hand(self.shared.filled[self.ids[n]])
+            self.hand = ['', '---------- Your hand ----------', str(hand)]
+
+    def show(self) -> list[str]:
+        "The lines that ask for the next call."
+        ex = self.ex
+        if ex is None:
+            return ['No more exercises.', str(self.score)]
+        lines = []
+        if self.step == 0:
+            lines += ['', '=' * 32]
+            lines += ex.info
+            lines += ['-' * 32, f'Dealer: {ex.dealer}  Vulnerable: {ex.vulnerable}', '']
+        lines += ['North East  South West', '----- ----- ----- -----']
+        lines += ex.steps[self.step].lines
+        return lines + self.hand
+
+    def answer(self, call: int) -> list[str]:
+        "Grade a call. Return the lines to show, then ask for the next call."
+        ex = self.ex
+        assert ex is not None
+        step = ex.steps[self.step]
+        error = grading.bid_error(step.before, DEALERS.index(ex.dealer), call)
+        if error:
+            return [f'{bids.NAMES[call]}: {error}']
+        answer = step.answer
+        bidding = self.shared.system
+        allowed = bidding.allowed(step.before, ex.hand) if bidding else []
+        if self.score.check(call, answer.code, allowed):
+            lines = [f'{bids.NAMES[call]}  Yes']
+            if call != answer.code:
+                lines.append(f'The system allows it. The answer is {answer.bid}.')
+                lines += answer.expl
+        else:
+            lines = [f'{bids.NAMES[call]}  WRONG, the answer is {answer.bid}']
+            lines += answer.expl
+        lines.append(str(self.score))
+        self.step += 1
+        if self.step == len(ex.steps):
+            self.next_exercise()
+        return lines + self.show()
+
+    def command(self, line: str) -> Optional[list[str]]:
+        "Act on one line from the student. Return what to show, or None to quit."
+        words = line.split()
+        if not words:
+            return self.show()
+        word = words[0].lower()
+        if word in ('quit', 'q'):
+            return None
+        if word == 'help':
+            return [HELP]
+        if word == 'score':
+            return [str(self.score)]
+        if word == 'keys':
+            self.set_keys(words[1:])
+            return [f'{len(self.ids)} exercises'] + self.show()
+        if self.ex is None:
+            return ['No more exercises.', HELP]
+        call = bids.CODES.get(line.strip().upper(), bids.PAD)
+        if call == bids.PAD:
+            return [f'{line.strip()!r} is not a call. {HELP}']
+        return self.answer(call)
+
+
+async def serve_session(shared: Shared, reader: asyncio.StreamReader,
+                        writer: asyncio.StreamWriter) -> None:
+    session = Session(shared)
+    lines: Optional[list[str]] = \
+        [f'server.py {VERSION}: {len(session.ids)} exercises. {HELP}'] + session.show()
+    try:
+        while lines is not None:
+            writer.write(('\r\n'.join(lines) + '\r\n').encode() + PROMPT)
+            await writer.drain()
+            data = await reader.readline()
+            if not data:
+                break
+            lines = session.command(data.decode(errors='replace'))
+        logging.info(f'session {session.number} ends: {session.score}')
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(shared: Shared, port: int, path: Optional[str]) -> None:
+    def handle(reader, writer):
+        return serve_session(shared, reader, writer)
+    if path:
+        server = await asyncio.start_unix_server(handle, path, backlog=1024)
+    else:
+        server = await asyncio.start_server(handle, '127.0.0.1', port, backlog=1024)
+    logging.info(f'listening on {path or port}')
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    args = docopt.docopt(__doc__, version=VERSION)
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(message)s')
+    bidding = None
+    if args['--system']:
+        try:
+            bidding = system.read_system(args['--system'])
+        except (OSError, ParseError) as e:
+            logging.fatal(str(e))
+            return
+    seed = int(args['--seed']) if args['--seed'] else random.randrange(1 << 32)
+    logging.info(f'seed {seed}')
+    exercises = loader.read_exercises(args['EXERCISES'], args['--rebuild-cache'],
+                                      int(args['-j']))
+    logging.info(f'{len(exercises)} exercises')
+    try:
+        asyncio.run(serve(Shared(exercises, bidding, seed), int(args['-p']), args['-u']))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
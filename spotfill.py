@@ -0,0 +1,80 @@
+"""
+spotfill.py: Turn the x's in hands into real low cards.
+
+Parsing keeps the x's as written (see exercise.Hand.spots), so a file
+gives the same hands every time it is read. A session fills them in
+once, from one seed, for all of its hands at once: the same seed and
+the same files give the same cards. A card the hand already holds is
+never drawn again.
+"""
+
+
+from collections.abc import Sequence
+import numpy as np
+import corpus
+from exercise import Exercise, Hand
+
+
+# An x is one of the 2 to the 9, unless the hand holds all of them.
+LOW_RANKS = 8
+# Hands are filled this many at a time, to bound the memory used. The
+# draws don't depend on it, so neither do the cards.
+BATCH = 1 << 16
+BITS = np.arange(52, dtype=np.uint64)
+SUIT_SHIFTS = np.arange(0, 16, 4, dtype=np.uint16)
+# The hand in a corpus record. See corpus.RECORD.
+RECORD_DTYPE = np.dtype({'names': ['masks', 'spots'],
+                         'formats': [('<u2', 4), ('u1', 4)],
+                         'offsets': [16, 24],
+                         'itemsize': corpus.RECORD.size})
+
+
+def hand_arrays(exercises: Sequence[Exercise]) -> tuple[np.ndarray, np.ndarray]:
+    "The cards and spots of every hand, in order. A corpus is not decoded."
+    if not isinstance(exercises, corpus.Corpus):
+        cards = np.array([ex.hand.cards for ex in exercises], dtype=np.uint64)
+        spots = np.array([ex.hand.spots for ex in exercises], dtype=np.uint16)
+        return cards, spots
+    card_parts = []
+    spot_parts = []
+    for mm in exercises.maps:
+        _, _, count, _ = corpus.HEADER.unpack_from(mm, 0)
+        rec = np.frombuffer(mm, RECORD_DTYPE, count, corpus.HEADER.size)
+        suits = rec['masks'].astype(np.uint64) << (13 * BITS[:4])
+        card_parts.append(suits.sum(axis=1, dtype=np.uint64))
+        counts = rec['spots'].astype(np.uint16) << SUIT_SHIFTS
+        spot_parts.append(counts.sum(axis=1, dtype=np.uint16))
+    return np.concatenate(card_parts), np.concatenate(spot_parts)
+
+
+def fill(cards: np.ndarray, spots: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Return the cards of each hand with a card for each of its x's,
+    drawn from rng. See fill_batch."""
+    parts = [fill_batch(cards[i:i + BATCH], spots[i:i + BATCH], rng)
+             for i in range(0, len(cards), BATCH)]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint64)
+
+
+def fill_batch(cards: np.ndarray, spots: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """The x's in a suit become distinct cards the hand doesn't hold, each
+    choice equally likely. Cards above the 9 are used only when the
+    hand holds every lower card of the suit."""
+    n = len(cards)
+    held = ((cards[:, None] >> BITS) & np.uint64(1)).astype(bool).reshape(n, 4, 13)
+    want = ((spots[:, None] >> SUIT_SHIFTS) & 0xf).astype(np.intp)
+    # Give each card a random key, and take the suit's lowest keys.
+    # Cards above the 9 get higher keys, and held cards the highest.
+    keys = rng.random((n, 4, 13))
+    keys[:, :, LOW_RANKS:] += 1
+    keys[held] = 3
+    cut = np.take_along_axis(np.sort(keys, axis=2), np.maximum(want - 1, 0)[:, :, None], axis=2)
+    chosen = (keys <= cut) & (want > 0)[:, :, None]
+    assert not (chosen & held).any(), 'more cards than a suit has'
+    return cards | (chosen.reshape(n, 52).astype(np.uint64) << BITS).sum(axis=1, dtype=np.uint64)
+
+
+def filled_hand(cards: int) -> Hand:
+    "A hand of these cards, with no x's."
+    hand = Hand()
+    hand.cards = int(cards)
+    return hand
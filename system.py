@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+"""
+system.py: Check the answers in exercise files against a bidding system.
+The system is a rules file like system.txt: which calls it makes after
+each auction, and with what hands. Every answer the system contradicts
+is reported, with the reason.
+
+Usage:
+    system.py [-q] [-j <jobs>] [--rebuild-cache] <rules> EXERCISES...
+    system.py   --version
+    system.py   --help
+
+Options and commands:
+    --version          Show version and exit.
+    -h --help          Show this message and exit.
+    -j <jobs>          Parse the exercise files with this many processes
+                       [default: 1].
+    -q                 Show only the summary.
+    --rebuild-cache    Parse the exercise files even if their caches are fresh.
+
+EXERCISES are .exr files, or .exb corpora made by corpus.py. Exercises
+are numbered from 1, in file order, as quiz.py -s shows them.
+"""
+
+
+import sys
+from collections.abc import Iterator, Sequence
+import docopt  # type: ignore
+import bids
+import constraints
+import corpus
+import handeval
+import loader
+from exercise import Exercise, Hand, ParseError
+
+
+VERSION = '0.01'
+# For bytes.translate: drop the '-' before the dealer, and the marks.
+UNMARK = bytes(code & ~bids.MARK for code in range(256))
+PADS = bytes([bids.PAD])
+
+
+class Rule:
+    "The system makes call after some auction with a hand matching clauses."
+    call: int
+    clauses: constraints.Constraints
+    text: str  # the hand, as the rules file describes it
+
+    def __init__(self, call: int, clauses: constraints.Constraints, text: str):
+        self.call = call
+        self.clauses = clauses
+        self.text = text
+
+
+class System:
+    """The rules of a bidding system, by the auction before the student's
+    call. The auction is the codes from the dealer on, with no marks."""
+    rules: dict[bytes, list[Rule]]
+
+    def __init__(self) -> None:
+        self.rules = {}
+
+    def lookup(self, before: bytes) -> list[Rule]:
+        "The rules for the calls before a step, as in Exercise.steps."
+        return self.rules.get(before.translate(UNMARK, PADS), [])
+
+    def allowed(self, before: bytes, hand: Hand) -> list[int]:
+        "The calls the system allows after before, with this hand."
+        rules = self.lookup(before)
+        if not rules:
+            return []
+        feats = constraints.features(hand.cards, hand.spots)
+        shape = handeval.shape(hand.cards, hand.spots)
+        return [r.call for r in rules if constraints.matches(r.clauses, feats, shape)]
+
+
+def read_system(fname: str) -> System:
+    "Compile a rules file. See system.txt."
+    system = System()
+    with open(fname) as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            fld = line.split(':')
+            if len(fld) != 3:
+                raise ParseError('expected <auctions>: <call>: <hand>', fname, n)
+            try:
+                call = bids.CODES[fld[1].strip().upper()]
+                clauses = constraints.parse(fld[2])
+                auctions = [b'' if a == '-' else bids.parse_compact(a)
+                            for a in fld[0].split()]
+            except KeyError:
+                raise ParseError(f'bad call {fld[1].strip()!r}', fname, n) from None
+            except (bids.BidError, constraints.ConstraintError) as e:
+                raise ParseError(str(e), fname, n) from None
+            if call == bids.PAD or not auctions:
+                raise ParseError('a rule needs a call and an auction', fname, n)
+            rule = Rule(call, clauses, fld[2].strip() or 'any hand')
+            for auction in auctions:
+                errors = bids.auction_errors(auction + bytes([call]), 0, padded=False)
+                if errors:
+                    raise ParseError(f'{" ".join(bids.names(auction))}: {errors[0][1]}', fname, n)
+                system.rules.setdefault(auction, []).append(rule)
+    return system
+
+
+def judge(rules: list[Rule], call: int, feats: dict[str, int], shape: str) -> str:
+    "Why the system doesn't make call with this hand, or '' if it may."
+    allowed = [r for r in rules if constraints.matches(r.clauses, feats, shape)]
+    if any(r.call == call for r in allowed):
+        return ''
+    own = [r.text for r in rules if r.call == call]
+    if own:
+        return f'{bids.NAMES[call]} needs {" or ".join(own)}'
+    if allowed:
+        calls = sorted({r.call for r in allowed})
+        return f'the system bids {" or ".join(bids.NAMES[c] for c in calls)}'
+    return ''
+
+
+def hands_and_auctions(exercises: Sequence[Exercise]) -> Iterator[tuple[int, int, bytes, bytes]]:
+    "Yield cards, spots, auction and answer codes for each exercise. A corpus is not decoded."
+    if isinstance(exercises, corpus.Corpus):
+        for content in exercises.contents():
+            fld = corpus.CONTENT.unpack(content)
+            cards = fld[4] | fld[5] << 13 | fld[6] << 26 | fld[7] << 39
+            spots = fld[8] | fld[9] << 4 | fld[10] << 8 | fld[11] << 12
+            yield cards, spots, fld[12][:fld[2]], fld[13][:fld[3]]
+    else:
+        for ex in exercises:
+            yield ex.hand.cards, ex.hand.spots, ex.codes, bytes(a.code for a in ex.answers)
+
+
+def check(system: System, exercises: Sequence[Exercise]) -> Iterator[tuple[int, int, str]]:
+    """Yield the exercise number, answer number and reason for each
+    answer the system contradicts, in order."""
+    # First find the answers the system has rules for, so only their
+    # hands are evaluated, and all in one pass.
+    found: list[tuple[int, int, int, int, list[Rule]]] = []  # hand, exercise, step, call
+    cards: list[int] = []
+    spots: list[int] = []
+    rules = system.rules
+    for n, (c, x, codes, answers) in enumerate(hands_and_auctions(exercises)):
+        codes = codes.translate(None, PADS)
+        step = 0
+        for pos, code in enumerate(codes):
+            if not code & bids.MARK:
+                continue
+            step_rules = rules.get(codes[:pos].translate(UNMARK))
+            if step_rules and step < len(answers):
+                if not found or found[-1][1] != n:
+                    cards.append(c)
+                    spots.append(x)
+                found.append((len(cards) - 1, n, step, answers[step], step_rules))
+            step += 1
+    table = handeval.evaluate_many(cards, spots)
+    for h, n, step, call, step_rules in found:
+        feats = constraints.feature_dict(table.hcp[h], table.controls[h], table.losers[h],
+                                         table.lengths[h])
+        reason = judge(step_rules, call, feats, table.shapes[h])
+        if reason:
+            yield n, step, reason
+
+
+def main() -> None:
+    args = docopt.docopt(__doc__, version=VERSION)
+    try:
+        system = read_system(args['<rules>'])
+    except (OSError, ParseError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+    exercises = loader.read_exercises(args['EXERCISES'], args['--rebuild-cache'],
+                                      int(args['-j']))
+    errors = 0
+    flagged = set()
+    for n, step, reason in check(system, exercises):
+        errors += 1
+        flagged.add(n)
+        if not args['-q']:
+            print(f'exercise {n + 1}, answer {step + 1}: {reason}')
+    print(f'{len(exercises)} exercises, {errors} answers against the system '
+          f'in {len(flagged)} exercises')
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
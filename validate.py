@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""
+validate.py: Check that the auctions in exercise files are legal
+bridge auctions, and that the answers match the marked calls.
+Every error is reported, not just the first, with one summary at the end.
+'make lint' runs this on every exercise file under a directory.
+
+Usage:
+    validate.py [-q] [-j <jobs>] FILES...
+    validate.py   --version
+    validate.py   --help
+
+Options and commands:
+    --version          Show version and exit.
+    -h --help          Show this message and exit.
+    -j <jobs>          Check files with this many processes [default: 1].
+    -q                 Show only the summary.
+
+FILES may be .exr files, .exb corpora made by corpus.py, or question
+files like example.txt. A directory stands for every .exr and .exb
+file under it. An exercise that can't be parsed is reported at its
+file and line, and the rest of the file is still checked.
+"""
+
+
+import os
+import re
+import sys
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+import docopt  # type: ignore
+import bids
+import corpus
+import exercise
+import question
+
+
+VERSION = '0.01'
+QUESTION_RE = re.compile(r'^Question\s*$', re.MULTILINE)
+
+
+def main() -> None:
+    args = docopt.docopt(__doc__, version=VERSION)
+    files = list(find_files(args['FILES']))
+    jobs = int(args['-j'])
+    total = 0
+    errors = 0
+    bad_files = 0
+    if jobs > 1:
+        # Thousands of small files go to the workers a batch at a time.
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(check_file, files,
+                                    chunksize=max(1, len(files) // (4 * jobs))))
+    else:
+        results = [check_file(f) for f in files]
+    for count, messages in results:
+        total += count
+        errors += len(messages)
+        bad_files += bool(messages)
+        if not args['-q']:
+            for msg in messages:
+                print(msg)
+    print(f'{len(files)} files, {total} exercises, {errors} errors in {bad_files} files')
+    if errors:
+        sys.exit(1)
+
+
+def find_files(paths: list[str]) -> Iterator[str]:
+    "The files named, and the exercise files under the directories named."
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for top, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                if name.endswith(('.exr', corpus.CORPUS_SUFFIX)):
+                    yield os.path.join(top, name)
+
+
+def check_file(fname: str) -> tuple[int, list[str]]:
+    "Return the number of exercises in fname, and a message for each error."
+    try:
+        return check_exercises(fname)
+    except (OSError, UnicodeDecodeError, corpus.CorpusError) as e:
+        return 0, [f'{fname}: {e}']
+
+
+def check_exercises(fname: str) -> tuple[int, list[str]]:
+    messages: list[str] = []
+    errors: list[exercise.ParseError] = []
+    n = 0
+    if fname.endswith(corpus.CORPUS_SUFFIX):
+        c = corpus.Corpus([fname])
+        for n, (dealer, codes, answers) in enumerate(c.auctions(), 1):
+            for msg in exercise_errors(dealer, codes, answers):
+                messages.append(f'{fname}: exercise {n}: {msg}')
+        c.close()
+        return n, messages
+    with open(fname) as f:
+        text = f.read()
+    if QUESTION_RE.search(text):
+        with open(fname) as f:
+            for n, q in enumerate(question.read_questions(f, fname, errors), 1):
+                for msg in question_errors(q):
+                    messages.append(f'{fname}: question {n}: {msg}')
+        return n + len(errors), [str(e) for e in errors] + messages
+    for n, ex in enumerate(exercise.parse_exercises(text, fname, errors), 1):
+        dealer = exercise.DEALERS.index(ex.dealer)
+        answers = bytes(a.code for a in ex.answers)
+        for msg in exercise_errors(dealer, ex.codes, answers):
+            messages.append(f'{fname}: exercise {n}: {msg}')
+    return n + len(errors), [str(e) for e in errors] + messages
+
+
+def exercise_errors(dealer: int, codes: bytes, answers: bytes) -> list[str]:
+    messages = [f'call {pos + 1}: {msg}' for pos, msg in bids.auction_errors(codes, dealer)]
+    marked = [c & ~bids.MARK for c in codes if c & bids.MARK]
+    if len(marked) != len(answers):
+        messages.append(f'{len(marked)} marked calls but {len(answers)} answers')
+    for n, (call, answer) in enumerate(zip(marked, answers), 1):
+        if call != answer:
+            messages.append(f'answer {n} is {bids.NAMES[answer]}, '
+                            f'but the auction has {bids.NAMES[call]}')
+    return messages
+
+
+def question_errors(q: question.Question) -> list[str]:
+    """Each step's auction starts with the answer to the step before, so
+    joining them, and adding the last answer, gives the whole auction."""
+    messages: list[str] = []
+    dealer = exercise.DEALERS.index(q.dealer)
+    codes = bytearray()
+    try:
+        for n, step in enumerate(q.steps, 1):
+            calls = bids.encode_calls(step.auction)
+            if codes:
+                answer = codes[-1]
+                codes.pop()
+                if calls[:1] != bytes([answer & ~bids.MARK]):
+                    messages.append(f'step {n}: the auction does not start '
+                                    f'with the answer {bids.NAMES[answer & ~bids.MARK]}')
+                    calls = bytes([answer]) + calls
+                else:
+                    calls = bytes([answer]) + calls[1:]
+            codes += calls
+            codes.append(bids.encode(step.answer) | bids.MARK)
+    except bids.BidError as e:
+        messages.append(f'step {n}: {e}')
+        return messages
+    for pos, msg in bids.auction_errors(bytes(codes), dealer, padded=False):
+        messages.append(f'call {pos + 1}: {msg}')
+    return messages
+
+
+if __name__ == '__main__':
+    main()